@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from trip_planner import Itinerary, ItineraryCache, ResponseCache, SingleFlight
+
+
+def make_itinerary(name="Paris", country="France", days=2):
+    return Itinerary({"name": name, "country": country, "lat": 48.85, "lng": 2.35}, days, tips=["Pack light"])
+
+
+class TestResponseCache:
+    def test_entries_expire_after_their_ttl(self):
+        cache = ResponseCache(ttls={"short": 0.05})
+        cache.set("short", "k", 1)
+        cache.set("long", "k", 2)
+        assert cache.get("short", "k") == 1
+        time.sleep(0.06)
+        assert cache.get("short", "k") is None
+        assert cache.get("long", "k") == 2
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = ResponseCache(max_size=2)
+        cache.set("ns", "a", 1)
+        cache.set("ns", "b", 2)
+        cache.get("ns", "a")
+        cache.set("ns", "c", 3)
+        assert cache.get("ns", "b") is None
+        assert cache.get("ns", "a") == 1
+        assert cache.get("ns", "c") == 3
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return "result"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("key", fetch)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(flight.do("key", fetch))) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        while flight.coalesced < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join()
+
+        assert calls == [1]
+        assert results == ["result"] * 5
+
+    def test_error_reaches_every_waiter_and_is_not_kept(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            flight.do("key", fail)
+        assert flight.do("key", lambda: "recovered") == "recovered"
+
+
+class TestItineraryCache:
+    def test_destination_spellings_share_an_id(self):
+        assert (ItineraryCache.destination_id({"name": "São Paulo", "country": "Brazil"})
+                == ItineraryCache.destination_id({"name": "sao paulo", "country": "BRAZIL"}))
+
+    def test_invalidate_drops_only_dependent_entries(self):
+        cache = ItineraryCache()
+        cache.put(("paris", 2, 1), make_itinerary(), [("forecast", (1, 1)), ("poi_tile", "u09t")])
+        cache.put(("rome", 2, 1), make_itinerary("Rome", "Italy"), [("forecast", (2, 2)), ("poi_tile", "sr2y")])
+
+        cache.invalidate(("poi_tile", "u09t"))
+
+        assert cache.get(("paris", 2, 1)) is None
+        assert cache.get(("rome", 2, 1)) is not None
+        assert ("forecast", (1, 1)) not in cache._dependents
+
+        cache.invalidate()
+        assert len(cache) == 0 and cache.size == 0
+
+    def test_entries_are_evicted_beyond_max_bytes(self):
+        itinerary = make_itinerary()
+        weight = ItineraryCache._weight(itinerary)
+        cache = ItineraryCache(max_bytes=weight * 3)
+        for i in range(5):
+            cache.put(("k", i), itinerary, [("forecast", i)])
+
+        assert len(cache) == 3
+        assert cache.size <= cache.max_bytes
+        assert cache.get(("k", 0)) is None
+        assert cache.get(("k", 4)) is itinerary
+        # Evicted entries no longer hold dependency links
+        assert ("forecast", 0) not in cache._dependents
+
+    def test_replacing_a_key_keeps_size_consistent(self):
+        cache = ItineraryCache()
+        itinerary = make_itinerary()
+        cache.put("k", itinerary, [("forecast", 1)])
+        cache.put("k", itinerary, [("forecast", 2)])
+        assert cache.size == ItineraryCache._weight(itinerary)
+        cache.invalidate(("forecast", 1))
+        assert cache.get("k") is itinerary
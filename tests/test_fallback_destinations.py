@@ -0,0 +1,40 @@
+import pytest
+
+from trip_planner import EnhancedTripPlanner
+
+
+class EmptyLocationService:
+    def search_destinations(self, query, max_rows=10):
+        return []
+
+
+@pytest.fixture
+def planner():
+    planner = EnhancedTripPlanner.__new__(EnhancedTripPlanner)
+    planner.location_service = EmptyLocationService()
+    planner.combined_search_pipeline = planner.search_pipeline = None
+    planner.enrichment_concurrency = None
+    planner._start_models = lambda: None
+    return planner
+
+
+def test_generic_fallback_keeps_its_order(planner):
+    destinations = planner.search_destinations("somewhere warm")
+    assert [dest["name"] for dest in destinations] == ["Paris", "Rome", "Barcelona"]
+    assert destinations[0] == {
+        "name": "Paris",
+        "country": "France",
+        "lat": 48.8566,
+        "lng": 2.3522,
+        "population": 2140526,
+        "activities": ["Visit Eiffel Tower", "Explore Louvre Museum", "Stroll along Seine River"],
+        "budget_level": "high"
+    }
+
+
+def test_fallback_prefers_matching_cities(planner):
+    assert [dest["name"] for dest in planner.search_destinations("a week in Rome or Tokyo", top_k=5)] == [
+        "Rome", "Tokyo"
+    ]
+    # Cities without built-in activities are never offered
+    assert [dest["name"] for dest in planner.search_destinations("london")] == ["Paris", "Rome", "Barcelona"]
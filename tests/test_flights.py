@@ -0,0 +1,104 @@
+import threading
+import time
+
+import pytest
+
+from trip_planner import FlightService, TripPlanner
+
+
+def flight(departure, arrival, day, duration, hour=8):
+    return {
+        "carrier": "TP",
+        "flight_number": f"{departure}{arrival}{hour}",
+        "departure": {"airport": departure, "terminal": "", "time": f"{day.replace('/', '-')}T{hour:02d}:00"},
+        "arrival": {"airport": arrival, "terminal": "", "time": ""},
+        "duration": duration,
+        "aircraft": ""
+    }
+
+
+class FakeFlightService(FlightService):
+    """Answers every search locally; searches listed in slow block until released"""
+
+    def __init__(self, durations=None, slow=(), **kwargs):
+        super().__init__(app_id="", app_key="", **kwargs)
+        self.durations = durations or {}
+        self.slow = set(slow)
+        self.release = threading.Event()
+        self.searches = []
+        self._lock = threading.Lock()
+
+    def search_airports(self, query):
+        return [{"code": code, "name": code, "city": query} for code in query.split("/")]
+
+    def get_flights(self, departure_airport, arrival_airport, date):
+        with self._lock:
+            self.searches.append((departure_airport, arrival_airport, date))
+        if (departure_airport, arrival_airport) in self.slow:
+            self.release.wait(5)
+        duration = self.durations.get((departure_airport, arrival_airport), 120)
+        return [flight(departure_airport, arrival_airport, date, duration)]
+
+
+@pytest.fixture
+def service():
+    service = FakeFlightService()
+    yield service
+    service.release.set()
+    service.close()
+
+
+def test_unknown_durations_rank_last():
+    flights = [flight("LHR", "CDG", "2025/06/10", duration) for duration in (0, 300, 120)]
+    ranked = sorted(flights, key=FlightService.SORT_KEYS["duration"])
+    assert [f["duration"] for f in ranked] == [120, 300, 0]
+
+
+def test_flexible_window_is_clamped(service):
+    list(service.iter_flight_options(["LHR"], ["CDG"], "2025/06/10", flex_days=30))
+    assert len(service.searches) == 2 * FlightService.MAX_FLEX_DAYS + 1
+
+
+def test_rankings_stream_before_slow_searches_finish():
+    service = FakeFlightService(durations={("LHR", "CDG"): 90, ("LGW", "CDG"): 60}, slow={("LGW", "CDG")})
+    try:
+        results = service.iter_flexible(["LHR", "LGW"], ["CDG"], "2025/06/10", sort_by="duration", limit=5)
+        departure, arrival, day, flights, best = next(results)
+        # The fast search is reported while the slow one is still in flight
+        assert (departure, arrival) == ("LHR", "CDG")
+        assert [f["duration"] for f in best] == [90]
+
+        service.release.set()
+        *_, best = next(results)
+        assert [f["duration"] for f in best] == [60, 90]
+    finally:
+        service.release.set()
+        service.close()
+
+
+def test_ranking_keeps_only_limit_flights(service):
+    best = service.search_flexible(["LHR", "LGW", "STN"], ["CDG", "ORY"], "2025/06/10", flex_days=1,
+                                   sort_by="departure", limit=4)
+    assert len(best) == 4
+    times = [f["departure"]["time"] for f in best]
+    assert times == sorted(times)
+
+
+def planner_with(service):
+    planner = TripPlanner.__new__(TripPlanner)
+    planner.flight_service = service
+    return planner
+
+
+def test_find_flights_notes_a_clamped_window(service):
+    response = planner_with(service).find_flights("LHR", "CDG", "2025/06/10", flexible_days=30, max_airports=3)
+    assert response.startswith(f"Note: flexible searches cover at most +/- {FlightService.MAX_FLEX_DAYS} days.")
+    assert len(service.searches) == 2 * FlightService.MAX_FLEX_DAYS + 1
+
+
+def test_iter_find_flights_streams_progress_then_ranking(service):
+    planner = planner_with(service)
+    parts = list(planner.iter_find_flights("LHR/LGW", "CDG", "2025/06/10", flexible_days=1, max_airports=2))
+    assert parts[0].startswith("Searching flights from LHR/LGW (LHR, LGW) to CDG (CDG)")
+    assert sum(" -> CDG on " in part for part in parts) == 6
+    assert parts[-1] == planner.find_flights("LHR/LGW", "CDG", "2025/06/10", flexible_days=1, max_airports=2)
@@ -0,0 +1,88 @@
+import pytest
+
+from trip_planner import LocalGazetteer, normalize_place_name
+
+
+def dump_line(geoname_id, name, country, population, alternates=(), feature_class="P", feature_code="PPL",
+              admin1=""):
+    cols = [str(geoname_id), name, name, ",".join(alternates), "10.0", "20.0", feature_class, feature_code,
+            country, "", admin1, "", "", "", str(population), "", "", "Europe/Paris", "2024-01-01"]
+    return "\t".join(cols)
+
+
+def build(tmp_path, places):
+    dump = tmp_path / "cities.txt"
+    dump.write_text("\n".join(dump_line(i, *place) for i, place in enumerate(places, 1)) + "\n", encoding="utf-8")
+    country_info = tmp_path / "countryInfo.txt"
+    country_info.write_text("# ISO\tISO3\tISO-Numeric\tfips\tCountry\n"
+                            "FR\tFRA\t250\tFR\tFrance\n"
+                            "US\tUSA\t840\tUS\tUnited States\n", encoding="utf-8")
+    admin1 = tmp_path / "admin1.txt"
+    admin1.write_text("US.TX\tTexas\tTexas\t1\n", encoding="utf-8")
+    return LocalGazetteer.build(str(dump), str(tmp_path / "index"), str(country_info), str(admin1))
+
+
+def names(results):
+    return [(place["name"], place["country"]) for place in results]
+
+
+def test_short_prefix_ranks_every_match_by_population(tmp_path):
+    # Thousands of small places sort before the one large city alphabetically
+    places = [(f"Pa{i:05d}", "FR", 100 + i) for i in range(6000)]
+    places.append(("Pzena", "FR", 5_000_000))
+    gazetteer = build(tmp_path, places)
+
+    assert names(gazetteer.search("p", max_rows=2)) == [("Pzena", "France"), ("Pa05999", "France")]
+
+
+def test_exact_matches_come_first_then_population(tmp_path):
+    gazetteer = build(tmp_path, [
+        ("Parisville", "US", 900_000),
+        ("Paris", "US", 24_000, (), "P", "PPL", "TX"),
+        ("Paris", "FR", 2_100_000, ("Paname", "Lutece")),
+    ])
+    assert names(gazetteer.search("Paris")) == [("Paris", "France"), ("Paris", "United States"),
+                                                ("Parisville", "United States")]
+    assert names(gazetteer.search("paris", country_filter="texas")) == [("Paris", "United States")]
+    assert names(gazetteer.search("lut")) == [("Paris", "France")]
+
+
+def test_place_matched_by_several_names_is_returned_once(tmp_path):
+    gazetteer = build(tmp_path, [("Saint-Malo", "FR", 46_000, ("Saint Malo", "Sant-Maloù", "Saint-Malo"))])
+    assert names(gazetteer.search("saint")) == [("Saint-Malo", "France")]
+
+
+@pytest.mark.parametrize("query", ["s", "sa", "san fr", "san francisco", "san francisco de", "são", "東",
+                                   "zz", "san franciscoz"])
+def test_prefix_search_matches_brute_force(tmp_path, query):
+    places = [
+        ("San Francisco", "US", 870_000),
+        ("San Francisco de Macorís", "US", 190_000),
+        ("San Francisco del Rincón", "US", 120_000),
+        ("San Fernando", "US", 24_000),
+        ("Santa Fe", "US", 87_000),
+        ("São Paulo", "US", 12_000_000),
+        ("Sao Tome", "US", 70_000),
+        ("東京", "US", 14_000_000),
+        ("東広島", "US", 190_000),
+        ("Zurich", "US", 400_000),
+    ]
+    gazetteer = build(tmp_path, places)
+    prefix = normalize_place_name(query)
+    expected = sorted((place for place in places if normalize_place_name(place[0]).startswith(prefix)),
+                      key=lambda place: (normalize_place_name(place[0]) != prefix, -place[2]))
+
+    assert [place["name"] for place in gazetteer.search(query, max_rows=20)] == [place[0] for place in expected]
+
+
+def test_feature_filters(tmp_path):
+    gazetteer = build(tmp_path, [
+        ("Mont Blanc", "FR", 0, (), "T", "MT"),
+        ("Montpellier", "FR", 290_000, (), "P", "PPLA2"),
+        ("Montreuil", "FR", 110_000),
+    ])
+    assert names(gazetteer.search("mont", feature_class="T")) == [("Mont Blanc", "France")]
+    assert names(gazetteer.search("mont", feature_code="PPL")) == [("Montreuil", "France")]
+    assert [place["name"] for place in gazetteer.search("mont", feature_class=None)] == [
+        "Montpellier", "Montreuil", "Mont Blanc"
+    ]
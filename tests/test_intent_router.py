@@ -0,0 +1,86 @@
+import pytest
+
+from trip_planner import CountryTable, IntentRouter
+
+
+@pytest.fixture
+def country_table():
+    table = CountryTable()
+    table.update([
+        {"countryName": "Portugal", "countryCode": "PT", "isoAlpha3": "PRT"},
+        {"countryName": "France", "countryCode": "FR", "isoAlpha3": "FRA"},
+    ])
+    return table
+
+
+class RecordingLookup:
+    """Stands in for LocationService.search_destinations"""
+
+    def __init__(self, known=()):
+        self.known = {name.lower() for name in known}
+        self.queries = []
+
+    def __call__(self, text):
+        self.queries.append(text)
+        return [{"name": text}] if text.lower() in self.known else []
+
+
+class FakeGazetteer:
+    countries = [["PT", "Portugal"]]
+
+    def __init__(self, names):
+        self.names = {name.lower() for name in names}
+
+    def contains_name(self, name):
+        return name in self.names
+
+
+@pytest.mark.parametrize("query", ["Paris, France", "paris,  france", "Paris", "Tokyo, Japan", "Portugal"])
+def test_known_places_route_to_itinerary_without_lookup(country_table, query):
+    lookup = RecordingLookup()
+    router = IntentRouter(country_table=country_table, place_lookup=lookup)
+    route = router.route(query)
+    assert route["intent"] == "itinerary_request"
+    assert route["destination"] == query.strip()
+    assert lookup.queries == []
+
+
+def test_city_outside_fallback_list_uses_place_lookup_without_gazetteer(country_table):
+    lookup = RecordingLookup(known=["Lisbon", "Lisbon, Portugal"])
+    router = IntentRouter(country_table=country_table, place_lookup=lookup)
+    assert router.route("Lisbon")["intent"] == "itinerary_request"
+    assert router.route("Lisbon, Portugal")["destination"] == "Lisbon, Portugal"
+    assert router.route("something vague")["intent"] == "travel_recommendations"
+
+
+def test_gazetteer_answers_city_country_queries_locally(country_table):
+    lookup = RecordingLookup(known=["Atlantis"])
+    router = IntentRouter(gazetteer=FakeGazetteer(["lisbon"]), country_table=country_table, place_lookup=lookup)
+    assert router.is_place("Lisbon, Portugal")
+    assert router.is_place("Lisbon, PT")
+    assert not router.is_place("Lisbon, Narnia")
+    # With a gazetteer, unknown names are not looked up over the network
+    assert not router.is_place("Atlantis")
+    assert lookup.queries == []
+
+
+def test_failing_place_lookup_is_not_a_place():
+    def lookup(text):
+        raise RuntimeError("network down")
+
+    router = IntentRouter(place_lookup=lookup)
+    assert router.route("Lisbon")["intent"] == "travel_recommendations"
+
+
+def test_phrased_queries_keep_their_slots(country_table):
+    router = IntentRouter(country_table=country_table)
+    route = router.route("itinerary for Paris, France for 4 days")
+    assert route["intent"] == "itinerary_request"
+    assert route["destination"] == "Paris, France"
+    assert route["days"] == 4
+
+    flight = router.route("flights from London to Paris on 2025-06-10 +/- 2 days")
+    assert (flight["origin"], flight["destination"], flight["date"], flight["flexible_days"]) == (
+        "London", "Paris", "2025-06-10", 2
+    )
+    assert router.route("weather in Tokyo")["destination"] == "Tokyo"
@@ -0,0 +1,104 @@
+import pytest
+
+from trip_planner import (
+    CountryTable, Itinerary, ItineraryCache, LocationService, ResponseCache, TripPlanner, UpstreamError
+)
+
+
+PARIS = {"name": "Paris", "country": "France", "lat": 48.8566, "lng": 2.3522}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeGeoNamesTransport:
+    def __init__(self, payload=None):
+        self.payload = payload
+
+    def get(self, url, params=None, failure_check=None, **kwargs):
+        if self.payload is None:
+            raise UpstreamError("GeoNames unavailable")
+        return FakeResponse(self.payload)
+
+
+def location_service(payload=None):
+    return LocationService(username="test", transport=FakeGeoNamesTransport(payload), cache=ResponseCache(),
+                           country_table=CountryTable(), refresh_countries=False)
+
+
+class TestLocationServiceLookupStatus:
+    def test_failed_lookups_report_degraded(self):
+        service = location_service()
+        # Both fall back to canned data instead of raising
+        assert service.get_nearby_places(PARIS["lat"], PARIS["lng"]) is not None
+        assert service.get_country_info("France")
+        assert not service.has_nearby_places(PARIS["lat"], PARIS["lng"])
+        assert not service.has_country_info("France")
+
+    def test_successful_lookups_report_real_data(self):
+        service = location_service({"geonames": [{"name": "Paris", "lat": "48.85", "lng": "2.35",
+                                                  "countryName": "France", "continentName": "Europe"}]})
+        service.get_nearby_places(PARIS["lat"], PARIS["lng"])
+        service.get_country_info("France")
+        assert service.has_nearby_places(PARIS["lat"], PARIS["lng"])
+        assert service.has_country_info("France")
+
+    def test_country_table_counts_as_real_data(self):
+        service = location_service()
+        service.countries.update([{"countryName": "France", "countryCode": "FR", "isoAlpha3": "FRA"}])
+        assert service.has_country_info("France")
+
+
+class FakeService:
+    def __init__(self, ok=True):
+        self.ok = ok
+
+    def has_forecast(self, lat, lng):
+        return self.ok
+
+    def grid_cell(self, lat, lng):
+        return (0, 0)
+
+    def has_poi_tiles(self, center_point, radius):
+        return self.ok
+
+    def poi_tiles(self, center_point, radius):
+        return ["u09t"]
+
+    def has_nearby_places(self, lat, lng, radius=10, max_rows=10):
+        return self.ok
+
+    def has_country_info(self, country_name):
+        return self.ok
+
+
+def planner(weather=True, pois=True, location=True):
+    planner = TripPlanner.__new__(TripPlanner)
+    planner.weather_service = FakeService(weather)
+    planner.route_service = FakeService(pois)
+    planner.location_service = FakeService(location)
+    planner.itinerary_cache = ItineraryCache()
+    return planner
+
+
+@pytest.mark.parametrize("kwargs, used_nearby, cached", [
+    ({}, True, True),
+    ({"weather": False}, False, False),
+    ({"pois": False}, False, False),
+    ({"location": False}, True, False),
+    # Country info is always consulted for tips, so its failure matters even with POIs
+    ({"location": False}, False, False),
+])
+def test_itineraries_from_failed_lookups_are_not_cached(kwargs, used_nearby, cached):
+    trip_planner = planner(**kwargs)
+    trip_planner._cache_itinerary("key", Itinerary(dict(PARIS), 3), used_nearby=used_nearby)
+    assert (trip_planner.itinerary_cache.get("key") is not None) == cached
@@ -0,0 +1,132 @@
+import threading
+
+import pytest
+
+from trip_planner import RouteService, geohash_bounds, geohash_cover, haversine_km
+
+
+PARIS = (2.3522, 48.8566)
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakePOITransport:
+    """Answers ORS POI requests with a few POIs inside the requested bbox"""
+
+    def __init__(self, per_tile=3, limit_tiles=()):
+        self.per_tile = per_tile
+        self.limit_tiles = limit_tiles
+        self.posts = []
+        self._lock = threading.Lock()
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        with self._lock:
+            self.posts.append(json)
+        (min_lng, min_lat), (max_lng, max_lat) = json["geometry"]["bbox"]
+        features = []
+        # Tiles in limit_tiles answer with exactly as many POIs as the request allows
+        per_tile = json["limit"] if self.limit_tiles and (min_lng, min_lat) in self.limit_tiles else self.per_tile
+        for i in range(per_tile):
+            lng = min_lng + (max_lng - min_lng) * (i + 1) / (per_tile + 1)
+            lat = min_lat + (max_lat - min_lat) * (i + 1) / (per_tile + 1)
+            features.append({
+                "properties": {"osm_id": f"{lat:.6f},{lng:.6f}", "osm_tags": {"name": f"POI {i}"}},
+                "geometry": {"coordinates": [lng, lat]}
+            })
+        return FakeResponse({"features": features})
+
+
+@pytest.fixture
+def service():
+    transport = FakePOITransport()
+    service = RouteService(api_key="test-key", transport=transport, max_tile_fetches=100)
+    yield service
+    service.close()
+
+
+def test_lookup_fetches_each_tile_once(service):
+    tiles = service.poi_tiles(PARIS, 3000)
+    pois = service.get_places_of_interest(PARIS, radius=3000)
+
+    assert len(service.transport.posts) == len(tiles)
+    assert pois
+    distances = [haversine_km(PARIS[1], PARIS[0], poi["lat"], poi["lng"]) for poi in pois]
+    assert distances == sorted(distances)
+    assert max(distances) <= 3.0
+
+    # A repeat lookup, and a smaller one inside it, are answered from cached tiles
+    assert service.get_places_of_interest(PARIS, radius=3000) == pois
+    service.get_places_of_interest(PARIS, radius=1000)
+    assert len(service.transport.posts) == len(tiles)
+    assert service.has_poi_tiles(PARIS, 3000)
+
+
+def test_tile_request_covers_the_tile_bbox(service):
+    tile = service.poi_tiles(PARIS, 500)[0]
+    service._fetch_poi_tile(tile, ())
+    min_lat, min_lng, max_lat, max_lng = geohash_bounds(tile)
+    assert service.transport.posts[0]["geometry"]["bbox"] == [[min_lng, min_lat], [max_lng, max_lat]]
+
+
+def test_refresh_listeners_hear_about_fetched_tiles(service):
+    refreshed = []
+    service.refresh_listeners.append(refreshed.append)
+    service.get_places_of_interest(PARIS, radius=1000)
+    assert sorted(refreshed) == sorted(service.poi_tiles(PARIS, 1000))
+
+
+def test_categories_are_cached_separately(service):
+    service.get_places_of_interest(PARIS, radius=1000)
+    posts = len(service.transport.posts)
+    service.get_places_of_interest(PARIS, radius=1000, categories=[601])
+    assert len(service.transport.posts) == 2 * posts
+    assert service.transport.posts[-1]["filters"] == {"category_ids": [601]}
+
+
+def test_lookup_caps_tile_fetches_nearest_first():
+    service = RouteService(api_key="test-key", transport=FakePOITransport(), max_tile_fetches=9)
+    try:
+        tiles = service.poi_tiles(PARIS, 10000)
+        assert len(tiles) > 9
+
+        first = service.get_places_of_interest(PARIS, radius=10000)
+        assert len(service.transport.posts) == 9
+        assert not service.has_poi_tiles(PARIS, 10000)
+        # The nearest POIs come from the tiles that were fetched
+        assert haversine_km(PARIS[1], PARIS[0], first[0]["lat"], first[0]["lng"]) < 5
+
+        # Later lookups fetch the remaining tiles until the area is complete
+        for _ in range(len(tiles)):
+            if service.has_poi_tiles(PARIS, 10000):
+                break
+            service.get_places_of_interest(PARIS, radius=10000)
+        assert len(service.transport.posts) == len(tiles)
+    finally:
+        service.close()
+
+
+def test_truncated_tile_is_cached_and_flagged():
+    tile = geohash_cover(PARIS[1], PARIS[0], 0.1, RouteService.POI_TILE_PRECISION)[0]
+    min_lat, min_lng, _, _ = geohash_bounds(tile)
+    service = RouteService(api_key="test-key", transport=FakePOITransport(limit_tiles={(min_lng, min_lat)}))
+    try:
+        entry = service._fetch_poi_tile(tile, ())
+        assert entry["truncated"]
+        assert len(entry["pois"]) == RouteService.POI_TILE_LIMIT
+
+        service.get_places_of_interest(PARIS, radius=100)
+        service.get_places_of_interest(PARIS, radius=100)
+        assert len(service.transport.posts) == 1
+        assert service.has_poi_tiles(PARIS, 100)
+    finally:
+        service.close()
@@ -0,0 +1,82 @@
+import math
+
+import numpy as np
+import pytest
+
+from trip_planner import (
+    EARTH_RADIUS_KM, GeoGridIndex, geohash_cover, geohash_encode, haversine_km_array
+)
+
+
+def random_points(count, seed=7, lat_range=(-90, 90)):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(*lat_range, count), rng.uniform(-180, 180, count)
+
+
+def brute_force(lat, lng, lats, lngs, radius_km):
+    distances = haversine_km_array(lat, lng, lats, lngs)
+    return set(np.flatnonzero(distances <= radius_km).tolist())
+
+
+def destination(lat, lng, bearing_deg, distance_km):
+    """Point distance_km from (lat, lng) along bearing_deg on a sphere"""
+    lat1, lng1, bearing = map(math.radians, (lat, lng, bearing_deg))
+    delta = distance_km / EARTH_RADIUS_KM
+    lat2 = math.asin(math.sin(lat1) * math.cos(delta) + math.cos(lat1) * math.sin(delta) * math.cos(bearing))
+    lng2 = lng1 + math.atan2(math.sin(bearing) * math.sin(delta) * math.cos(lat1),
+                             math.cos(delta) - math.sin(lat1) * math.sin(lat2))
+    return math.degrees(lat2), (math.degrees(lng2) + 540) % 360 - 180
+
+
+@pytest.mark.parametrize("lat, lng, radius_km", [
+    (48.85, 2.35, 50),
+    (0.0, 179.9, 100),      # Antimeridian
+    (-89.9, 10.0, 20),      # Circle over the south pole
+    (89.95, -120.0, 15),    # Circle over the north pole
+    (88.0, 45.0, 300),
+])
+def test_query_radius_matches_brute_force(lat, lng, radius_km):
+    lats, lngs = random_points(20000, lat_range=(lat - 5, lat + 5) if abs(lat) < 80 else (-90, 90))
+    lats = np.clip(lats, -90, 90)
+    # Make sure the neighborhood of the query is populated, including across the pole
+    extra = [destination(lat, lng, bearing, radius_km * 0.9) for bearing in range(0, 360, 10)]
+    lats = np.concatenate([lats, [p[0] for p in extra]])
+    lngs = np.concatenate([lngs, [p[1] for p in extra]])
+    index = GeoGridIndex(lats, lngs)
+
+    found, distances = index.query_radius(lat, lng, radius_km)
+    assert set(found.tolist()) == brute_force(lat, lng, lats, lngs, radius_km)
+    assert list(distances) == sorted(distances)
+
+
+def test_polar_queries_match_brute_force():
+    lats, lngs = random_points(5000, seed=3, lat_range=(-90, -89.5))
+    index = GeoGridIndex(lats, lngs)
+    rng = np.random.default_rng(11)
+    for _ in range(300):
+        lat, lng = rng.uniform(-90, -89.5), rng.uniform(-180, 180)
+        found, _ = index.query_radius(lat, lng, 20)
+        assert set(found.tolist()) == brute_force(lat, lng, lats, lngs, 20)
+
+
+def test_nearest_across_the_pole():
+    # The closest point is on the far side of the pole, 180 degrees of longitude away
+    lats = np.array([-89.95, -89.0])
+    lngs = np.array([-170.0, 10.0])
+    index = GeoGridIndex(lats, lngs)
+    idx, _ = index.nearest(-89.95, 10.0, k=1)
+    assert idx.tolist() == [0]
+
+
+@pytest.mark.parametrize("lat, lng, radius_km, precision", [
+    (48.85, 2.35, 10, 5),
+    (0.0, 179.99, 10, 5),
+    (-89.95, 30.0, 20, 3),
+    (89.9, -60.0, 20, 3),
+])
+def test_geohash_cover_contains_every_point_of_the_circle(lat, lng, radius_km, precision):
+    cover = set(geohash_cover(lat, lng, radius_km, precision))
+    for bearing in range(0, 360, 5):
+        for fraction in (0.25, 0.5, 0.99):
+            point = destination(lat, lng, bearing, radius_km * fraction)
+            assert geohash_encode(point[0], point[1], precision) in cover
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from trip_planner import CircuitBreaker, CircuitOpenError, HTTPTransport, UpstreamError
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None):
+        self.status_code = status_code
+        self.payload = payload or {}
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Stands in for requests.Session, replaying queued outcomes"""
+
+    def __init__(self):
+        self.outcomes = []
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else FakeResponse()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def transport():
+    transport = HTTPTransport(failure_threshold=2, reset_timeout=0.05, negative_ttl=0.01)
+    transport.session = FakeSession()
+    return transport
+
+
+class TestCircuitBreaker:
+    def test_opens_after_threshold_and_probes_once(self):
+        breaker = CircuitBreaker("host", failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow_request()
+
+        time.sleep(0.06)
+        assert breaker.allow_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        # Only one probe at a time
+        assert not breaker.allow_request()
+
+    def test_probe_outcome_closes_or_reopens(self):
+        breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+        assert breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+        time.sleep(0.02)
+        assert breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.failures == 0
+
+
+class TestHTTPTransport:
+    def test_open_circuit_refuses_without_network(self, transport):
+        transport.session.outcomes = [FakeResponse(503), FakeResponse(503)]
+        for i in range(2):
+            transport.get("http://api.example.com/x", params={"i": i})
+
+        calls = transport.session.calls
+        with pytest.raises(CircuitOpenError):
+            transport.get("http://api.example.com/x", params={"i": 2})
+        assert transport.session.calls == calls
+        assert transport.breaker_states() == {"api.example.com": CircuitBreaker.OPEN}
+
+    def test_failed_request_is_negatively_cached(self, transport):
+        transport.session.outcomes = [ConnectionError("down")]
+        with pytest.raises(ConnectionError):
+            transport.get("http://api.example.com/x")
+        with pytest.raises(CircuitOpenError):
+            transport.get("http://api.example.com/x")
+        time.sleep(0.02)
+        assert transport.get("http://api.example.com/x").status_code == 200
+
+    def test_failure_check_error_raises_upstream_error(self, transport):
+        transport.session.outcomes = [FakeResponse(payload={"status": {"message": "over quota"}})]
+        check = lambda response: response.json().get("status", {}).get("message")
+        with pytest.raises(UpstreamError):
+            transport.get("http://api.example.com/x", failure_check=check)
+        assert transport.breaker("http://api.example.com/x").failures == 1
+
+    def test_raising_failure_check_releases_half_open_probe(self, transport):
+        check = lambda response: response.json()["status"].get("message")
+        transport.session.outcomes = [FakeResponse(payload={"status": "not a dict"})] * 3
+        for i in range(3):
+            with pytest.raises((UpstreamError, CircuitOpenError)):
+                transport.get("http://api.example.com/x", failure_check=check, params={"i": i})
+
+        time.sleep(0.06)
+        transport.session.outcomes = [FakeResponse(payload={"status": "not a dict"})]
+        with pytest.raises(UpstreamError):
+            transport.get("http://api.example.com/x", failure_check=check, params={"i": "probe"})
+        assert transport.breaker_states()["api.example.com"] == CircuitBreaker.OPEN
+
+        time.sleep(0.06)
+        transport.session.outcomes = [FakeResponse(payload={"status": {}})]
+        transport.get("http://api.example.com/x", failure_check=check, params={"i": "recovered"})
+        assert transport.breaker_states()["api.example.com"] == CircuitBreaker.CLOSED
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from trip_planner import InMemoryHistoryBackend, WriteBehindQueue
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+
+@pytest.fixture
+def backend():
+    return InMemoryHistoryBackend()
+
+
+def test_single_put_is_written_after_flush_interval(backend):
+    queue = WriteBehindQueue(backend, max_batch=100, flush_interval=0.2)
+    try:
+        # Let the worker go idle on an empty buffer first
+        time.sleep(0.1)
+        started = time.monotonic()
+        assert queue.put({"query": "paris"})
+        assert wait_until(lambda: backend.rows(), timeout=1.0)
+        assert time.monotonic() - started < 0.6
+        assert backend.rows() == [{"query": "paris"}]
+    finally:
+        queue.close()
+
+
+def test_full_batch_is_written_without_waiting(backend):
+    queue = WriteBehindQueue(backend, max_batch=10, flush_interval=60)
+    try:
+        queue.put_many({"i": i} for i in range(25))
+        assert wait_until(lambda: len(backend.rows()) == 20)
+        assert backend.inserts == 2
+    finally:
+        queue.close()
+    assert len(backend.rows()) == 25
+
+
+def test_flush_writes_pending_records(backend):
+    queue = WriteBehindQueue(backend, flush_interval=60)
+    try:
+        queue.put({"i": 1})
+        assert queue.flush(timeout=1.0)
+        assert backend.rows() == [{"i": 1}]
+    finally:
+        queue.close()
+
+
+def test_close_drains_and_rejects_later_records(backend):
+    queue = WriteBehindQueue(backend, flush_interval=60)
+    queue.put_many({"i": i} for i in range(5))
+    queue.close()
+    assert len(backend.rows()) == 5
+    assert not queue.put({"i": 5})
+    assert queue.stats()["dropped"] == 1
+
+
+def test_full_buffer_drops_after_put_timeout():
+    release = threading.Event()
+
+    class BlockedBackend(InMemoryHistoryBackend):
+        def insert_many(self, table, rows):
+            release.wait()
+            return super().insert_many(table, rows)
+
+    backend = BlockedBackend()
+    queue = WriteBehindQueue(backend, max_batch=2, flush_interval=0.01, max_pending=2, put_timeout=0.05)
+    try:
+        accepted = queue.put_many({"i": i} for i in range(10))
+        assert accepted < 10
+        assert queue.stats()["dropped"] == 10 - accepted
+    finally:
+        release.set()
+        queue.close()
+    assert len(backend.rows()) == accepted
+
+
+def test_failed_batch_is_retried(backend):
+    failures = [1]
+
+    class FlakyBackend(InMemoryHistoryBackend):
+        def insert_many(self, table, rows):
+            if failures[0]:
+                failures[0] -= 1
+                raise RuntimeError("upstream unavailable")
+            return super().insert_many(table, rows)
+
+    flaky = FlakyBackend()
+    queue = WriteBehindQueue(flaky, flush_interval=0.01, retry_backoff=0.01)
+    try:
+        queue.put({"i": 1})
+        assert queue.flush(timeout=1.0)
+        assert flaky.rows() == [{"i": 1}]
+        assert queue.stats()["dropped"] == 0
+    finally:
+        queue.close()
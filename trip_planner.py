@@ -10,6 +10,17 @@ OPENROUTE_API_KEY = os.getenv("OPENROUTE_API_KEY", "")
 FLIGHTSTATS_APP_ID = os.getenv("FLIGHTSTATS_APP_ID", "")
 FLIGHTSTATS_APP_KEY = os.getenv("FLIGHTSTATS_APP_KEY", "")
 WEATHER_API_KEY = os.getenv("WEATHER_API_KEY", "")
+DESTINATION_SNAPSHOT_PATH = os.getenv("DESTINATION_SNAPSHOT_PATH", "")  # Prebuilt corpus; empty disables
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "trip_planner", "embeddings.npz")
+)
+GEONAMES_GAZETTEER_PATH = os.getenv("GEONAMES_GAZETTEER_PATH", "")  # LocalGazetteer index directory; empty disables
+AIRPORTS_PATH = os.getenv("AIRPORTS_PATH", "")  # OurAirports airports.csv for offline airport lookups; empty disables
+COUNTRY_TABLE_PATH = os.getenv(
+    "COUNTRY_TABLE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "trip_planner", "countries.json")
+)
 
 
 
@@ -27,14 +38,32 @@ from haystack.schema import Document
 from haystack import Pipeline
 from haystack.pipelines import ExtractiveQAPipeline
 import os
+import atexit
 import json
 import time
+import bisect
+import csv
+import sys
+import hashlib
+import heapq
+import unicodedata
+import zipfile
+import asyncio
+import numpy as np
 import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import logging
 from typing import List, Dict, Optional
 import re
+import math
 import random
+from collections import OrderedDict, defaultdict, deque
+from itertools import islice, product
 from datetime import datetime, timedelta
 
 # Configure logging
@@ -49,10 +78,453 @@ except ImportError:
     has_reader = False
 
 
+class UpstreamError(requests.RequestException):
+    """An upstream service answered, but with an error or over-quota response"""
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of calling an upstream that is known to be failing"""
+
+
+class CircuitBreaker:
+    """Failure tracker for one upstream host
+    
+    Closed: requests flow normally. After failure_threshold consecutive failures the
+    circuit opens and requests are refused immediately. Once reset_timeout has passed
+    a single probe is let through (half-open); its outcome closes or reopens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a request may be sent now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit for {self.name} half-open, probing upstream")
+                return True
+            # Open, or half-open with the probe still in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed, upstream recovered")
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class HTTPTransport:
+    """Shared HTTP transport with keep-alive connection pools, timeouts, retries and circuit breakers"""
+
+    def __init__(self, pool_connections=10, pool_maxsize=20, connect_timeout=3.05, read_timeout=10,
+                 max_retries=2, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                 user_agent="trip-planner/1.0", failure_threshold=5, reset_timeout=30, negative_ttl=15):
+        """
+        Create a transport backed by a single requests.Session
+
+        Args:
+            pool_connections (int): Number of per-host connection pools to keep
+            pool_maxsize (int): Maximum number of keep-alive connections per host
+            connect_timeout (float): Seconds to wait for a TCP/TLS connection
+            read_timeout (float): Seconds to wait for the server to send data
+            max_retries (int): Retries for connection errors and retryable statuses
+            backoff_factor (float): Exponential backoff factor between retries
+            status_forcelist (tuple): HTTP statuses that trigger a retry
+            user_agent (str): User-Agent header sent with every request
+            failure_threshold (int): Consecutive failures that open a host's circuit
+            reset_timeout (float): Seconds an open circuit waits before letting a probe through
+            negative_ttl (float): Seconds a failed request is answered from the negative cache
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.negative_ttl = negative_ttl
+        self.negative_cache = ResponseCache(max_size=4096, default_ttl=negative_ttl)
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": user_agent})
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=status_forcelist,
+            allowed_methods=frozenset(["GET", "POST"]),  # All upstream calls are read-only lookups
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def breaker(self, url):
+        """Return the circuit breaker of the host serving url"""
+        host = urlsplit(url).netloc
+        with self._breakers_lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, self.failure_threshold, self.reset_timeout)
+            return self._breakers[host]
+
+    def breaker_states(self):
+        """Return the circuit state of every upstream host seen so far"""
+        with self._breakers_lock:
+            return {host: breaker.state for host, breaker in self._breakers.items()}
+
+    @staticmethod
+    def _request_key(method, url, kwargs):
+        return (
+            method,
+            url,
+            json.dumps(kwargs.get("params"), sort_keys=True, default=str),
+            json.dumps(kwargs.get("json"), sort_keys=True, default=str)
+        )
+
+    def request(self, method, url, failure_check=None, **kwargs):
+        """
+        Send a request through the pooled session, applying the default timeouts
+        
+        Raises CircuitOpenError without touching the network when the host's circuit
+        is open or the same request failed within negative_ttl seconds.
+        
+        Args:
+            failure_check (callable): Optional check(response) returning an error message for
+                responses that succeeded at the HTTP level but carry an upstream error
+                (e.g. an over-quota payload); such responses raise UpstreamError
+        """
+        key = self._request_key(method, url, kwargs)
+        if self.negative_cache.get("failed", key, _MISSING) is not _MISSING:
+            raise CircuitOpenError(f"{method} {url} failed less than {self.negative_ttl}s ago")
+        
+        breaker = self.breaker(url)
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Circuit for {breaker.name} is open")
+        
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            breaker.record_failure()
+            self.negative_cache.set("failed", key, True)
+            raise
+        
+        error = None
+        if response.status_code < 400 and failure_check:
+            try:
+                error = failure_check(response)
+            except Exception as e:
+                # A payload the check can't parse is a failure too, so a half-open probe always settles
+                error = f"Malformed response from {breaker.name}: {e}"
+
+        if error or response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure()
+            self.negative_cache.set("failed", key, True)
+        else:
+            breaker.record_success()
+        
+        if error:
+            raise UpstreamError(error)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+
+_default_transport = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport():
+    """Return the process-wide transport shared by services that are not given one"""
+    global _default_transport
+    with _default_transport_lock:
+        if _default_transport is None:
+            _default_transport = HTTPTransport()
+        return _default_transport
+
+
+# Sentinel distinguishing "not cached" from a cached None
+_MISSING = object()
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-namespace TTLs and hit/miss counters"""
+
+    def __init__(self, max_size=1024, ttls=None, default_ttl=3600):
+        """
+        Args:
+            max_size (int): Maximum number of entries across all namespaces
+            ttls (dict): Seconds an entry stays fresh, keyed by namespace
+            default_ttl (int): TTL for namespaces missing from ttls
+        """
+        self.max_size = max_size
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    def get(self, namespace, key, default=None):
+        """Return the fresh value stored for key, or default on a miss"""
+        entry_key = (namespace, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(entry_key)
+                    self.hits[namespace] += 1
+                    return value
+                del self._entries[entry_key]
+            self.misses[namespace] += 1
+            return default
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store value for key, evicting least recently used entries beyond max_size"""
+        if ttl is None:
+            ttl = self.ttls.get(namespace, self.default_ttl)
+        entry_key = (namespace, key)
+        with self._lock:
+            self._entries[entry_key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace=None):
+        """Drop every entry, or only those of one namespace"""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                for entry_key in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[entry_key]
+
+    def stats(self):
+        """Return hit/miss counters overall and per namespace"""
+        with self._lock:
+            namespaces = set(self.hits) | set(self.misses)
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": sum(self.hits.values()),
+                "misses": sum(self.misses.values()),
+                "namespaces": {
+                    ns: {"hits": self.hits[ns], "misses": self.misses[ns]} for ns in sorted(namespaces)
+                }
+            }
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one execution shared by all callers"""
+
+    class _Call:
+        __slots__ = ("done", "result", "error")
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """Run func() unless a call with the same key is in flight, in which case wait for its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class BackgroundModel:
+    """Handle to a model that is built in a background thread so startup doesn't wait for it"""
+
+    def __init__(self, name, factory, start=True):
+        """
+        Args:
+            name (str): Name used in log messages
+            factory (callable): Builds and returns the model, or None if it is unavailable
+            start (bool): Start loading immediately instead of on first use
+        """
+        self.name = name
+        self.error = None
+        self._factory = factory
+        self._model = None
+        self._thread = None
+        self._callbacks = []
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        if start:
+            self.start()
+
+    def start(self):
+        """Begin loading in a daemon thread; calling it again has no effect"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _load(self):
+        started = time.time()
+        try:
+            self._model = self._factory()
+            if self._model is not None:
+                logger.info(f"{self.name} ready after {time.time() - started:.1f}s")
+        except Exception as e:
+            self.error = e
+            logger.error(f"{self.name} could not be initialized due to: {e}")
+        
+        with self._lock:
+            self._loaded.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            self._notify(callback)
+
+    def _notify(self, callback):
+        if self._model is None:
+            return
+        try:
+            callback(self._model)
+        except Exception as e:
+            logger.error(f"Error activating {self.name}: {e}")
+
+    def on_ready(self, callback):
+        """Call callback(model) once the model has loaded, right away if it already has"""
+        with self._lock:
+            if not self._loaded.is_set():
+                self._callbacks.append(callback)
+                return
+        self._notify(callback)
+
+    @property
+    def ready(self):
+        return self._loaded.is_set() and self._model is not None
+
+    def get(self, wait=False, timeout=None):
+        """Return the model, or None while it is still loading (or if it failed to load)"""
+        self.start()
+        if wait:
+            self._loaded.wait(timeout)
+        return self._model
+
+
+class EmbeddingCache:
+    """Persistent store of document embeddings keyed by embedding model and content hash"""
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): .npz file the cache is loaded from and saved to; None keeps it in memory only
+        """
+        self.path = path
+        self._vectors = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+
+    @staticmethod
+    def key(model_id, content):
+        return hashlib.sha256(f"{model_id}\0{content}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                self._vectors = {key: data[key] for key in data.files}
+            logger.info(f"Loaded {len(self._vectors)} cached embeddings from {self.path}")
+        except Exception as e:
+            logger.warning(f"Could not read embedding cache {self.path}: {e}")
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def get(self, key):
+        return self._vectors.get(key)
+
+    def set(self, key, vector):
+        with self._lock:
+            self._vectors[key] = np.asarray(vector, dtype="float32")
+            self._dirty = True
+
+    def save(self):
+        """Write the cache to disk if it changed since it was loaded"""
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, **self._vectors)
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+            except Exception as e:
+                logger.warning(f"Could not write embedding cache {self.path}: {e}")
+
 
 # Initialize document store
 document_store = InMemoryDocumentStore(use_bm25=True)
 
+# Bump when the layout of destination snapshot files changes
+SNAPSHOT_FORMAT_VERSION = 1
+
 
 
 
@@ -102,12 +574,1127 @@ class SupabaseService:
             'timestamp': datetime.now().isoformat()
         }).execute()
 
+class SupabaseHistoryBackend:
+    """Writes query history rows to a Supabase table in bulk inserts"""
+    
+    def __init__(self, client):
+        self.client = client
+        
+    def insert_many(self, table, rows):
+        result = self.client.table(table).insert(rows).execute()
+        if not result.data:
+            raise RuntimeError(f"Supabase insert into {table} returned no rows")
+        return result
+
+class InMemoryHistoryBackend:
+    """Local stand-in for SupabaseHistoryBackend that keeps inserted rows in memory"""
+    
+    def __init__(self):
+        self.tables = defaultdict(list)
+        self.inserts = 0
+        self._lock = threading.Lock()
+        
+    def insert_many(self, table, rows):
+        with self._lock:
+            self.tables[table].extend(rows)
+            self.inserts += 1
+        return rows
+        
+    def rows(self, table='query_history'):
+        with self._lock:
+            return list(self.tables[table])
+
+class WriteBehindQueue:
+    """Bounded buffer that a background worker drains into a backend in bulk inserts.
+    
+    put() returns as soon as the record is buffered. The worker writes a batch once
+    max_batch records are waiting or the oldest has waited flush_interval seconds.
+    When max_pending records are buffered, put() blocks for up to put_timeout seconds
+    and then drops the record. close() (also registered with atexit) drains the buffer.
+    """
+    
+    def __init__(self, backend, table='query_history', max_batch=100, flush_interval=2.0,
+                 max_pending=10000, put_timeout=1.0, max_retries=3, retry_backoff=0.5):
+        self.backend = backend
+        self.table = table
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._buffer = deque()
+        self._oldest = None
+        self._in_flight = 0
+        self._flush_waiters = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name=f"write-behind-{table}", daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+        
+    def put(self, record, timeout=None):
+        """Buffer a record for writing.
+        
+        Args:
+            record: Row to insert
+            timeout: Seconds to wait for space when the buffer is full (defaults to put_timeout)
+            
+        Returns:
+            True if the record was buffered, False if it was dropped
+        """
+        timeout = self.put_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._buffer) >= self.max_pending and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.dropped += 1
+                    logger.warning(f"Write-behind queue for {self.table} is full; dropping record")
+                    return False
+                self._cond.wait(remaining)
+            if self._closed:
+                self.dropped += 1
+                logger.warning(f"Write-behind queue for {self.table} is closed; dropping record")
+                return False
+            was_empty = not self._buffer
+            if was_empty:
+                self._oldest = time.monotonic()
+            self._buffer.append(record)
+            # An idle worker waits without a timeout, so wake it to start the flush_interval clock
+            if was_empty or len(self._buffer) >= self.max_batch:
+                self._cond.notify_all()
+        return True
+        
+    def put_many(self, records, timeout=None):
+        """Buffer several records; returns how many were accepted"""
+        return sum(1 for record in records if self.put(record, timeout))
+        
+    def flush(self, timeout=None):
+        """Write everything buffered so far; returns False if timeout elapsed first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_waiters += 1
+            self._cond.notify_all()
+            try:
+                while self._buffer or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flush_waiters -= 1
+                
+    def close(self, timeout=10.0):
+        """Stop accepting records, drain the buffer and stop the worker"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            logger.warning(f"Write-behind queue for {self.table} did not drain within {timeout}s")
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
+            
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': len(self._buffer) + self._in_flight,
+                'written': self.written,
+                'dropped': self.dropped,
+                'batches': self.batches
+            }
+            
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if self._buffer:
+                    waited = time.monotonic() - self._oldest
+                    if (len(self._buffer) >= self.max_batch or waited >= self.flush_interval
+                            or self._flush_waiters or self._closed):
+                        break
+                    self._cond.wait(self.flush_interval - waited)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+            batch = [self._buffer.popleft() for _ in range(min(self.max_batch, len(self._buffer)))]
+            self._oldest = time.monotonic() if self._buffer else None
+            self._in_flight = len(batch)
+            # Wake producers waiting for space
+            self._cond.notify_all()
+            return batch
+            
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            written = self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                if written:
+                    self.written += len(batch)
+                    self.batches += 1
+                else:
+                    self.dropped += len(batch)
+                self._cond.notify_all()
+                
+    def _write(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.backend.insert_many(self.table, batch)
+                return True
+            except Exception as e:
+                logger.warning(f"Bulk insert of {len(batch)} rows into {self.table} failed "
+                               f"(attempt {attempt + 1}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(self.retry_backoff * (2 ** attempt))
+        logger.error(f"Dropping {len(batch)} rows for {self.table} after {self.max_retries + 1} attempts")
+        return False
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometers"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+# Built-in data for popular destinations, used when upstream services are unavailable.
+# "nearby" feeds get_nearby_places; "activities" and "budget_level" feed the
+# EnhancedTripPlanner fallback recommendations.
+FALLBACK_CITIES = {
+    "hong kong": {
+        "name": "Hong Kong",
+        "country": "China",
+        "country_code": "HK",
+        "population": 7482500,
+        "lat": 22.3193,
+        "lng": 114.1694
+    },
+    "paris": {
+        "name": "Paris",
+        "country": "France",
+        "country_code": "FR",
+        "population": 2140526,
+        "lat": 48.8566,
+        "lng": 2.3522,
+        "nearby": [
+            {"name": "Eiffel Tower", "lat": 48.8584, "lng": 2.2945, "type": "Tourist Attraction"},
+            {"name": "Louvre Museum", "lat": 48.8606, "lng": 2.3376, "type": "Museum"},
+            {"name": "Notre-Dame Cathedral", "lat": 48.8530, "lng": 2.3499, "type": "Religious Site"}
+        ],
+        "activities": ["Visit Eiffel Tower", "Explore Louvre Museum", "Stroll along Seine River"],
+        "budget_level": "high"
+    },
+    "new york": {
+        "name": "New York",
+        "country": "United States",
+        "country_code": "US",
+        "population": 8804190,
+        "lat": 40.7128,
+        "lng": -74.0060,
+        "nearby": [
+            {"name": "Statue of Liberty", "lat": 40.6892, "lng": -74.0445, "type": "Monument"},
+            {"name": "Central Park", "lat": 40.7851, "lng": -73.9683, "type": "Park"},
+            {"name": "Times Square", "lat": 40.7580, "lng": -73.9855, "type": "Square"}
+        ],
+        "activities": ["Visit Times Square", "Explore Central Park", "See Statue of Liberty"],
+        "budget_level": "high"
+    },
+    "tokyo": {
+        "name": "Tokyo",
+        "country": "Japan",
+        "country_code": "JP",
+        "population": 13960000,
+        "lat": 35.6762,
+        "lng": 139.6503,
+        "activities": ["Visit Tokyo Skytree", "Explore Senso-ji Temple", "Experience Shibuya Crossing"],
+        "budget_level": "high"
+    },
+    "london": {
+        "name": "London",
+        "country": "United Kingdom",
+        "country_code": "GB",
+        "population": 8982000,
+        "lat": 51.5074,
+        "lng": -0.1278
+    },
+    "rome": {
+        "name": "Rome",
+        "country": "Italy",
+        "country_code": "IT",
+        "population": 2873000,
+        "lat": 41.9028,
+        "lng": 12.4964,
+        "activities": ["Visit Colosseum", "Explore Vatican Museums", "Throw a coin in Trevi Fountain"],
+        "budget_level": "medium"
+    },
+    "barcelona": {
+        "name": "Barcelona",
+        "country": "Spain",
+        "country_code": "ES",
+        "population": 1620343,
+        "lat": 41.3851,
+        "lng": 2.1734,
+        "activities": ["Visit Sagrada Familia", "Explore Park Güell", "Stroll along La Rambla"],
+        "budget_level": "medium"
+    },
+    "sydney": {
+        "name": "Sydney",
+        "country": "Australia",
+        "country_code": "AU",
+        "population": 5312000,
+        "lat": -33.8688,
+        "lng": 151.2093
+    },
+    "bangkok": {
+        "name": "Bangkok",
+        "country": "Thailand",
+        "country_code": "TH",
+        "population": 8281000,
+        "lat": 13.7563,
+        "lng": 100.5018
+    }
+}
+
+
+class FallbackGazetteer:
+    """Coordinate-indexed, in-memory lookup over the built-in fallback cities"""
+
+    # Fields returned by search(), matching the destination dicts of the GeoNames path
+    PLACE_FIELDS = ("name", "country", "country_code", "population", "lat", "lng")
+
+    def __init__(self, cities, cell_size=1.0):
+        """
+        Args:
+            cities (dict): City records keyed by lowercase name
+            cell_size (float): Grid cell size in degrees for the coordinate index
+        """
+        self.cities = cities
+        self.cell_size = cell_size
+        self._grid = defaultdict(list)
+        for key, city in cities.items():
+            self._grid[self._cell(city["lat"], city["lng"])].append(key)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def place(self, key):
+        """Return the destination dict for a city key"""
+        city = self.cities[key]
+        return {field: city[field] for field in self.PLACE_FIELDS}
+
+    def nearest(self, lat, lng, max_degrees=1.0):
+        """Return the key of the closest city within max_degrees of lat and lng, or None"""
+        lat, lng = float(lat), float(lng)
+        reach = math.ceil(max_degrees / self.cell_size)
+        cell_lat, cell_lng = self._cell(lat, lng)
+        
+        best_key, best_distance = None, None
+        for d_lat in range(-reach, reach + 1):
+            for d_lng in range(-reach, reach + 1):
+                for key in self._grid.get((cell_lat + d_lat, cell_lng + d_lng), ()):
+                    city = self.cities[key]
+                    if abs(city["lat"] - lat) >= max_degrees or abs(city["lng"] - lng) >= max_degrees:
+                        continue
+                    distance = haversine_km(lat, lng, city["lat"], city["lng"])
+                    if best_distance is None or distance < best_distance:
+                        best_key, best_distance = key, distance
+        return best_key
+
+    def nearby_places(self, lat, lng):
+        """Return the built-in attractions of the city around lat/lng, if any"""
+        key = self.nearest(lat, lng)
+        if key is None:
+            return []
+        return [dict(place) for place in self.cities[key].get("nearby", [])]
+
+    def search(self, query, max_rows):
+        """Find cities by name: exact key, then partial key/word matches, then name substrings"""
+        query_lower = query.lower()
+        
+        # Exact match first
+        if query_lower in self.cities:
+            return [self.place(query_lower)]
+        
+        # Partial matches - only if no exact match
+        results = []
+        for key in self.cities:
+            # Check if query is part of the key or if any word in query is in key
+            if query_lower in key or any(word in key for word in query_lower.split()):
+                results.append(self.place(key))
+                if len(results) >= max_rows:
+                    return results
+        
+        # If we still have no results, check if any city name contains the query
+        if not results:
+            for key, city in self.cities.items():
+                if query_lower in city["name"].lower():
+                    results.append(self.place(key))
+                    if len(results) >= max_rows:
+                        break
+        return results
+
+    def match(self, query):
+        """Return keys of cities whose key equals, contains or is contained in the query"""
+        query_lower = query.lower()
+        return [key for key in self.cities if query_lower == key or query_lower in key or key in query_lower]
+
+
+FALLBACK_GAZETTEER = FallbackGazetteer(FALLBACK_CITIES)
+
+# FALLBACK_CITIES keys offered, in this order, when destination search finds nothing
+FALLBACK_RECOMMENDATIONS = ["paris", "rome", "barcelona", "tokyo", "new york"]
+
+
+# Bump when the on-disk layout of LocalGazetteer indexes changes
+GAZETTEER_FORMAT_VERSION = 2
+
+
+def normalize_place_name(name):
+    """Casefold a place name and strip accents, so 'São Paulo' and 'sao  paulo' compare equal"""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+
+class PackedStrings:
+    """Read-only sequence of strings stored as one UTF-8 byte array plus an offsets array"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @staticmethod
+    def pack(strings):
+        """Return (blob, offsets) arrays for a list of strings"""
+        encoded = [string.encode("utf-8") for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return blob, offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    @staticmethod
+    def head(data, fill=0):
+        """First 8 bytes of data as a big-endian integer, padded with fill bytes"""
+        return int.from_bytes(data[:8].ljust(8, bytes([fill])), "big")
+
+    def heads(self):
+        """uint64 array of head() for every string
+        
+        UTF-8 byte order matches code point order, so the heads of a sorted sequence
+        are sorted too and can be searched with np.searchsorted.
+        """
+        starts, lengths = self.offsets[:-1], np.diff(self.offsets)
+        heads = np.zeros(len(self), dtype=np.uint64)
+        for i in range(8):
+            present = lengths > i
+            byte = np.zeros(len(self), dtype=np.uint64)
+            byte[present] = self.blob[starts[present] + i]
+            heads = (heads << np.uint64(8)) | byte
+        return heads
+
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km_array(lat, lng, lats, lngs):
+    """Vectorized great-circle distance in kilometers from one point to arrays of points"""
+    lat, lng = math.radians(lat), math.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GeoGridIndex:
+    """Spatial index over lat/lng arrays for radius and k-nearest queries
+    
+    Points are bucketed into a regular lat/lng grid and sorted by cell id, so the
+    cells covering a query circle map to a few contiguous slices. Candidates from
+    those slices are refined with a vectorized haversine distance.
+    """
+
+    def __init__(self, lat, lng, cell_degrees=0.5):
+        """
+        Args:
+            lat (array): Latitudes in degrees
+            lng (array): Longitudes in degrees
+            cell_degrees (float): Grid cell size in degrees
+        """
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.cell_degrees = cell_degrees
+        self._lat_cells = int(math.ceil(180 / cell_degrees))
+        self._lng_cells = int(math.ceil(360 / cell_degrees))
+        
+        cells = self._cell_row(self.lat) * self._lng_cells + self._cell_col(self.lng)
+        self._order = np.argsort(cells, kind="stable")
+        self._sorted_cells = cells[self._order]
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _cell_row(self, lat):
+        rows = np.floor((np.asarray(lat, dtype=np.float64) + 90) / self.cell_degrees).astype(np.int64)
+        return np.clip(rows, 0, self._lat_cells - 1)
+
+    def _cell_col(self, lng):
+        cols = np.floor(np.mod(np.asarray(lng, dtype=np.float64) + 180, 360) / self.cell_degrees).astype(np.int64)
+        return np.clip(cols, 0, self._lng_cells - 1)
+
+    def _candidates(self, lat, lng, radius_km):
+        """Indices of points in grid cells overlapping the bounding box of the query circle"""
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        first_row = int(self._cell_row(max(-90.0, lat - lat_span)))
+        last_row = int(self._cell_row(min(90.0, lat + lat_span)))
+        
+        # Longitude span widens toward the poles; a circle reaching a pole covers every longitude
+        reaches_pole = abs(lat) + lat_span >= 90
+        max_abs_lat = min(89.9, abs(lat) + lat_span)
+        lng_span = radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat)))
+        if reaches_pole or lng_span >= 180:
+            col_ranges = [(0, self._lng_cells - 1)]
+        else:
+            first_col = int(self._cell_col(lng - lng_span))
+            last_col = int(self._cell_col(lng + lng_span))
+            if first_col <= last_col:
+                col_ranges = [(first_col, last_col)]
+            else:  # The box wraps around the antimeridian
+                col_ranges = [(first_col, self._lng_cells - 1), (0, last_col)]
+        
+        slices = []
+        for row in range(first_row, last_row + 1):
+            for first_col, last_col in col_ranges:
+                start = np.searchsorted(self._sorted_cells, row * self._lng_cells + first_col, side="left")
+                end = np.searchsorted(self._sorted_cells, row * self._lng_cells + last_col, side="right")
+                if end > start:
+                    slices.append(self._order[start:end])
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def query_radius(self, lat, lng, radius_km, mask=None):
+        """
+        Find points within radius_km of (lat, lng)
+        
+        Args:
+            mask (array): Optional boolean array; points where it is False are skipped
+            
+        Returns:
+            tuple: (indices, distances_km), closest first
+        """
+        idx = self._candidates(float(lat), float(lng), radius_km)
+        if mask is not None and len(idx):
+            idx = idx[mask[idx]]
+        distances = haversine_km_array(float(lat), float(lng), self.lat[idx], self.lng[idx])
+        within = distances <= radius_km
+        idx, distances = idx[within], distances[within]
+        order = np.argsort(distances, kind="stable")
+        return idx[order], distances[order]
+
+    def nearest(self, lat, lng, k=1, mask=None, max_radius_km=math.pi * EARTH_RADIUS_KM):
+        """Return (indices, distances_km) of the k closest points, closest first"""
+        radius = self.cell_degrees * KM_PER_DEGREE_LAT
+        while True:
+            idx, distances = self.query_radius(lat, lng, radius, mask)
+            # Every point within the radius was found, so the k closest are among them
+            if len(idx) >= k or radius >= max_radius_km:
+                return idx[:k], distances[:k]
+            radius = min(radius * 2, max_radius_km)
+
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_cell_size(precision):
+    """Return the (lat, lng) size in degrees of a geohash cell at the given precision"""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** ((bits + 1) // 2)
+
+
+def geohash_encode(lat, lng, precision):
+    """Encode a coordinate as a geohash string"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, value, bit, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        span, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (span[0] + span[1]) / 2
+        if coord >= mid:
+            value = value * 2 + 1
+            span[0] = mid
+        else:
+            value = value * 2
+            span[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            value, bit = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    """Return (min_lat, min_lng, max_lat, max_lng) of a geohash cell"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            span = lng_range if even else lat_range
+            mid = (span[0] + span[1]) / 2
+            if (value >> shift) & 1:
+                span[0] = mid
+            else:
+                span[1] = mid
+            even = not even
+    return lat_range[0], lng_range[0], lat_range[1], lng_range[1]
+
+
+def geohash_cover(lat, lng, radius_km, precision):
+    """Return the geohash cells overlapping the bounding box of a circle"""
+    cell_lat, cell_lng = geohash_cell_size(precision)
+    lat_span = radius_km / KM_PER_DEGREE_LAT
+    max_abs_lat = min(89.9, abs(lat) + lat_span)
+    lng_span = min(180.0, radius_km / (KM_PER_DEGREE_LAT * math.cos(math.radians(max_abs_lat))))
+    
+    rows = int(180 / cell_lat)
+    cols = int(360 / cell_lng)
+    first_row = max(0, int((max(-90.0, lat - lat_span) + 90) // cell_lat))
+    last_row = min(rows - 1, int((min(90.0, lat + lat_span) + 90) // cell_lat))
+    if abs(lat) + lat_span >= 90:
+        # A circle reaching a pole covers every longitude
+        first_col, col_count = 0, cols
+    else:
+        first_col = int((lng - lng_span + 180) // cell_lng)
+        last_col = int((lng + lng_span + 180) // cell_lng)
+        col_count = min(cols, last_col - first_col + 1)
+    
+    cells = []
+    for row in range(first_row, last_row + 1):
+        center_lat = -90 + (row + 0.5) * cell_lat
+        for col in range(first_col, first_col + col_count):
+            # Columns past either edge wrap around the antimeridian
+            center_lng = -180 + (col % cols + 0.5) * cell_lng
+            cells.append(geohash_encode(center_lat, center_lng, precision))
+    return cells
+
+
+class LocalGazetteer:
+    """Offline GeoNames gazetteer backed by compact, memory-mapped arrays
+    
+    Built once from a GeoNames citiesNNNN.txt dump (see build()), then opened with
+    memory mapping so lookups don't need the dump or the network. Names and alternate
+    names are indexed by normalized prefix.
+    """
+
+    def __init__(self, index_dir):
+        """
+        Args:
+            index_dir (str): Directory written by LocalGazetteer.build()
+        """
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != GAZETTEER_FORMAT_VERSION:
+            raise ValueError(f"gazetteer index version {meta.get('version')}, expected {GAZETTEER_FORMAT_VERSION}")
+        
+        self.index_dir = index_dir
+        self.countries = meta["countries"]  # [code, name] pairs
+        self.feature_codes = meta["feature_codes"]
+        self.admin_regions = meta["admin_regions"]
+        self.timezones = meta["timezones"]
+        
+        def load(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+        
+        self.lat = load("lat")
+        self.lng = load("lng")
+        self.population = load("population")
+        self.feature_class = load("feature_class")
+        self.feature_code_idx = load("feature_code_idx")
+        self.country_idx = load("country_idx")
+        self.admin_idx = load("admin_idx")
+        self.timezone_idx = load("timezone_idx")
+        self.names = PackedStrings(load("names"), load("name_offsets"))
+        self.keys = PackedStrings(load("keys"), load("key_offsets"))
+        self.key_rows = load("key_rows")
+        self.key_heads = load("key_heads")
+        
+        # Built on the first coordinate query
+        self._spatial_index = None
+        self._spatial_index_lock = threading.Lock()
+
+    @property
+    def spatial_index(self):
+        with self._spatial_index_lock:
+            if self._spatial_index is None:
+                started = time.time()
+                self._spatial_index = GeoGridIndex(self.lat, self.lng)
+                logger.info(f"Built gazetteer spatial index in {(time.time() - started) * 1000:.0f}ms")
+            return self._spatial_index
+
+    def __len__(self):
+        return len(self.lat)
+
+    @classmethod
+    def open(cls, index_dir, **kwargs):
+        """Open an index, returning None (and logging why) if it can't be used"""
+        try:
+            gazetteer = cls(index_dir, **kwargs)
+            logger.info(f"Loaded local gazetteer with {len(gazetteer)} places from {index_dir}")
+            return gazetteer
+        except Exception as e:
+            logger.error(f"Could not open local gazetteer {index_dir}: {e}")
+            return None
+
+    @staticmethod
+    def _read_lines(path):
+        """Yield the lines of a GeoNames text file, reading the .txt member of a .zip if needed"""
+        if path.endswith(".zip"):
+            with zipfile.ZipFile(path) as archive:
+                member = next(name for name in archive.namelist()
+                              if name.endswith(".txt") and not name.lower().startswith("readme"))
+                with archive.open(member) as f:
+                    for raw in f:
+                        yield raw.decode("utf-8")
+        else:
+            with open(path, encoding="utf-8") as f:
+                yield from f
+
+    @classmethod
+    def _read_names(cls, path, name_column):
+        """Read a code -> name mapping from countryInfo.txt or admin1CodesASCII.txt"""
+        names = {}
+        for line in cls._read_lines(path):
+            if line.startswith("#"):
+                continue
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) > name_column:
+                names[cols[0]] = cols[name_column]
+        return names
+
+    @classmethod
+    def build(cls, dump_path, index_dir, country_info_path, admin1_path=None):
+        """
+        Build an index directory from a GeoNames dump
+        
+        Args:
+            dump_path (str): citiesNNNN.txt (or .zip) from download.geonames.org/export/dump
+            index_dir (str): Output directory
+            country_info_path (str): countryInfo.txt, for the full country names places carry
+            admin1_path (str): admin1CodesASCII.txt, for admin region names; without it places
+                have an empty admin_region and region filters only match country names
+            
+        Returns:
+            LocalGazetteer: The freshly built gazetteer
+            
+        Raises:
+            ValueError: If country_info_path is missing or lists no countries
+        """
+        # Budgets, itinerary headers and "city, country" filters all key on country names
+        if not country_info_path or not os.path.exists(country_info_path):
+            raise ValueError(f"GeoNames countryInfo.txt is required to build a gazetteer (got {country_info_path!r})")
+        country_names = cls._read_names(country_info_path, 4)
+        if not country_names:
+            raise ValueError(f"No countries found in {country_info_path}; expected GeoNames countryInfo.txt")
+        if admin1_path:
+            admin_names = cls._read_names(admin1_path, 1)
+        else:
+            admin_names = {}
+            logger.warning("No admin1CodesASCII.txt given; places will have no admin region names")
+        
+        # Interned string tables: value -> index, in insertion order
+        countries, feature_codes, admin_regions, timezones = {}, {}, {"": 0}, {"": 0}
+        lat, lng, population, feature_class = [], [], [], []
+        feature_code_idx, country_idx, admin_idx, timezone_idx = [], [], [], []
+        names, key_pairs = [], []
+        
+        for line in cls._read_lines(dump_path):
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 19:
+                continue
+            row = len(names)
+            country_code, admin1_code = cols[8], cols[10]
+            
+            names.append(cols[1])
+            lat.append(float(cols[4]))
+            lng.append(float(cols[5]))
+            feature_class.append(ord(cols[6] or " "))
+            feature_code_idx.append(feature_codes.setdefault(cols[7], len(feature_codes)))
+            country_idx.append(countries.setdefault(country_code, len(countries)))
+            # Raw admin1 codes ("11") aren't region names, so unknown ones are left empty
+            admin_name = admin_names.get(f"{country_code}.{admin1_code}", "")
+            admin_idx.append(admin_regions.setdefault(admin_name, len(admin_regions)))
+            population.append(int(cols[14] or 0))
+            timezone_idx.append(timezones.setdefault(cols[17], len(timezones)))
+            
+            # Index the name, ASCII name and alternate names
+            variants = [cols[1], cols[2]] + cols[3].split(",")
+            for key in {normalize_place_name(variant) for variant in variants if variant and len(variant) <= 64}:
+                if key:
+                    key_pairs.append((key, row))
+        
+        unknown_countries = sorted(code for code in countries if code not in country_names)
+        if unknown_countries:
+            logger.warning(f"Country codes missing from {country_info_path}: {', '.join(unknown_countries)}")
+        
+        key_pairs.sort()
+        os.makedirs(index_dir, exist_ok=True)
+        
+        def save(name, values, dtype):
+            np.save(os.path.join(index_dir, f"{name}.npy"), np.asarray(values, dtype=dtype))
+        
+        save("lat", lat, np.float32)
+        save("lng", lng, np.float32)
+        save("population", population, np.int64)
+        save("feature_class", feature_class, np.uint8)
+        save("feature_code_idx", feature_code_idx, np.int16)
+        save("country_idx", country_idx, np.int16)
+        save("admin_idx", admin_idx, np.int32)
+        save("timezone_idx", timezone_idx, np.int16)
+        
+        name_blob, name_offsets = PackedStrings.pack(names)
+        save("names", name_blob, np.uint8)
+        save("name_offsets", name_offsets, np.int64)
+        key_blob, key_offsets = PackedStrings.pack([key for key, _ in key_pairs])
+        save("keys", key_blob, np.uint8)
+        save("key_offsets", key_offsets, np.int64)
+        save("key_rows", [row for _, row in key_pairs], np.int32)
+        save("key_heads", PackedStrings(key_blob, key_offsets).heads(), np.uint64)
+        
+        # meta.json is written last so a half-built directory never opens
+        meta = {
+            "version": GAZETTEER_FORMAT_VERSION,
+            "source": os.path.basename(dump_path),
+            "built_at": datetime.now().isoformat(),
+            "count": len(names),
+            "countries": [[code, country_names.get(code, code)] for code in countries],
+            "feature_codes": list(feature_codes),
+            "admin_regions": list(admin_regions),
+            "timezones": list(timezones)
+        }
+        with open(os.path.join(index_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        
+        logger.info(f"Built local gazetteer with {len(names)} places and {len(key_pairs)} names in {index_dir}")
+        return cls(index_dir)
+
+    def place(self, row):
+        """Return the destination dict for a row, in the shape LocationService.search_destinations uses"""
+        country_code, country = self.countries[self.country_idx[row]]
+        return {
+            "name": self.names[row],
+            "country": country,
+            "country_code": country_code,
+            "population": int(self.population[row]),
+            # Coordinates are stored as float32; round away the representation noise
+            "lat": round(float(self.lat[row]), 5),
+            "lng": round(float(self.lng[row]), 5),
+            "timezone": self.timezones[self.timezone_idx[row]],
+            "feature_code": self.feature_codes[self.feature_code_idx[row]],
+            "admin_region": self.admin_regions[self.admin_idx[row]]
+        }
+
+    def _feature_mask(self, feature_class=None, feature_code=None):
+        """Boolean array selecting rows with the given feature class/code, or None for all rows"""
+        mask = None
+        if feature_class:
+            mask = self.feature_class == ord(feature_class)
+        if feature_code:
+            code_mask = (self.feature_code_idx == self.feature_codes.index(feature_code)
+                         if feature_code in self.feature_codes else np.zeros(len(self), dtype=bool))
+            mask = code_mask if mask is None else mask & code_mask
+        return mask
+
+    def nearby_place(self, row):
+        """Return the dict for a row, in the shape LocationService.get_nearby_places uses"""
+        return {
+            "name": self.names[row],
+            "lat": round(float(self.lat[row]), 5),
+            "lng": round(float(self.lng[row]), 5),
+            "type": self.feature_codes[self.feature_code_idx[row]],
+            "country": self.countries[self.country_idx[row]][1]
+        }
+
+    def nearby(self, lat, lng, radius=10, max_rows=10, feature_class="P", feature_code=None):
+        """Places within radius kilometers of (lat, lng), closest first"""
+        mask = self._feature_mask(feature_class, feature_code)
+        rows, _ = self.spatial_index.query_radius(lat, lng, radius, mask)
+        return [self.nearby_place(int(row)) for row in rows[:max_rows]]
+
+    def nearest(self, lat, lng, k=1, feature_class="P", feature_code=None):
+        """The k places closest to (lat, lng), closest first"""
+        mask = self._feature_mask(feature_class, feature_code)
+        rows, _ = self.spatial_index.nearest(lat, lng, k, mask)
+        return [self.nearby_place(int(row)) for row in rows]
+
+    def _prefix_range(self, prefix):
+        """Return the [start, end) slice of self.keys holding keys that start with prefix"""
+        data = prefix.encode("utf-8")
+        head = np.uint64(PackedStrings.head(data))
+        start = int(np.searchsorted(self.key_heads, head, side="left"))
+        end = int(np.searchsorted(self.key_heads, np.uint64(PackedStrings.head(data, 0xff)), side="right"))
+        if len(data) > 8:
+            # Every key in the slice shares the first 8 bytes; narrow down on the rest
+            successor = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            start = bisect.bisect_left(self.keys, prefix, start, end)
+            end = bisect.bisect_left(self.keys, successor, start, end)
+        return start, end
+
+    def _prefix_rows(self, prefix):
+        """Return unique rows named with a normalized prefix, exact matches first, then by population"""
+        start, end = self._prefix_range(prefix)
+        rows = np.asarray(self.key_rows[start:end], dtype=np.int64)
+        if not len(rows):
+            return rows
+        lengths = np.diff(self.keys.offsets[start:end + 1])
+        partial = lengths != len(prefix.encode("utf-8"))
+        order = np.lexsort((-self.population[rows], partial))
+        rows = rows[order]
+        # A place matched through several names keeps its best-ranked entry
+        _, first = np.unique(rows, return_index=True)
+        return rows[np.sort(first)]
+
+    def contains_name(self, name):
+        """True if name (or an alternate name) of some place equals name after normalization"""
+        key = normalize_place_name(name)
+        index = bisect.bisect_left(self.keys, key)
+        return bool(key) and index < len(self.keys) and self.keys[index] == key
+
+    def search(self, query, max_rows=10, feature_class="P", feature_code=None, country_filter=None):
+        """
+        Find places by name prefix, exact name matches first, then by population
+        
+        Args:
+            query (str): Place name or name prefix
+            max_rows (int): Maximum number of results
+            feature_class (str): GeoNames feature class to keep, None for any
+            feature_code (str): GeoNames feature code to keep, None for any
+            country_filter (str): Lowercase text that must occur in the country or admin
+                region name, or equal the country code
+            
+        Returns:
+            list: Destination dicts
+        """
+        prefix = normalize_place_name(query)
+        if not prefix:
+            return []
+        
+        rows = self._prefix_rows(prefix)
+        if feature_class:
+            rows = rows[self.feature_class[rows] == ord(feature_class)]
+        if feature_code:
+            codes = [i for i, code in enumerate(self.feature_codes) if code == feature_code]
+            rows = rows[np.isin(self.feature_code_idx[rows], codes)]
+        if country_filter:
+            countries = [i for i, (code, country) in enumerate(self.countries)
+                         if country_filter in country.lower() or country_filter == code.lower()]
+            admins = [i for i, admin in enumerate(self.admin_regions) if country_filter in admin.lower()]
+            rows = rows[np.isin(self.country_idx[rows], countries) | np.isin(self.admin_idx[rows], admins)]
+        return [self.place(row) for row in rows[:max_rows]]
+
+
+# Bump when the layout of country table snapshots changes
+COUNTRY_TABLE_FORMAT_VERSION = 1
+
+
+def country_record(country_data):
+    """Reduce a GeoNames countryInfo row to the fields the planner uses"""
+    return {
+        "continentName": country_data.get("continentName", ""),
+        "population": int(country_data.get("population", 0) or 0),
+        "capital": country_data.get("capital", ""),
+        "currencyCode": country_data.get("currencyCode", "")
+    }
+
+
+class CountryTable:
+    """In-memory index of every GeoNames country, keyed by name and ISO code
+    
+    Loaded from an on-disk snapshot when one exists and refreshed in the background
+    with a single countryInfoJSON call that returns all countries at once.
+    """
+
+    def __init__(self, path=None, refresh_interval=7 * 24 * 3600):
+        """
+        Args:
+            path (str): JSON snapshot the table is loaded from and saved to; None keeps it in memory only
+            refresh_interval (int): Seconds between background refreshes
+        """
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.fetched_at = 0
+        self._countries = []
+        self._index = {}
+        self._stop = threading.Event()
+        self._thread = None
+        if path:
+            self._load()
+
+    def __len__(self):
+        return len(self._countries)
+
+    @property
+    def stale(self):
+        return time.time() - self.fetched_at >= self.refresh_interval
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("format_version") != COUNTRY_TABLE_FORMAT_VERSION:
+                logger.warning(f"Ignoring country table {self.path} with unsupported format")
+                return
+            self.update(snapshot.get("countries", []), fetched_at=snapshot.get("fetched_at", 0))
+            logger.info(f"Loaded {len(self)} countries from {self.path}")
+        except Exception as e:
+            logger.warning(f"Could not read country table {self.path}: {e}")
+
+    def save(self):
+        """Write the table to its snapshot path"""
+        if not self.path or not self._countries:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "format_version": COUNTRY_TABLE_FORMAT_VERSION,
+                    "fetched_at": self.fetched_at,
+                    "countries": self._countries
+                }, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"Could not write country table {self.path}: {e}")
+
+    def update(self, countries, fetched_at=None):
+        """Replace the table with GeoNames countryInfo rows"""
+        index = {}
+        for country in countries:
+            for key in (country.get("countryName"), country.get("countryCode"), country.get("isoAlpha3")):
+                if key:
+                    index[normalize_place_name(key)] = country
+        # Readers see either the old or the new index, never a partial one
+        self._countries = list(countries)
+        self._index = index
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def lookup(self, name):
+        """Return the country record for a country name or ISO2/ISO3 code, or None"""
+        country = self._index.get(normalize_place_name(name or ""))
+        return country_record(country) if country else None
+
+    def refresh(self, fetch):
+        """Reload the table with fetch(), which returns all countryInfo rows; True on success"""
+        try:
+            countries = fetch()
+            if not countries:
+                return False
+            self.update(countries)
+            self.save()
+            logger.info(f"Refreshed country table with {len(self)} countries")
+            return True
+        except Exception as e:
+            logger.warning(f"Could not refresh country table: {e}")
+            return False
+
+    def start_refresh(self, fetch):
+        """Refresh now if the table is stale, then periodically on a daemon thread"""
+        if self._thread is not None:
+            return
+        
+        def run():
+            wait = 0 if self.stale else self.fetched_at + self.refresh_interval - time.time()
+            while not self._stop.wait(max(0, wait)):
+                # Retry sooner after a failure than after a successful refresh
+                wait = self.refresh_interval if self.refresh(fetch) else min(self.refresh_interval, 600)
+        
+        self._thread = threading.Thread(target=run, name="country-table-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
 class LocationService:
     """Service for fetching location data from Geonames and other sources"""
+
+    # Seconds each kind of GeoNames lookup stays fresh in the response cache
+    CACHE_TTLS = {
+        "search": 24 * 3600,
+        "nearby": 24 * 3600,
+        "country": 7 * 24 * 3600
+    }
     
-    def __init__(self, username=GEONAMES_USERNAME):
+    def __init__(self, username=GEONAMES_USERNAME, transport=None, cache=None, coordinate_precision=3,
+                 gazetteer=None, single_flight=None, country_table=None, refresh_countries=True):
+        """
+        Args:
+            username (str): GeoNames account name
+            transport (HTTPTransport): Shared HTTP transport, defaults to the process-wide one
+            cache (ResponseCache): Cache for GeoNames responses, defaults to a private one
+            coordinate_precision (int): Decimal places lat/lng are rounded to for nearby lookups
+            gazetteer (LocalGazetteer): Offline gazetteer consulted before the GeoNames API
+            single_flight (SingleFlight): Coalesces identical in-flight GeoNames requests
+            country_table (CountryTable): Preloaded country index, defaults to one backed by
+                the snapshot at COUNTRY_TABLE_PATH
+            refresh_countries (bool): Keep the country table fresh on a background thread
+        """
         self.username = username
+        self.gazetteer = gazetteer
+        self.single_flight = single_flight or SingleFlight()
+        self.transport = transport or get_default_transport()
+        self.cache = cache if cache is not None else ResponseCache(ttls=self.CACHE_TTLS)
+        self.coordinate_precision = coordinate_precision
+        self.countries = country_table if country_table is not None else CountryTable(COUNTRY_TABLE_PATH or None)
+        if refresh_countries:
+            self.countries.start_refresh(self._fetch_all_countries)
         logger.info(f"LocationService initialized with username: {self.username}")
+
+    def cache_stats(self):
+        """Return hit/miss counters of the GeoNames response cache"""
+        return self.cache.stats()
+
+    @staticmethod
+    def _geonames_error(response):
+        """Return the error of a GeoNames payload, which reports e.g. exhausted credits with HTTP 200"""
+        try:
+            data = response.json()
+        except ValueError:
+            return "GeoNames returned invalid JSON"
+        status = data.get("status") if isinstance(data, dict) else None
+        if status:
+            return f"GeoNames error {status.get('value')}: {status.get('message')}"
+        return None
+
+    def _geonames_get(self, url, params):
+        """GET a GeoNames endpoint, treating error payloads (quota, auth) as upstream failures"""
+        response = self.transport.get(url, params=params, failure_check=self._geonames_error)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _copy_places(places):
+        """Copy cached place dicts so callers can't mutate the cache"""
+        return [dict(place) for place in places]
         
     def get_nearby_places(self, lat, lng, radius=10, max_rows=10, feature_class="P"):
         """
@@ -125,22 +1712,47 @@ class LocationService:
         """
         logger.info(f"Searching nearby places around ({lat}, {lng})")
         
-        # Fallback data for popular destinations
-        fallback_nearby = {
-            "paris": [
-                {"name": "Eiffel Tower", "lat": 48.8584, "lng": 2.2945, "type": "Tourist Attraction"},
-                {"name": "Louvre Museum", "lat": 48.8606, "lng": 2.3376, "type": "Museum"},
-                {"name": "Notre-Dame Cathedral", "lat": 48.8530, "lng": 2.3499, "type": "Religious Site"}
-            ],
-            "new york": [
-                {"name": "Statue of Liberty", "lat": 40.6892, "lng": -74.0445, "type": "Monument"},
-                {"name": "Central Park", "lat": 40.7851, "lng": -73.9683, "type": "Park"},
-                {"name": "Times Square", "lat": 40.7580, "lng": -73.9855, "type": "Square"}
-            ],
-            # Add more fallback data as needed
-        }
+        # Answer from the offline gazetteer's spatial index when one is configured
+        if self.gazetteer is not None:
+            nearby_places = self.gazetteer.nearby(float(lat), float(lng), radius, max_rows, feature_class)
+            if nearby_places:
+                return nearby_places
         
         try:
+            nearby_places = self._find_nearby_geonames(lat, lng, radius, max_rows, feature_class)
+            
+            if nearby_places:
+                return nearby_places[:max_rows]
+            
+            # Fallback to the built-in attractions of the closest major city
+            return FALLBACK_GAZETTEER.nearby_places(lat, lng)
+            
+        except Exception as e:
+            logger.error(f"Error fetching nearby places: {str(e)}")
+            # Try to find matching fallback data
+            return FALLBACK_GAZETTEER.nearby_places(lat, lng)
+
+    def has_nearby_places(self, lat, lng, radius=10, max_rows=10, feature_class="P"):
+        """Return whether get_nearby_places here answers from real data rather than a failed lookup's fallback"""
+        if self.gazetteer is not None and self.gazetteer.nearby(float(lat), float(lng), radius, max_rows, feature_class):
+            return True
+        key = self._nearby_key(lat, lng, radius, max_rows, feature_class)
+        return self.cache.get("nearby", key, _MISSING) is not _MISSING
+
+    def _nearby_key(self, lat, lng, radius, max_rows, feature_class):
+        lat = round(float(lat), self.coordinate_precision)
+        lng = round(float(lng), self.coordinate_precision)
+        return (lat, lng, radius, max_rows, feature_class)
+
+    def _find_nearby_geonames(self, lat, lng, radius, max_rows, feature_class):
+        """Query GeoNames findNearbyPlaceNameJSON, served from the cache when possible"""
+        key = self._nearby_key(lat, lng, radius, max_rows, feature_class)
+        lat, lng = key[0], key[1]
+        cached = self.cache.get("nearby", key, _MISSING)
+        if cached is not _MISSING:
+            return self._copy_places(cached)
+
+        def fetch():
             url = "http://api.geonames.org/findNearbyPlaceNameJSON"
             params = {
                 "lat": lat,
@@ -150,11 +1762,9 @@ class LocationService:
                 "username": self.username,
                 "featureClass": feature_class
             }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
+        
+            data = self._geonames_get(url, params)
+        
             nearby_places = []
             for place in data.get("geonames", []):
                 nearby_places.append({
@@ -165,25 +1775,11 @@ class LocationService:
                     "country": place.get("countryName", "")
                 })
             
-            if nearby_places:
-                return nearby_places[:max_rows]
-            
-            # Fallback to check major cities
-            for city in fallback_nearby:
-                city_data = self.search_destinations(city, max_rows=1)
-                if city_data and abs(city_data[0]["lat"] - lat) < 1 and abs(city_data[0]["lng"] - lng) < 1:
-                    return fallback_nearby[city]
-            
-            return []
-            
-        except Exception as e:
-            logger.error(f"Error fetching nearby places: {str(e)}")
-            # Try to find matching fallback data
-            for city in fallback_nearby:
-                city_data = self.search_destinations(city, max_rows=1)
-                if city_data and abs(city_data[0]["lat"] - lat) < 1 and abs(city_data[0]["lng"] - lng) < 1:
-                    return fallback_nearby[city]
-            return []
+            self.cache.set("nearby", key, nearby_places)
+            return nearby_places
+        
+        # Concurrent callers asking for the same place share one request
+        return self._copy_places(self.single_flight.do(("nearby", key), fetch))
     
     def get_country_info(self, country_name):
         """Get basic country information from Geonames"""
@@ -229,25 +1825,15 @@ class LocationService:
             }
         }
         
+        # The preloaded table answers without a network round trip
+        country_info = self.countries.lookup(country_name)
+        if country_info:
+            return country_info
+        
         try:
-            url = "http://api.geonames.org/countryInfoJSON"
-            params = {
-                "country": country_name,
-                "username": self.username
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("geonames"):
-                country_data = data["geonames"][0]
-                return {
-                    "continentName": country_data.get("continentName", ""),
-                    "population": int(country_data.get("population", 0)),
-                    "capital": country_data.get("capital", ""),
-                    "currencyCode": country_data.get("currencyCode", "")
-                }
+            country_info = self._fetch_country_info(country_name)
+            if country_info:
+                return country_info
             
         except Exception as e:
             logger.error(f"Error fetching country info: {str(e)}")
@@ -265,6 +1851,44 @@ class LocationService:
             "currencyCode": ""
         }
 
+    def has_country_info(self, country_name):
+        """Return whether get_country_info answers from real data rather than a failed lookup's fallback"""
+        if self.countries.lookup(country_name):
+            return True
+        return self.cache.get("country", country_name.strip().lower(), _MISSING) is not _MISSING
+
+    def _fetch_country_info(self, country_name):
+        """Query GeoNames countryInfoJSON, served from the cache when possible"""
+        key = country_name.strip().lower()
+        cached = self.cache.get("country", key, _MISSING)
+        if cached is not _MISSING:
+            return dict(cached) if cached else None
+
+        def fetch():
+            url = "http://api.geonames.org/countryInfoJSON"
+            params = {
+                "country": country_name,
+                "username": self.username
+            }
+        
+            data = self._geonames_get(url, params)
+        
+            country_info = None
+            if data.get("geonames"):
+                country_info = country_record(data["geonames"][0])
+            
+            self.cache.set("country", key, country_info)
+            return country_info
+        
+        country_info = self.single_flight.do(("country", key), fetch)
+        return dict(country_info) if country_info else None
+
+    def _fetch_all_countries(self):
+        """Fetch countryInfo rows for every country in one GeoNames call"""
+        url = "http://api.geonames.org/countryInfoJSON"
+        data = self._geonames_get(url, {"username": self.username})
+        return data.get("geonames", [])
+
     def search_destinations(self, query, max_rows=10, feature_class="P", feature_code=None):
         """Search for destinations using Geonames API."""
         # Add country/state filtering
@@ -279,7 +1903,47 @@ class LocationService:
         
         logger.info(f"Searching destinations for: {query}")
         
+        # Resolve locally when an offline gazetteer is configured; only misses go to the API
+        if self.gazetteer is not None:
+            destinations = self.gazetteer.search(query, max_rows, feature_class, feature_code, country_filter)
+            if destinations:
+                return destinations
+        
         try:
+            destinations = self._search_geonames(query, max_rows, feature_class, feature_code)
+            
+            # Post-filter results
+            if country_filter:
+                filtered = []
+                for dest in destinations:
+                    if country_filter in dest['country'].lower() or \
+                    country_filter in dest['admin_region'].lower():
+                        filtered.append(dest)
+                destinations = filtered
+            
+            # Only use fallback if we have no results at all
+            if not destinations:
+                logger.warning(f"No results found for {original_query}, trying fallback")
+                fallback_results = self._fallback_search(original_query, max_rows)
+                if fallback_results:
+                    logger.info(f"Using fallback data for {original_query}")
+                    return fallback_results
+            
+            return destinations[:max_rows]
+            
+        except Exception as e:
+            logger.error(f"GeoNames API error: {str(e)}")
+            # Only use fallback if API call fails
+            return self._fallback_search(query, max_rows)
+
+    def _search_geonames(self, query, max_rows, feature_class, feature_code):
+        """Query GeoNames searchJSON, served from the cache when possible"""
+        key = (query.strip().lower(), max_rows, feature_class, feature_code)
+        cached = self.cache.get("search", key, _MISSING)
+        if cached is not _MISSING:
+            return self._copy_places(cached)
+
+        def fetch():
             # API request parameters
             url = "http://api.geonames.org/searchJSON"
             params = {
@@ -291,16 +1955,14 @@ class LocationService:
                 "featureClass": feature_class,
                 "orderby": "relevance"
             }
-            
+        
             # Add feature code if specified
             if feature_code:
                 params["featureCode"] = feature_code
-                
-            # Make API request
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
             
+            # Make API request
+            data = self._geonames_get(url, params)
+        
             # Process results
             destinations = []
             for place in data.get("geonames", []):
@@ -318,130 +1980,19 @@ class LocationService:
                         "admin_region": place.get("adminName1", "")
                     }
                     destinations.append(dest)
-            
+        
             # Sort by population (largest cities first)
             destinations.sort(key=lambda x: x["population"], reverse=True)
             
-            # Post-filter results
-            if country_filter:
-                filtered = []
-                for dest in destinations:
-                    if country_filter in dest['country'].lower() or \
-                    country_filter in dest['admin_region'].lower():
-                        filtered.append(dest)
-                destinations = filtered
-            
-            # Only use fallback if we have no results at all
-            if not destinations:
-                logger.warning(f"No results found for {original_query}, trying fallback")
-                fallback_results = self._fallback_search(original_query, max_rows)
-                if fallback_results:
-                    logger.info(f"Using fallback data for {original_query}")
-                    return fallback_results
-            
-            return destinations[:max_rows]
-            
-        except Exception as e:
-            logger.error(f"GeoNames API error: {str(e)}")
-            # Only use fallback if API call fails
-            return self._fallback_search(query, max_rows)
+            self.cache.set("search", key, destinations)
+            return destinations
+        
+        return self._copy_places(self.single_flight.do(("search", key), fetch))
 
     def _fallback_search(self, query, max_rows):
         """Fallback search when Geonames API fails."""
         logger.info(f"Using local fallback data for: {query}")
-        
-        # Fallback data for popular destinations
-        fallback_data = {
-            "hong kong": {
-                "name": "Hong Kong",
-                "country": "China",
-                "country_code": "HK",
-                "population": 7482500,
-                "lat": 22.3193,
-                "lng": 114.1694,
-            },
-            "paris": {
-                "name": "Paris",
-                "country": "France",
-                "country_code": "FR",
-                "population": 2140526,
-                "lat": 48.8566,
-                "lng": 2.3522,
-            },
-            "new york": {
-                "name": "New York",
-                "country": "United States",
-                "country_code": "US",
-                "population": 8804190,
-                "lat": 40.7128,
-                "lng": -74.0060,
-            },
-            "tokyo": {
-                "name": "Tokyo",
-                "country": "Japan",
-                "country_code": "JP",
-                "population": 13960000,
-                "lat": 35.6762,
-                "lng": 139.6503,
-            },
-            "london": {
-                "name": "London",
-                "country": "United Kingdom",
-                "country_code": "GB",
-                "population": 8982000,
-                "lat": 51.5074,
-                "lng": -0.1278,
-            },
-            "rome": {
-                "name": "Rome",
-                "country": "Italy",
-                "country_code": "IT",
-                "population": 2873000,
-                "lat": 41.9028,
-                "lng": 12.4964,
-            },
-            "sydney": {
-                "name": "Sydney",
-                "country": "Australia",
-                "country_code": "AU",
-                "population": 5312000,
-                "lat": -33.8688,
-                "lng": 151.2093,
-            },
-            "bangkok": {
-                "name": "Bangkok",
-                "country": "Thailand",
-                "country_code": "TH",
-                "population": 8281000,
-                "lat": 13.7563,
-                "lng": 100.5018,
-            }
-        }
-        
-        query_lower = query.lower()
-        results = []
-        
-        # Exact match first
-        if query_lower in fallback_data:
-            return [fallback_data[query_lower]]
-            
-        # Partial matches - only if no exact match
-        for key, data in fallback_data.items():
-            # Check if query is part of the key or if any word in query is in key
-            if query_lower in key or any(word in key for word in query_lower.split()):
-                results.append(data)
-                if len(results) >= max_rows:
-                    break
-        
-        # If we still have no results, check if any city name contains the query
-        if not results:
-            for key, data in fallback_data.items():
-                if query_lower in data["name"].lower():
-                    results.append(data)
-                    if len(results) >= max_rows:
-                        break
-                    
-        return results
+        return FALLBACK_GAZETTEER.search(query, max_rows)
             
 
 
@@ -449,10 +2000,49 @@ class LocationService:
 class RouteService:
     """Service for calculating routes and directions using OpenRoute Service"""
     
-    def __init__(self, api_key=OPENROUTE_API_KEY):
+    # POIs are cached per geohash tile; precision 5 tiles are about 4.9 x 4.9 km at the
+    # equator, inside OpenRoute's POI search area limit
+    POI_TILE_PRECISION = 5
+    POI_TILE_TTL = 7 * 24 * 3600
+    # Most POIs one request returns; a tile that reaches it is cached flagged as truncated
+    POI_TILE_LIMIT = 2000
+    # Most uncached tiles one lookup fetches, nearest first; later lookups fill in the rest
+    POI_MAX_TILE_FETCHES = 9
+    
+    # OpenRoute matrix requests are limited to sources x destinations <= 3500
+    MATRIX_MAX_PAIRS = 3500
+    # Average door-to-door speeds and detour factor used when no API key is configured
+    PROFILE_SPEEDS_KMH = {"foot-walking": 5, "cycling-regular": 15, "driving-car": 40}
+    DETOUR_FACTOR = 1.3
+    
+    def __init__(self, api_key=OPENROUTE_API_KEY, transport=None, single_flight=None, tile_cache=None,
+                 tile_precision=POI_TILE_PRECISION, tile_workers=8, max_tile_fetches=POI_MAX_TILE_FETCHES):
+        """
+        Args:
+            api_key (str): OpenRoute Service API key
+            transport (HTTPTransport): Shared HTTP transport, defaults to the process-wide one
+            single_flight (SingleFlight): Coalesces identical in-flight requests
+            tile_cache (ResponseCache): Size-bounded store for POI tiles, defaults to a private one
+            tile_precision (int): Geohash precision of POI tiles
+            tile_workers (int): Maximum POI tile requests in flight for one lookup
+            max_tile_fetches (int): Maximum uncached POI tiles requested by one lookup
+        """
         self.api_key = api_key
+        self.transport = transport or get_default_transport()
+        self.single_flight = single_flight or SingleFlight()
+        self.tile_cache = tile_cache or ResponseCache(max_size=4096, ttls={"poi_tile": self.POI_TILE_TTL})
+        self.tile_precision = tile_precision
+        self.max_tile_fetches = max_tile_fetches
+        # Private pool so tile fetches never wait on a caller's executor
+        self.tile_executor = ThreadPoolExecutor(max_workers=tile_workers, thread_name_prefix="poi-tiles")
+        # Called with a tile's geohash whenever its POIs are fetched anew
+        self.refresh_listeners = []
         self.base_url = "https://api.openrouteservice.org"
     
+    def close(self):
+        """Shut down the tile fetch threads"""
+        self.tile_executor.shutdown(wait=False)
+    
     def geocode(self, query):
         """Geocode a location using Nominatim"""
         try:
@@ -463,7 +2053,7 @@ class RouteService:
                 "limit": 1
             }
             
-            response = requests.get(url, params=params)
+            response = self.transport.get(url, params=params)
             response.raise_for_status()
             results = response.json()
             
@@ -510,7 +2100,7 @@ class RouteService:
                 "coordinates": [start_point, end_point]
             }
             
-            response = requests.post(url, headers=headers, json=data)
+            response = self.transport.post(url, headers=headers, json=data)
             response.raise_for_status()
             result = response.json()
             
@@ -527,6 +2117,94 @@ class RouteService:
             logger.error(f"Error getting directions: {str(e)}")
             return None
     
+    def get_distance_matrix(self, points, profile="foot-walking"):
+        """
+        Get travel distances and durations between every pair of points
+        
+        Points are sent in as few OpenRoute matrix requests as the pair limit allows;
+        without an API key (or for a batch that fails) the values are estimated locally.
+        
+        Args:
+            points (list): Points as (lng, lat)
+            profile (str): Travel profile (foot-walking, cycling-regular, driving-car)
+            
+        Returns:
+            dict: "distances" in meters and "durations" in seconds as n x n lists,
+                where [i][j] is the trip from points[i] to points[j], and "estimated",
+                True if any value came from the local estimator
+        """
+        points = [(float(lng), float(lat)) for lng, lat in points]
+        n = len(points)
+        distances = [[0.0] * n for _ in range(n)]
+        durations = [[0.0] * n for _ in range(n)]
+        estimated = False
+        
+        if not self.api_key:
+            logger.warning("OpenRoute API key not provided, estimating distance matrix")
+        
+        # Square blocks of sources x destinations; up to 59 points need a single request
+        block = max(1, int(math.sqrt(self.MATRIX_MAX_PAIRS)))
+        for src_start in range(0, n, block):
+            sources = list(range(src_start, min(n, src_start + block)))
+            for dst_start in range(0, n, block):
+                destinations = list(range(dst_start, min(n, dst_start + block)))
+                result = None
+                if self.api_key:
+                    result = self._fetch_matrix_batch(points, sources, destinations, profile)
+                if result is None:
+                    result = self._estimate_matrix_batch(points, sources, destinations, profile)
+                    estimated = True
+                for i, src in enumerate(sources):
+                    for j, dst in enumerate(destinations):
+                        distances[src][dst] = result["distances"][i][j]
+                        durations[src][dst] = result["durations"][i][j]
+        
+        return {"distances": distances, "durations": durations, "estimated": estimated}
+    
+    def _fetch_matrix_batch(self, points, sources, destinations, profile):
+        """Request one block of the matrix from OpenRoute Service, or return None on failure"""
+        # Send each location once, even when it is both a source and a destination
+        locations = sorted(set(sources) | set(destinations))
+        position = {index: i for i, index in enumerate(locations)}
+        
+        try:
+            url = f"{self.base_url}/v2/matrix/{profile}"
+            headers = {
+                "Authorization": self.api_key,
+                "Content-Type": "application/json"
+            }
+            
+            data = {
+                "locations": [list(points[index]) for index in locations],
+                "sources": [position[index] for index in sources],
+                "destinations": [position[index] for index in destinations],
+                "metrics": ["distance", "duration"]
+            }
+            
+            response = self.transport.post(url, headers=headers, json=data)
+            response.raise_for_status()
+            result = response.json()
+            return {
+                "distances": result["distances"],
+                "durations": result["durations"]
+            }
+        except Exception as e:
+            logger.error(f"Error getting distance matrix: {str(e)}")
+            return None
+    
+    def _estimate_matrix_batch(self, points, sources, destinations, profile):
+        """Estimate one block of the matrix from great-circle distances and an average speed"""
+        speed_kmh = self.PROFILE_SPEEDS_KMH.get(profile, self.PROFILE_SPEEDS_KMH["foot-walking"])
+        lngs = np.array([points[index][0] for index in destinations])
+        lats = np.array([points[index][1] for index in destinations])
+        
+        distances, durations = [], []
+        for src in sources:
+            km = haversine_km_array(points[src][1], points[src][0], lats, lngs) * self.DETOUR_FACTOR
+            distances.append([round(float(d) * 1000, 1) for d in km])
+            durations.append([round(float(d) / speed_kmh * 3600, 1) for d in km])
+        return {"distances": distances, "durations": durations}
+    
     def get_places_of_interest(self, center_point, radius=2000, categories=None):
         """
         Find places of interest around a location using OpenRoute POI service
@@ -544,62 +2222,414 @@ class RouteService:
             return []
             
         try:
-            url = f"{self.base_url}/pois"
-            headers = {
-                "Authorization": self.api_key,
-                "Content-Type": "application/json"
-            }
+            lng, lat = float(center_point[0]), float(center_point[1])
+            categories = tuple(sorted(categories)) if categories else ()
+            tiles = self.poi_tiles(center_point, radius)
             
-            data = {
-                "request": "pois",
-                "geometry": {
-                    "buffer": radius,
-                    "geojson": {
-                        "type": "Point",
-                        "coordinates": center_point
-                    }
-                }
-            }
+            # Answer from cached tiles, fetching only the ones not seen yet
+            tile_pois = {}
+            missing = []
+            for tile in tiles:
+                cached = self.tile_cache.get("poi_tile", (tile, categories), _MISSING)
+                if cached is _MISSING:
+                    missing.append(tile)
+                else:
+                    tile_pois[tile] = cached
             
-            if categories:
-                data["filters"] = {
-                    "category_ids": categories
-                }
+            if len(missing) > self.max_tile_fetches:
+                # Bound the quota one cold lookup spends: the tiles nearest the center come
+                # first, and the remaining ones are fetched by later lookups
+                missing.sort(key=lambda tile: self._tile_distance(lat, lng, tile))
+                logger.info(f"Fetching {self.max_tile_fetches} of {len(missing)} uncached POI tiles")
+                missing = missing[:self.max_tile_fetches]
             
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            result = response.json()
+            if missing:
+                futures = {
+                    tile: self.tile_executor.submit(
+                        self.single_flight.do, ("poi_tile", tile, categories),
+                        lambda tile=tile: self._fetch_poi_tile(tile, categories)
+                    )
+                    for tile in missing
+                }
+                for tile, future in futures.items():
+                    tile_pois[tile] = future.result()
             
+            # Merge the covering tiles and keep only POIs inside the exact radius
             pois = []
-            for feature in result.get("features", []):
-                props = feature.get("properties", {})
-                coords = feature.get("geometry", {}).get("coordinates", [])
-                
-                poi = {
-                    "name": props.get("name", "Unknown"),
-                    "category": props.get("category_name", ""),
-                    "lng": coords[0] if len(coords) > 0 else 0,
-                    "lat": coords[1] if len(coords) > 1 else 0,
-                    "osm_id": props.get("osm_id", "")
-                }
-                pois.append(poi)
-                
-            return pois
+            seen = set()
+            for tile in tiles:
+                if tile not in tile_pois:
+                    continue
+                for poi in tile_pois[tile]["pois"]:
+                    poi_key = poi["osm_id"] or (poi["name"], poi["lat"], poi["lng"])
+                    if poi_key in seen:
+                        continue
+                    seen.add(poi_key)
+                    distance = haversine_km(lat, lng, poi["lat"], poi["lng"]) * 1000
+                    if distance <= radius:
+                        pois.append((distance, poi))
+            
+            pois.sort(key=lambda item: item[0])
+            return [dict(poi) for _, poi in pois]
         except Exception as e:
             logger.error(f"Error getting places of interest: {str(e)}")
             return []
 
+    def poi_tiles(self, center_point, radius):
+        """Return the geohash tiles a POI lookup around center_point (lng, lat) reads"""
+        return geohash_cover(float(center_point[1]), float(center_point[0]), radius / 1000, self.tile_precision)
+
+    @staticmethod
+    def _tile_distance(lat, lng, tile):
+        min_lat, min_lng, max_lat, max_lng = geohash_bounds(tile)
+        return haversine_km(lat, lng, (min_lat + max_lat) / 2, (min_lng + max_lng) / 2)
+
+    def has_poi_tiles(self, center_point, radius, categories=None):
+        """Return whether every tile around center_point is cached, i.e. a POI lookup there isn't degraded
+        
+        Truncated tiles count as cached: the provider returns no more for them.
+        """
+        if not self.api_key:
+            return True
+        categories = tuple(sorted(categories)) if categories else ()
+        return all(
+            self.tile_cache.get("poi_tile", (tile, categories), _MISSING) is not _MISSING
+            for tile in self.poi_tiles(center_point, radius)
+        )
+
+    def _fetch_poi_tile(self, tile, categories):
+        """Request the POIs inside one geohash tile from OpenRoute Service and cache them
+        
+        Returns:
+            dict: pois, plus truncated when the response reached POI_TILE_LIMIT
+        """
+        min_lat, min_lng, max_lat, max_lng = geohash_bounds(tile)
+        url = f"{self.base_url}/pois"
+        headers = {
+            "Authorization": self.api_key,
+            "Content-Type": "application/json"
+        }
+        
+        data = {
+            "request": "pois",
+            "geometry": {
+                "bbox": [[min_lng, min_lat], [max_lng, max_lat]]
+            },
+            "limit": self.POI_TILE_LIMIT
+        }
+        
+        if categories:
+            data["filters"] = {
+                "category_ids": list(categories)
+            }
+        
+        response = self.transport.post(url, headers=headers, json=data)
+        response.raise_for_status()
+        result = response.json()
+        
+        pois = []
+        for feature in result.get("features", []):
+            props = feature.get("properties", {})
+            coords = feature.get("geometry", {}).get("coordinates", [])
+            
+            poi = {
+                "name": props.get("name", "Unknown"),
+                "category": props.get("category_name", ""),
+                "lng": coords[0] if len(coords) > 0 else 0,
+                "lat": coords[1] if len(coords) > 1 else 0,
+                "osm_id": props.get("osm_id", "")
+            }
+            pois.append(poi)
+        
+        # Dense tiles reach the limit on every request, so refetching them would return no
+        # more; they are cached like any other tile, flagged so callers know the list is partial
+        truncated = len(pois) >= self.POI_TILE_LIMIT
+        if truncated:
+            logger.warning(f"POI tile {tile} hit the {self.POI_TILE_LIMIT} result limit; caching it as truncated")
+        
+        entry = {"pois": pois, "truncated": truncated}
+        self.tile_cache.set("poi_tile", (tile, categories), entry)
+        for listener in self.refresh_listeners:
+            listener(tile)
+        return entry
+
+
+class AirportIndex:
+    """Offline airport lookup by IATA/ICAO code, city, name prefix and location
+    
+    Built from the OurAirports airports.csv dataset (https://ourairports.com/data/).
+    Only airports with an IATA code are kept, larger airports rank first.
+    """
+
+    # Rank of OurAirports airport types, largest first
+    TYPE_RANK = {"large_airport": 0, "medium_airport": 1, "small_airport": 2}
+
+    def __init__(self, airports):
+        """
+        Args:
+            airports (list): Airport dicts with code, icao, name, city, country, lat, lng and type
+        """
+        self.airports = sorted(airports, key=lambda a: (self.TYPE_RANK.get(a["type"], 3), a["name"]))
+        self._by_code = {}
+        self._by_city = defaultdict(list)
+        name_keys = []
+        for row, airport in enumerate(self.airports):
+            for code in (airport["code"], airport["icao"]):
+                if code:
+                    self._by_code.setdefault(code.upper(), row)
+            city = normalize_place_name(airport["city"])
+            if city:
+                self._by_city[city].append(row)
+                name_keys.append((city, row))
+            name_keys.append((normalize_place_name(airport["name"]), row))
+        
+        # Sorted (name, row) pairs, so a prefix maps to one contiguous slice
+        name_keys.sort()
+        self._name_keys = [key for key, _ in name_keys]
+        self._name_rows = [row for _, row in name_keys]
+        self._spatial_index = GeoGridIndex(
+            [a["lat"] for a in self.airports], [a["lng"] for a in self.airports], cell_degrees=1.0
+        )
+
+    def __len__(self):
+        return len(self.airports)
+
+    @classmethod
+    def load(cls, path, scheduled_only=True):
+        """
+        Read an OurAirports airports.csv file
+        
+        Args:
+            path (str): Path to airports.csv
+            scheduled_only (bool): Keep only airports with scheduled passenger service
+        """
+        airports = []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                if row.get("type") not in cls.TYPE_RANK or not row.get("iata_code"):
+                    continue
+                if scheduled_only and row.get("scheduled_service") != "yes":
+                    continue
+                airports.append({
+                    "code": row["iata_code"].upper(),
+                    "icao": (row.get("icao_code") or row.get("gps_code") or row.get("ident") or "").upper(),
+                    "name": row.get("name", ""),
+                    "city": row.get("municipality", ""),
+                    "country": row.get("iso_country", ""),
+                    "lat": float(row.get("latitude_deg") or 0),
+                    "lng": float(row.get("longitude_deg") or 0),
+                    "type": row["type"]
+                })
+        return cls(airports)
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """Load an index, returning None (and logging why) if it can't be used"""
+        try:
+            index = cls.load(path, **kwargs)
+            logger.info(f"Loaded airport index with {len(index)} airports from {path}")
+            return index
+        except Exception as e:
+            logger.error(f"Could not load airport index {path}: {e}")
+            return None
+
+    def airport(self, row):
+        """Return the airport at row in the FlightService result shape"""
+        airport = self.airports[row]
+        return {
+            "code": airport["code"],
+            "icao": airport["icao"],
+            "name": airport["name"],
+            "city": airport["city"],
+            "country": airport["country"],
+            "lat": airport["lat"],
+            "lng": airport["lng"]
+        }
+
+    def get(self, code):
+        """Look up an airport by IATA or ICAO code"""
+        row = self._by_code.get((code or "").strip().upper())
+        return self.airport(row) if row is not None else None
+
+    def search(self, query, max_rows=10):
+        """
+        Find airports for a code, a city or the start of an airport or city name
+        
+        Returns:
+            list: Airport dicts, largest airports first
+        """
+        query = (query or "").strip()
+        if not query:
+            return []
+        
+        # An exact code wins outright
+        if query.isalnum() and len(query) in (3, 4):
+            airport = self.get(query)
+            if airport:
+                return [airport]
+        
+        key = normalize_place_name(query)
+        rows = list(self._by_city.get(key, []))
+        if not rows:
+            start = bisect.bisect_left(self._name_keys, key)
+            end = bisect.bisect_right(self._name_keys, key + "\uffff")
+            rows = sorted(set(self._name_rows[start:end]))
+        return [self.airport(row) for row in rows[:max_rows]]
+
+    def nearest(self, lat, lng, k=1, max_radius_km=300):
+        """Return up to k airports closest to (lat, lng), each with its distance_km"""
+        idx, distances = self._spatial_index.nearest(lat, lng, k=k, max_radius_km=max_radius_km)
+        airports = []
+        for row, distance in zip(idx, distances):
+            if distance > max_radius_km:
+                continue
+            airport = self.airport(int(row))
+            airport["distance_km"] = round(float(distance), 1)
+            airports.append(airport)
+        return airports
+
 
 class FlightService:
     """Service for fetching flight information using FlightStats API"""
     
-    def __init__(self, app_id=FLIGHTSTATS_APP_ID, app_key=FLIGHTSTATS_APP_KEY):
+    # Ranking keys for flexible searches; ISO departure times sort chronologically as strings.
+    # Schedules often lack a duration (reported as 0), and their local departure and arrival
+    # times can't be subtracted across time zones, so unknown durations rank last. Ties are
+    # broken by route and flight number, so the ranking doesn't depend on which search finished first.
+    SORT_KEYS = {
+        "duration": lambda flight: (flight["duration"] or float("inf"), flight["departure"]["time"],
+                                    FlightService._flight_id(flight)),
+        "departure": lambda flight: (flight["departure"]["time"], flight["duration"] or float("inf"),
+                                     FlightService._flight_id(flight))
+    }
+    DATE_FORMATS = ("%Y/%m/%d", "%Y-%m-%d", "%m/%d/%Y")
+    # Widest flexible window searched; every extra day costs one request per airport pair
+    MAX_FLEX_DAYS = 3
+    
+    def __init__(self, app_id=FLIGHTSTATS_APP_ID, app_key=FLIGHTSTATS_APP_KEY, transport=None, airport_index=None,
+                 search_workers=6):
+        """
+        Args:
+            app_id (str): FlightStats application id
+            app_key (str): FlightStats application key
+            transport (HTTPTransport): Shared HTTP transport, defaults to the process-wide one
+            airport_index (AirportIndex): Offline airport index consulted before FlightStats
+            search_workers (int): Maximum schedule requests in flight for one flexible search
+        """
         self.app_id = app_id
         self.app_key = app_key
+        self.transport = transport or get_default_transport()
+        self.airport_index = airport_index
+        # Private pool so flexible searches never wait on a caller's executor
+        self.search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="flight-search")
         self.base_url = "https://api.flightstats.com/flex"
     
+    def close(self):
+        """Shut down the flexible search threads"""
+        self.search_executor.shutdown(wait=False)
+    
+    @staticmethod
+    def _flight_id(flight):
+        return (flight["departure"]["airport"], flight["arrival"]["airport"], str(flight["carrier"]),
+                str(flight["flight_number"]))
+    
+    def _parse_date(self, date):
+        if isinstance(date, datetime):
+            return date
+        for date_format in self.DATE_FORMATS:
+            try:
+                return datetime.strptime(date, date_format)
+            except (TypeError, ValueError):
+                continue
+        raise ValueError(f"Unrecognized flight date: {date}")
+    
+    def iter_flight_options(self, departure_airports, arrival_airports, date, flex_days=0):
+        """
+        Search every airport pair over date +/- flex_days concurrently, yielding results as they arrive
+        
+        Args:
+            departure_airports (list): Candidate departure airport codes
+            arrival_airports (list): Candidate arrival airport codes
+            date (str|datetime): Central departure date
+            flex_days (int): Days either side of date to include, at most MAX_FLEX_DAYS
+            
+        Yields:
+            tuple: (departure_airport, arrival_airport, date, flights) for each completed search
+        """
+        if flex_days > self.MAX_FLEX_DAYS:
+            logger.warning(f"Flexible window of {flex_days} days clamped to {self.MAX_FLEX_DAYS}")
+            flex_days = self.MAX_FLEX_DAYS
+        center = self._parse_date(date)
+        dates = [(center + timedelta(days=offset)).strftime("%Y/%m/%d") for offset in range(-flex_days, flex_days + 1)]
+        searches = [
+            (departure, arrival, day)
+            for departure, arrival in product(departure_airports, arrival_airports)
+            if departure != arrival
+            for day in dates
+        ]
+        
+        futures = {self.search_executor.submit(self.get_flights, *search): search for search in searches}
+        try:
+            for future in as_completed(futures):
+                departure, arrival, day = futures[future]
+                yield departure, arrival, day, future.result()
+        finally:
+            # A consumer that stops early shouldn't leave queued searches behind
+            for future in futures:
+                future.cancel()
+    
+    def iter_flexible(self, departure_airports, arrival_airports, date, flex_days=0, sort_by="duration", limit=10):
+        """
+        Search airport pairs over a date window, yielding the ranking so far as each search completes
+        
+        Args:
+            sort_by (str): "duration" or "departure"
+            limit (int): Maximum flights ranked, None for all
+            
+        Yields:
+            tuple: (departure_airport, arrival_airport, date, flights, best) where best is the
+                top limit flights of every search completed so far, best first
+        """
+        key = self.SORT_KEYS[sort_by]
+        best = []
+        for departure, arrival, day, flights in self.iter_flight_options(departure_airports, arrival_airports,
+                                                                         date, flex_days):
+            if flights:
+                # Only the current top limit flights are kept, so memory stays bounded
+                merged = heapq.merge(best, sorted(flights, key=key), key=key)
+                best = list(islice(merged, limit))
+            yield departure, arrival, day, flights, best
+
+    def search_flexible(self, departure_airports, arrival_airports, date, flex_days=0, sort_by="duration", limit=10):
+        """
+        Search airport pairs over a date window and return one ranked list
+        
+        Args:
+            sort_by (str): "duration" or "departure"
+            limit (int): Maximum flights returned, None for all
+            
+        Returns:
+            list: Flights in get_flights shape, best first
+        """
+        best = []
+        for *_, best in self.iter_flexible(departure_airports, arrival_airports, date, flex_days, sort_by, limit):
+            pass
+        return best
+    
+    def nearest_airports(self, lat, lng, k=3, max_radius_km=300):
+        """Find the airports closest to a location, using the offline index"""
+        if not self.airport_index:
+            return []
+        return self.airport_index.nearest(lat, lng, k=k, max_radius_km=max_radius_km)
+    
     def search_airports(self, query):
         """Search for airports by name or city"""
+        # The offline index answers without an upstream request
+        if self.airport_index:
+            airports = self.airport_index.search(query)
+            if airports:
+                return airports
+        
         if not (self.app_id and self.app_key):
             logger.warning("FlightStats credentials not provided, returning simulated airport data")
             # Return some simulated data for demo purposes
@@ -621,7 +2651,7 @@ class FlightService:
                 "appKey": self.app_key
             }
             
-            response = requests.get(url, params=params)
+            response = self.transport.get(url, params=params)
             response.raise_for_status()
             data = response.json()
             
@@ -658,9 +2688,13 @@ class FlightService:
             airlines = ["AA", "UA", "DL", "BA", "LH", "AF", "JL", "NH"]
             flight_numbers = ["101", "202", "303", "404", "505", "606", "707", "808"]
             
-            # Generate a few simulated flights
+            # Generate a few simulated flights, on the requested date when it parses
+            try:
+                base_time = self._parse_date(date).replace(hour=8)
+            except ValueError:
+                base_time = datetime.now() + timedelta(days=1)
             for i in range(3):
-                departure_time = datetime.now() + timedelta(days=1, hours=i*3)
+                departure_time = base_time + timedelta(hours=i*3)
                 arrival_time = departure_time + timedelta(hours=flight_time)
                 
                 flights.append({
@@ -690,7 +2724,7 @@ class FlightService:
                 "appKey": self.app_key
             }
             
-            response = requests.get(url, params=params)
+            response = self.transport.get(url, params=params)
             response.raise_for_status()
             data = response.json()
             
@@ -725,8 +2759,55 @@ class FlightService:
 class WeatherService:
     """Service for fetching weather information"""
     
-    def __init__(self, api_key=WEATHER_API_KEY):
+    # Forecasts are shared by everyone in a grid cell (0.1 degrees is about 11 km)
+    GRID_DEGREES = 0.1
+    # The provider's forecast models are rerun every few hours, on UTC boundaries
+    MODEL_RUN_HOURS = 6
+    
+    def __init__(self, api_key=WEATHER_API_KEY, transport=None, single_flight=None, cache=None,
+                 grid_degrees=GRID_DEGREES, model_run_hours=MODEL_RUN_HOURS):
+        """
+        Args:
+            api_key (str): OpenWeatherMap API key
+            transport (HTTPTransport): Shared HTTP transport, defaults to the process-wide one
+            single_flight (SingleFlight): Coalesces identical in-flight requests
+            cache (ResponseCache): Cache for full daily forecasts, defaults to a private one
+            grid_degrees (float): Size of the lat/lng cells forecasts are shared across
+            model_run_hours (int): Hours between provider model runs; cached forecasts expire
+                at the next run
+        """
         self.api_key = api_key
+        self.transport = transport or get_default_transport()
+        self.single_flight = single_flight or SingleFlight()
+        self.grid_degrees = grid_degrees
+        self.model_run_seconds = model_run_hours * 3600
+        self.cache = cache or ResponseCache(max_size=2048, ttls={"forecast": self.model_run_seconds})
+        # Called with a grid cell whenever its forecast is fetched anew
+        self.refresh_listeners = []
+    
+    def forecast_epoch(self, now=None):
+        """Return the index of the provider model run the current forecasts come from"""
+        now = time.time() if now is None else now
+        return int(now // self.model_run_seconds)
+    
+    def grid_cell(self, lat, lng):
+        """Return the grid cell whose shared forecast serves (lat, lng)"""
+        return self._grid_cell(lat, lng)[0]
+    
+    def has_forecast(self, lat, lng):
+        """Return whether today's forecast for (lat, lng) is cached, i.e. get_forecast there isn't degraded"""
+        if not self.api_key:
+            return True
+        key = (self.grid_cell(lat, lng), time.strftime("%Y-%m-%d", time.gmtime()))
+        return self.cache.get("forecast", key, _MISSING) is not _MISSING
+    
+    def _grid_cell(self, lat, lng):
+        """Quantize a coordinate to its grid cell and return (cell, cell center lat, cell center lng)"""
+        row = math.floor((lat + 90) / self.grid_degrees)
+        col = math.floor(((lng + 180) % 360) / self.grid_degrees)
+        center_lat = round(-90 + (row + 0.5) * self.grid_degrees, 4)
+        center_lng = round(-180 + (col + 0.5) * self.grid_degrees, 4)
+        return (row, col), center_lat, center_lng
     
     def get_forecast(self, lat, lng, days=7):
         """Get weather forecast for a location"""
@@ -756,38 +2837,118 @@ class WeatherService:
             return forecast
                 
         try:
-            url = "https://api.openweathermap.org/data/2.5/onecall"
-            params = {
-                "lat": lat,
-                "lon": lng,
-                "exclude": "current,minutely,hourly,alerts",
-                "units": "metric",
-                "appid": self.api_key
-            }
-            
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            forecast = []
-            for day in data.get("daily", [])[:days]:
-                date = datetime.fromtimestamp(day.get("dt", 0)).strftime("%Y-%m-%d")
-                
-                forecast.append({
-                    "date": date,
-                    "temp": day.get("temp", {}).get("day", 0),
-                    "temp_min": day.get("temp", {}).get("min", 0),
-                    "temp_max": day.get("temp", {}).get("max", 0),
-                    "conditions": day.get("weather", [{}])[0].get("main", ""),
-                    "description": day.get("weather", [{}])[0].get("description", ""),
-                    "precipitation_probability": day.get("pop", 0) * 100
-                })
-            
-            return forecast
+            # One full forecast per grid cell and UTC day, sliced to the requested length
+            now = time.time()
+            cell, center_lat, center_lng = self._grid_cell(lat, lng)
+            key = (cell, time.strftime("%Y-%m-%d", time.gmtime(now)))
+            forecast = self.cache.get("forecast", key, _MISSING)
+            if forecast is _MISSING:
+                # Expire at the next model run rather than a fixed time after fetching
+                ttl = (self.forecast_epoch(now) + 1) * self.model_run_seconds - now
+                forecast = self.single_flight.do(
+                    ("forecast", key), lambda: self._fetch_forecast(key, center_lat, center_lng, ttl)
+                )
+            return [dict(day) for day in forecast[:days]]
         except Exception as e:
             logger.error(f"Error getting weather forecast: {str(e)}")
             return []
 
+    def _fetch_forecast(self, key, lat, lng, ttl):
+        """Request the full daily forecast for a grid cell from OpenWeatherMap and cache it"""
+        url = "https://api.openweathermap.org/data/2.5/onecall"
+        params = {
+            "lat": lat,
+            "lon": lng,
+            "exclude": "current,minutely,hourly,alerts",
+            "units": "metric",
+            "appid": self.api_key
+        }
+        
+        response = self.transport.get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+        
+        forecast = []
+        for day in data.get("daily", []):
+            date = datetime.fromtimestamp(day.get("dt", 0)).strftime("%Y-%m-%d")
+            
+            forecast.append({
+                "date": date,
+                "temp": day.get("temp", {}).get("day", 0),
+                "temp_min": day.get("temp", {}).get("min", 0),
+                "temp_max": day.get("temp", {}).get("max", 0),
+                "conditions": day.get("weather", [{}])[0].get("main", ""),
+                "description": day.get("weather", [{}])[0].get("description", ""),
+                "precipitation_probability": day.get("pop", 0) * 100
+            })
+        
+        self.cache.set("forecast", key, forecast, ttl=ttl)
+        for listener in self.refresh_listeners:
+            listener(key[0])
+        return forecast
+
+
+class AsyncLocationService:
+    """Asyncio counterpart of LocationService returning the same result shapes
+    
+    Blocking calls run in worker threads so they keep using the wrapped service's
+    pooled transport and response cache.
+    """
+    
+    def __init__(self, location_service=None, **kwargs):
+        self.service = location_service or LocationService(**kwargs)
+    
+    async def search_destinations(self, query, max_rows=10, feature_class="P", feature_code=None):
+        return await asyncio.to_thread(self.service.search_destinations, query, max_rows, feature_class, feature_code)
+    
+    async def get_nearby_places(self, lat, lng, radius=10, max_rows=10, feature_class="P"):
+        return await asyncio.to_thread(self.service.get_nearby_places, lat, lng, radius, max_rows, feature_class)
+    
+    async def get_country_info(self, country_name):
+        return await asyncio.to_thread(self.service.get_country_info, country_name)
+
+
+class AsyncRouteService:
+    """Asyncio counterpart of RouteService returning the same result shapes"""
+    
+    def __init__(self, route_service=None, **kwargs):
+        self.service = route_service or RouteService(**kwargs)
+    
+    async def geocode(self, query):
+        return await asyncio.to_thread(self.service.geocode, query)
+    
+    async def get_directions(self, start_point, end_point, profile="foot-walking"):
+        return await asyncio.to_thread(self.service.get_directions, start_point, end_point, profile)
+    
+    async def get_places_of_interest(self, center_point, radius=2000, categories=None):
+        return await asyncio.to_thread(self.service.get_places_of_interest, center_point, radius, categories)
+    
+    async def get_distance_matrix(self, points, profile="foot-walking"):
+        return await asyncio.to_thread(self.service.get_distance_matrix, points, profile)
+
+
+class AsyncFlightService:
+    """Asyncio counterpart of FlightService returning the same result shapes"""
+    
+    def __init__(self, flight_service=None, **kwargs):
+        self.service = flight_service or FlightService(**kwargs)
+    
+    async def search_airports(self, query):
+        return await asyncio.to_thread(self.service.search_airports, query)
+    
+    async def get_flights(self, departure_airport, arrival_airport, date):
+        return await asyncio.to_thread(self.service.get_flights, departure_airport, arrival_airport, date)
+
+
+class AsyncWeatherService:
+    """Asyncio counterpart of WeatherService returning the same result shapes"""
+    
+    def __init__(self, weather_service=None, **kwargs):
+        self.service = weather_service or WeatherService(**kwargs)
+    
+    async def get_forecast(self, lat, lng, days=7):
+        return await asyncio.to_thread(self.service.get_forecast, lat, lng, days)
+
 
 # Initialize document store with explicit parameters
 document_store = InMemoryDocumentStore(use_bm25=True, similarity="cosine")
@@ -829,39 +2990,529 @@ class ResponseTemplates:
         template = random.choice(self.itinerary)
         return template.replace("{destination}", destination).replace("{days}", str(days))
 
+class Activity:
+    """One line of an itinerary, referencing the place it visits when there is one"""
+    __slots__ = ("description", "place")
+
+    def __init__(self, description, place=None):
+        self.description = description
+        self.place = place
+
+    def to_dict(self):
+        return {"description": self.description, "place": self.place}
+
+
+class ItinerarySlot:
+    """The activities planned for one part of a day"""
+    __slots__ = ("period", "activities")
+
+    def __init__(self, period, activities=None):
+        self.period = period
+        self.activities = activities or []
+
+    def to_text(self):
+        return f"{self.period}:\n" + "".join(f"- {activity.description}\n" for activity in self.activities)
+
+    def to_dict(self):
+        return {"period": self.period, "activities": [activity.to_dict() for activity in self.activities]}
+
+
+class ItineraryDay:
+    """One day of an itinerary: its forecast and its morning, afternoon and evening slots"""
+    __slots__ = ("number", "weather", "slots")
+
+    def __init__(self, number, weather=None, slots=None):
+        self.number = number
+        self.weather = weather
+        self.slots = slots or []
+
+    def to_text(self):
+        parts = [f"\nDay {self.number}"]
+        if self.weather:
+            parts.append(f" - Weather: {self.weather['conditions']}, {self.weather['temp_min']}°C to {self.weather['temp_max']}°C")
+        parts.append(":\n")
+        parts.append("\n".join(slot.to_text() for slot in self.slots))
+        return "".join(parts)
+
+    def to_dict(self):
+        return {"day": self.number, "weather": self.weather, "slots": [slot.to_dict() for slot in self.slots]}
+
+
+class Itinerary:
+    """Structured itinerary, holding the resolved destination and rendered only on demand"""
+    __slots__ = ("destination", "days", "day_plans", "tips", "country_info", "note")
+
+    def __init__(self, destination, days, day_plans=None, tips=None, country_info=None, note=None):
+        self.destination = destination
+        self.days = days
+        self.day_plans = day_plans or []
+        self.tips = tips or []
+        self.country_info = country_info
+        self.note = note
+
+    def header_text(self):
+        return f"\n{self.days}-Day Itinerary for {self.destination['name']}, {self.destination['country']}:\n"
+
+    def tips_text(self):
+        return f"\nTravel Tips for {self.destination['name']}:\n" + "".join(f"- {tip}\n" for tip in self.tips)
+
+    def to_text(self):
+        parts = [self.header_text()]
+        parts.extend(day.to_text() for day in self.day_plans)
+        parts.append(self.tips_text())
+        if self.note:
+            parts.append(f"\n\n{self.note}")
+        return "".join(parts)
+
+    __str__ = to_text
+
+    def to_dict(self):
+        return {
+            "destination": self.destination,
+            "days": self.days,
+            "day_plans": [day.to_dict() for day in self.day_plans],
+            "tips": list(self.tips),
+            "country_info": self.country_info,
+            "note": self.note
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), default=str, **kwargs)
+
+
+class DestinationOption:
+    """One recommended destination of a trip plan"""
+    __slots__ = ("destination", "nearby", "daily_budget", "preview")
+
+    def __init__(self, destination, nearby, daily_budget, preview):
+        self.destination = destination
+        self.nearby = nearby
+        self.daily_budget = daily_budget
+        self.preview = preview
+
+    def to_text(self, number, budget=None):
+        dest = self.destination
+        lines = [f"Option {number}: {dest['name']}, {dest['country']}\n"]
+        
+        # Add nearby attractions if available
+        if self.nearby:
+            lines.append(f"  - Nearby attractions: {', '.join(self.nearby)}\n")
+        
+        # Add population info if available
+        if dest.get("population", 0) > 0:
+            lines.append(f"  - Population: {dest['population']:,}\n")
+        
+        # Add activities if available
+        if "activities" in dest and dest["activities"]:
+            activities = dest["activities"][:3]  # Limit to 3 activities
+            lines.append(f"  - Top activities: {', '.join(activities)}\n")
+        
+        lines.append(f"  - Estimated daily cost: ${self.daily_budget} per person\n")
+        lines.append(f"  - Budget level: {dest.get('budget_level', 'medium').title()}\n")
+        
+        # Add budget assessment if user specified a budget
+        if budget:
+            total_trip_cost = self.daily_budget * 7  # Assume a 7-day trip
+            if total_trip_cost <= budget * 0.7:
+                lines.append(f"  - Budget assessment: Excellent value for your ${budget} budget\n")
+            elif total_trip_cost <= budget:
+                lines.append(f"  - Budget assessment: Good match for your ${budget} budget\n")
+            else:
+                lines.append(f"  - Budget assessment: May be tight for your ${budget} budget\n")
+        
+        lines.append(f"\n  Sample itinerary preview:\n")
+        lines.append(self.preview)
+        lines.append("\n\n")
+        return "".join(lines)
+
+    def to_dict(self):
+        return {
+            "destination": self.destination,
+            "nearby": self.nearby,
+            "daily_budget": self.daily_budget,
+            "preview": self.preview
+        }
+
+
+class TripPlan:
+    """Structured destination recommendations, rendered only on demand"""
+    __slots__ = ("intro", "budget", "options", "follow_up")
+
+    def __init__(self, intro, options, follow_up, budget=None):
+        self.intro = intro
+        self.options = options
+        self.follow_up = follow_up
+        self.budget = budget
+
+    def to_text(self):
+        parts = [f"{self.intro}\n\n"]
+        parts.extend(option.to_text(i, self.budget) for i, option in enumerate(self.options, 1))
+        parts.append(self.follow_up)
+        return "".join(parts)
+
+    __str__ = to_text
+
+    def to_dict(self):
+        return {
+            "intro": self.intro,
+            "budget": self.budget,
+            "options": [option.to_dict() for option in self.options],
+            "follow_up": self.follow_up
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), default=str, **kwargs)
+
+
+class ItineraryCache:
+    """Memory-bounded LRU cache of built itineraries
+    
+    Entries are keyed by (destination id, days, forecast epoch) and record the
+    upstream data they were built from, e.g. ("forecast", cell) or ("poi_tile", geohash),
+    so a refresh of that data drops exactly the itineraries that used it.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        """
+        Args:
+            max_bytes (int): Approximate memory budget for cached itineraries
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dependents = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def destination_id(dest):
+        """Canonical id of a destination, so different spellings of one place share entries"""
+        return f"{normalize_place_name(dest.get('name', ''))}|{normalize_place_name(dest.get('country', ''))}"
+
+    @staticmethod
+    def _weight(itinerary):
+        # The rendered text is a fair proxy for the records behind it, plus a fixed overhead
+        return sys.getsizeof(itinerary.to_text()) + 64 * sum(len(day.slots) for day in itinerary.day_plans) + 256
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, itinerary, dependencies=()):
+        """Cache itinerary under key, evicting least recently used entries beyond max_bytes"""
+        weight = self._weight(itinerary)
+        if weight > self.max_bytes:
+            return
+        dependencies = tuple(dependencies)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (itinerary, weight, dependencies)
+            self.size += weight
+            for dependency in dependencies:
+                self._dependents[dependency].add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= entry[1]
+        for dependency in entry[2]:
+            keys = self._dependents.get(dependency)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._dependents[dependency]
+
+    def invalidate(self, dependency=None):
+        """Drop the itineraries built from dependency, or every itinerary if None"""
+        with self._lock:
+            if dependency is None:
+                self._entries.clear()
+                self._dependents.clear()
+                self.size = 0
+                return
+            for key in list(self._dependents.get(dependency, ())):
+                self._remove(key)
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
+
+
+class IntentRouter:
+    """Classifies a query and extracts its slots in one pass over precompiled patterns
+    
+    Place-name checks run against local data (corpus names, the fallback cities, the
+    offline gazetteer and the country table). Only without a gazetteer, where local data
+    knows few cities, does an unrecognized bare query fall back to place_lookup.
+    """
+
+    # Checked in priority order: when several match, the earliest intent listed wins
+    INTENT_PATTERNS = [
+        ("destination_search", r"where to go|recommend destinations|suggest places|where should I visit"),
+        ("itinerary_request", r"itinerary for|travel plan for|things to do in|activities in|visit|go to"),
+        ("flight_search", r"flights from|flights to|flights between"),
+        ("weather_info", r"weather in|weather forecast for|climate in"),
+        ("travel_recommendations", r"recommend|suggest|looking for|\$\d+|budget of|within budget"),
+        ("excursion_search", r"excursions in|things to do in|activities in|attractions in|places to visit in")
+    ]
+    # Phrases that start a new topic rather than follow up on the conversation
+    NEW_TOPIC_PATTERN = re.compile(
+        r"where to go|recommend destinations|suggest places|itinerary for|travel plan for|flights from|weather in",
+        re.IGNORECASE
+    )
+    LOCATION_PATTERNS = {
+        "itinerary_request": re.compile(
+            r"(?:itinerary for|travel plan for|things to do in|activities in|visit|go to)\s+(?:the\s+)?([\w\s,]+)",
+            re.IGNORECASE
+        ),
+        "excursion_search": re.compile(
+            r"(?:excursions in|things to do in|activities in|attractions in|places to visit in)\s+(?:the\s+)?([\w\s,]+)",
+            re.IGNORECASE
+        ),
+        "weather_info": re.compile(r"(?:weather (?:in|forecast for|for)|climate in)\s+([\w\s]+)", re.IGNORECASE)
+    }
+    FLIGHT_PATTERN = re.compile(r"flights from\s+([\w\s]+)\s+to\s+([\w\s]+)", re.IGNORECASE)
+    DAYS_PATTERN = re.compile(r"(\d+)\s+days?", re.IGNORECASE)
+    DATE_PATTERN = re.compile(r"on\s+(\d{1,2}/\d{1,2}/\d{4}|\d{4}-\d{2}-\d{2})", re.IGNORECASE)
+    BUDGET_PATTERN = re.compile(
+        r"\$\s*(\d[\d,]*)|(\d[\d,]*)\s*(?:dollars|usd)\b|budget of\s+(\d[\d,]*)", re.IGNORECASE
+    )
+    FLEX_PATTERN = re.compile(r"(?:\+/-|±)\s*(\d+)\s*days?|\b(flexible)\b", re.IGNORECASE)
+    # Trailing day counts, dates and qualifiers that are not part of a place name
+    SLOT_TAIL_PATTERN = re.compile(
+        r"\s+(?:(?:for\s+)?\d+\s+days?\b|on\s+\d|in\s+\d|(?:flexible|with|under|within)\b).*$",
+        re.IGNORECASE | re.DOTALL
+    )
+    SLOT_HEAD_PATTERN = re.compile(r"^(?:in|to)\s+", re.IGNORECASE)
+
+    def __init__(self, place_names=(), gazetteer=None, country_table=None, place_lookup=None):
+        """
+        Args:
+            place_names (iterable): Names recognized as places, in addition to the fallback cities
+            gazetteer (LocalGazetteer): Offline gazetteer consulted for other place names
+            country_table (CountryTable): Country names and codes recognized as places
+            place_lookup (callable): place_lookup(text) returning matching destinations, used
+                for unrecognized place names when there is no gazetteer
+        """
+        # Every intent is tried at every position through a zero-width lookahead, so one
+        # scan finds overlapping phrases (e.g. "visit" inside "places to visit in")
+        alternatives = "|".join(f"(?P<{name}>{pattern})" for name, pattern in self.INTENT_PATTERNS)
+        self._intent_pattern = re.compile(f"(?=(?:{alternatives}))", re.IGNORECASE)
+        self._priority = {name: i for i, (name, _) in enumerate(self.INTENT_PATTERNS)}
+        self.gazetteer = gazetteer
+        self.country_table = country_table
+        self.place_lookup = place_lookup
+        self.place_names = {normalize_place_name(name) for name in FALLBACK_CITIES}
+        self.add_place_names(place_names)
+        # Country names known without the country table, for "City, Country" queries
+        self.country_names = {normalize_place_name(city[key]) for city in FALLBACK_CITIES.values()
+                              for key in ("country", "country_code")}
+        if gazetteer is not None:
+            self.country_names.update(normalize_place_name(name) for pair in gazetteer.countries for name in pair)
+
+    def add_place_names(self, names):
+        """Recognize more names as places"""
+        self.place_names.update(normalize_place_name(name) for name in names if name)
+
+    def is_place(self, text):
+        """Check whether text names a place, such as "Lisbon" or "Paris, France" (city, country)"""
+        text = text.strip(" ,.?!")
+        parts = [part for part in text.split(",") if part.strip()]
+        if not parts:
+            return False
+        # "City, Country": the head must be a known place and the tail a country
+        if self._is_known_place(parts[0]) and (len(parts) == 1 or self._is_country(parts[-1])):
+            return True
+        
+        # Without an offline gazetteer only a few cities are known locally, so ask the
+        # place lookup like the destination search does
+        if self.gazetteer is None and self.place_lookup is not None:
+            try:
+                return bool(self.place_lookup(text))
+            except Exception as e:
+                logger.warning(f"Place lookup failed for {text!r}: {e}")
+        return False
+
+    def _is_known_place(self, text):
+        """Check, without network calls, whether text names a known place"""
+        name = normalize_place_name(text)
+        if not name:
+            return False
+        if name in self.place_names:
+            return True
+        if self.gazetteer is not None and self.gazetteer.contains_name(name):
+            return True
+        return self._is_country(name)
+
+    def _is_country(self, text):
+        name = normalize_place_name(text)
+        if name in self.country_names:
+            return True
+        return self.country_table is not None and self.country_table.lookup(name) is not None
+
+    def starts_new_topic(self, query):
+        return self.NEW_TOPIC_PATTERN.search(query) is not None
+
+    def classify(self, query):
+        """Return the highest-priority intent whose phrase occurs in query, or None"""
+        best = None
+        for match in self._intent_pattern.finditer(query):
+            intent = match.lastgroup
+            if best is None or self._priority[intent] < self._priority[best]:
+                best = intent
+                if self._priority[best] == 0:
+                    break
+        return best
+
+    def _clean_place(self, text):
+        text = self.SLOT_TAIL_PATTERN.sub("", text.strip())
+        text = self.SLOT_HEAD_PATTERN.sub("", text)
+        return text.strip(" ,") or None
+
+    def route(self, query):
+        """
+        Parse a query into its intent and slots
+        
+        Returns:
+            dict: intent plus destination, origin, days, budget, date and flexible_days
+                (None or 0 when not given)
+        """
+        intent = self.classify(query)
+        if intent is None:
+            # A bare place name asks for an itinerary
+            intent = "itinerary_request" if self.is_place(query) else "travel_recommendations"
+        
+        days_match = self.DAYS_PATTERN.search(query)
+        date_match = self.DATE_PATTERN.search(query)
+        budget_match = self.BUDGET_PATTERN.search(query)
+        flex_match = self.FLEX_PATTERN.search(query)
+        budget = None
+        if budget_match:
+            budget = int(next(group for group in budget_match.groups() if group).replace(",", ""))
+        flexible_days = 0
+        if flex_match:
+            flexible_days = int(flex_match.group(1)) if flex_match.group(1) else 3
+        
+        route = {
+            "intent": intent,
+            "destination": None,
+            "origin": None,
+            "days": int(days_match.group(1)) if days_match else None,
+            "budget": budget,
+            "date": date_match.group(1) if date_match else None,
+            "flexible_days": flexible_days
+        }
+        
+        if intent == "flight_search":
+            flight_match = self.FLIGHT_PATTERN.search(query)
+            if flight_match:
+                route["origin"] = self._clean_place(flight_match.group(1))
+                route["destination"] = self._clean_place(flight_match.group(2))
+        elif intent in self.LOCATION_PATTERNS:
+            location_match = self.LOCATION_PATTERNS[intent].search(query)
+            if location_match:
+                route["destination"] = self._clean_place(location_match.group(1))
+            elif intent == "itinerary_request":
+                # The query itself is the destination
+                route["destination"] = query.strip()
+        return route
+
+
 class TripPlanner:
     """Main class for planning trips and generating itineraries"""
     
-    def __init__(self):
-        self.location_service = LocationService(username="curiousclump")  # Add your username here
-        self.route_service = RouteService()
-        self.flight_service = FlightService()
-        self.weather_service = WeatherService()
+    # Replies that ask to expand on the previous response
+    FOLLOW_UP_REPLIES = ('yes', 'more', 'sure', 'please')
+    
+    def __init__(self, transport=None, max_workers=8, enrichment_concurrency=4, snapshot_path=None,
+                 warm_models=True, gazetteer=None, airport_index=None, itinerary_cache=None, use_reader=True):
+        """
+        Args:
+            transport (HTTPTransport): Shared HTTP transport, defaults to the process-wide one
+            max_workers (int): Size of the thread pool used for concurrent upstream lookups
+            enrichment_concurrency (int): Maximum per-destination lookups in flight for one query
+            snapshot_path (str): Prebuilt destination snapshot to load instead of calling the network,
+                defaults to DESTINATION_SNAPSHOT_PATH; an empty string always fetches fresh data
+            warm_models (bool): Start loading the ML models in the background right away,
+                instead of on the first query
+            gazetteer (LocalGazetteer): Offline gazetteer for destination lookups, defaults to
+                the index at GEONAMES_GAZETTEER_PATH if one is configured
+            airport_index (AirportIndex): Offline airport index, defaults to the airports.csv
+                at AIRPORTS_PATH if one is configured
+            itinerary_cache (ItineraryCache): Cache of built itineraries, defaults to a private one
+            use_reader (bool): Load the FARM reader when haystack provides one
+        """
+        if gazetteer is None and GEONAMES_GAZETTEER_PATH:
+            gazetteer = LocalGazetteer.open(GEONAMES_GAZETTEER_PATH)
+        if airport_index is None and AIRPORTS_PATH:
+            airport_index = AirportIndex.open(AIRPORTS_PATH)
+        
+        # One pooled transport serves every upstream service of this planner
+        self.transport = transport or get_default_transport()
+        self.location_service = LocationService(username="curiousclump", transport=self.transport,  # Add your username here
+                                                gazetteer=gazetteer)
+        self.route_service = RouteService(transport=self.transport)
+        self.flight_service = FlightService(transport=self.transport, airport_index=airport_index)
+        self.weather_service = WeatherService(transport=self.transport)
+        
+        # Built itineraries, dropped when the forecast or POI data behind them is refreshed
+        self.itinerary_cache = itinerary_cache if itinerary_cache is not None else ItineraryCache()
+        self.weather_service.refresh_listeners.append(
+            lambda cell: self.itinerary_cache.invalidate(("forecast", cell))
+        )
+        self.route_service.refresh_listeners.append(
+            lambda tile: self.itinerary_cache.invalidate(("poi_tile", tile))
+        )
+        
+        # Async views over the same clients, sharing their transport and caches
+        self.async_location_service = AsyncLocationService(self.location_service)
+        self.async_route_service = AsyncRouteService(self.route_service)
+        self.async_flight_service = AsyncFlightService(self.flight_service)
+        self.async_weather_service = AsyncWeatherService(self.weather_service)
+        
+        # Bounded pool for fanning out independent upstream lookups
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trip-planner")
+        self.enrichment_concurrency = enrichment_concurrency
         self.document_store = document_store
         self.templates = ResponseTemplates()
+        self.router = IntentRouter(
+            gazetteer=gazetteer, country_table=self.location_service.countries,
+            place_lookup=lambda text: self.location_service.search_destinations(text, max_rows=1)
+        )
+        # Structured result (Itinerary or TripPlan) behind the last response, for follow-ups
+        self.last_result = None
+        self._last_result_text = None
         
         # Initialize retriever after documents are loaded to ensure index exists
         self.search_pipeline = None
         self.retriever = None
         
-        # Add a reader if available (for more advanced question answering)
+        # Add a reader if available (for more advanced question answering).
+        # It loads in the background; queries run retriever-only until it is ready.
         self.reader = None
-        if has_reader:
-            try:
-                # First check if sentence_transformers is available
-                try:
-                    import sentence_transformers
-                    self.reader = FARMReader(model_name_or_path="deepset/roberta-base-squad2", use_gpu=False)
-                    logger.info("Reader successfully initialized.")
-                except ImportError:
-                    logger.warning("Missing dependency: sentence_transformers. Run 'pip install sentence_transformers'.")
-                    logger.info("Running with retriever only mode.")
-            except Exception as e:
-                logger.error(f"Reader could not be initialized due to: {e}")
-                logger.info("Running with retriever only mode.")
+        self.reader_model = (BackgroundModel("Reader", self._load_reader, start=warm_models)
+                             if has_reader and use_reader else None)
+        self._pipeline_lock = threading.Lock()
         
-        # Load destination data
-        self.update_destination_data()
+        # Load destination data, preferring a prebuilt snapshot over network calls
+        if snapshot_path is None:
+            snapshot_path = DESTINATION_SNAPSHOT_PATH
+        if not (snapshot_path and self.load_snapshot(snapshot_path)):
+            self.update_destination_data()
+        self._index_place_names()
         
         # Initialize retriever and pipeline after documents are loaded
         self.retriever = BM25Retriever(document_store=self.document_store)
@@ -870,12 +3521,80 @@ class TripPlanner:
         self.search_pipeline = Pipeline()
         self.search_pipeline.add_node(component=self.retriever, name="Retriever", inputs=["Query"])
         
-        # Add reader to pipeline if available
-        if self.reader:
-            self.search_pipeline.add_node(component=self.reader, name="Reader", inputs=["Retriever"])
+        # Add reader to pipeline once it has loaded
+        if self.reader_model:
+            self.reader_model.on_ready(self._attach_reader)
+
+    @staticmethod
+    def _load_reader():
+        """Build the FARM reader, or return None if its dependencies are missing"""
+        # First check if sentence_transformers is available
+        try:
+            import sentence_transformers
+        except ImportError:
+            logger.warning("Missing dependency: sentence_transformers. Run 'pip install sentence_transformers'.")
+            logger.info("Running with retriever only mode.")
+            return None
+        return FARMReader(model_name_or_path="deepset/roberta-base-squad2", use_gpu=False)
+
+    def _attach_reader(self, reader):
+        """Switch the search pipeline to retriever + reader once the reader has loaded"""
+        pipeline = Pipeline()
+        pipeline.add_node(component=self.retriever, name="Retriever", inputs=["Query"])
+        pipeline.add_node(component=reader, name="Reader", inputs=["Retriever"])
+        with self._pipeline_lock:
+            self.reader = reader
+            self.search_pipeline = pipeline
+        logger.info("Reader successfully initialized.")
+
+    def _start_models(self):
+        """Start loading any models that were not warmed at startup"""
+        if self.reader_model:
+            self.reader_model.start()
+
+    def wait_for_models(self, timeout=None):
+        """Block until background model loading has finished; returns True if all models are ready"""
+        if not self.reader_model:
+            return True
+        return self.reader_model.get(wait=True, timeout=timeout) is not None
 
-    def _show_destination_details(self, last_response):
+    def close(self):
+        """Shut down the planner's worker threads"""
+        self.executor.shutdown(wait=False)
+        self.route_service.close()
+        self.flight_service.close()
+        self.location_service.countries.stop()
+
+    def _map_concurrently(self, func, items, limit=None):
+        """Apply func to each item on the shared thread pool, returning results in input order"""
+        items = list(items)
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        
+        if limit:
+            gate = threading.BoundedSemaphore(limit)
+            
+            def gated(item):
+                with gate:
+                    return func(item)
+            
+            return list(self.executor.map(gated, items))
+        return list(self.executor.map(func, items))
+
+    def _remember(self, result):
+        """Keep a structured result for follow-ups and return its text"""
+        if isinstance(result, str):
+            return result
+        self.last_result = result
+        self._last_result_text = result.to_text()
+        return self._last_result_text
+
+    def _show_destination_details(self, last_response, previous=None):
         """Show detailed information about the first recommended destination from the last response."""
+        # Reuse the resolved destination when the last response came from a trip plan
+        if isinstance(previous, TripPlan) and previous.options:
+            return self.build_itinerary(previous.options[0].destination, days=3)
+        
         # Extract the first destination from the last response
         match = re.search(r"Option 1: ([\w\s]+), ([\w\s]+)", last_response)
         if not match:
@@ -887,8 +3606,19 @@ class TripPlanner:
         # Generate a detailed itinerary for this destination
         return self.generate_itinerary(destination_name, days=3)
 
-    def _expand_itinerary(self, last_response):
+    def _expand_itinerary(self, last_response, previous=None):
         """Expand the itinerary with more details."""
+        note = "I've expanded the itinerary to 5 days with more detailed activities and recommendations."
+        
+        # Reuse the resolved destination when the last response was a structured itinerary
+        if isinstance(previous, Itinerary):
+            expanded = self.build_itinerary(previous.destination, days=5)
+            if isinstance(expanded, Itinerary):
+                # A copy, since the built itinerary may be shared through the itinerary cache
+                expanded = Itinerary(expanded.destination, expanded.days, expanded.day_plans, expanded.tips,
+                                     expanded.country_info, note=note)
+            return expanded
+        
         # Extract the destination from the last response
         match = re.search(r"Itinerary for ([\w\s]+),", last_response)
         if not match:
@@ -897,7 +3627,7 @@ class TripPlanner:
         destination_name = match.group(1).strip()
         
         # Generate a more detailed itinerary with more days
-        return self.generate_itinerary(destination_name, days=5) + "\n\nI've expanded the itinerary to 5 days with more detailed activities and recommendations."
+        return self.generate_itinerary(destination_name, days=5) + f"\n\n{note}"
     
     def update_destination_data(self):
         """Update destination data in the document store with popular destinations"""
@@ -1000,8 +3730,95 @@ class TripPlanner:
                 except Exception as e2:
                     logger.error(f"Error writing documents to store: {e2}")
     
+    @staticmethod
+    def _document_to_dict(doc):
+        """Serialize a document, including any embedding, to JSON-compatible data"""
+        embedding = doc.embedding
+        if embedding is not None and hasattr(embedding, "tolist"):
+            embedding = embedding.tolist()
+        return {
+            "id": doc.id,
+            "content": doc.content,
+            "meta": doc.meta,
+            "embedding": embedding
+        }
+
+    @staticmethod
+    def _document_from_dict(data):
+        """Rebuild a document written by _document_to_dict"""
+        embedding = data.get("embedding")
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype="float32")
+        return Document(content=data["content"], meta=data.get("meta") or {}, id=data.get("id"), embedding=embedding)
+
+    def save_snapshot(self, path):
+        """Write the current destination corpus to a versioned snapshot file"""
+        docs = self.document_store.get_all_documents(return_embedding=True)
+        payload = {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "created_at": datetime.now().isoformat(),
+            "document_count": len(docs),
+            "documents": [self._document_to_dict(doc) for doc in docs]
+        }
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        
+        # Write to a temporary file first so readers never see a partial snapshot
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, default=str)
+        os.replace(tmp_path, path)
+        
+        logger.info(f"Saved {len(docs)} documents to snapshot {path}")
+        return len(docs)
+
+    def load_snapshot(self, path):
+        """Load the destination corpus from a snapshot file, returning False if it can't be used"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Destination snapshot {path} not found, fetching destination data instead")
+            return False
+        except Exception as e:
+            logger.error(f"Error reading destination snapshot {path}: {e}")
+            return False
+        
+        if payload.get("version") != SNAPSHOT_FORMAT_VERSION:
+            logger.warning(f"Destination snapshot {path} has version {payload.get('version')}, "
+                           f"expected {SNAPSHOT_FORMAT_VERSION}; fetching destination data instead")
+            return False
+        
+        try:
+            docs = [self._document_from_dict(data) for data in payload.get("documents", [])]
+            if not docs:
+                logger.warning(f"Destination snapshot {path} is empty, fetching destination data instead")
+                return False
+            
+            self.document_store.delete_documents()
+            self.document_store.write_documents(docs)
+        except Exception as e:
+            logger.error(f"Error loading destination snapshot {path}: {e}")
+            return False
+        
+        logger.info(f"Loaded {len(docs)} documents from snapshot {path} (built {payload.get('created_at')})")
+        return True
+
+    def refresh_snapshot(self, path):
+        """Fetch fresh destination data from the network and rewrite the snapshot"""
+        self.update_destination_data()
+        self._index_place_names()
+        return self.save_snapshot(path)
+
+    def _index_place_names(self):
+        """Let the intent router recognize every destination in the corpus as a place"""
+        docs = self.document_store.get_all_documents()
+        self.router.add_place_names(doc.meta.get("name") for doc in docs)
+
     def search_destinations(self, query, top_k=3):
         """Search for destinations based on user query"""
+        self._start_models()
         # First try to search directly from Geonames
         destinations = self.location_service.search_destinations(query, max_rows=top_k)
 
@@ -1038,44 +3855,198 @@ class TripPlanner:
                 logger.error(f"Error searching document store: {e}")
                 # Fall back to the destinations we already have
         
-        return destinations[:top_k] if destinations else []
-    
+        return destinations[:top_k] if destinations else []
+    
+    @staticmethod
+    def _itinerary_destination(destination):
+        """Normalize a destination dict to the fields an itinerary needs"""
+        return {
+            "name": destination.get("name", ""),
+            "country": destination.get("country", ""),
+            "lat": destination.get("lat", 0),
+            "lng": destination.get("lng", 0)
+        }
+
+    def _resolve_itinerary_destination(self, destination):
+        """Return the itinerary fields of a destination dict or name, or None if it can't be found"""
+        # Dicts that already carry coordinates (e.g. from an earlier result) need no lookup
+        if isinstance(destination, dict):
+            dest = self._itinerary_destination(destination)
+            if dest["lat"] or dest["lng"]:
+                return dest
+            destination = dest["name"]
+        
+        # Search for the destination if only a name is provided
+        destinations = self.location_service.search_destinations(destination, max_rows=1)
+        return self._itinerary_destination(destinations[0]) if destinations else None
+
+    def build_itinerary(self, destination, days=3):
+        """
+        Build a structured day-by-day itinerary for a destination
+        
+        Returns:
+            Itinerary: The itinerary, or a message string if the destination can't be found
+        """
+        dest = self._resolve_itinerary_destination(destination)
+        if dest is None:
+            name = destination.get("name", "") if isinstance(destination, dict) else destination
+            return f"Could not generate itinerary for {name}. Destination not found in database."
+        
+        # Repeat requests are served from memory until the forecast model run changes
+        cache_key = self._itinerary_cache_key(dest, days)
+        itinerary = self.itinerary_cache.get(cache_key)
+        if itinerary is not None:
+            return itinerary
+        
+        # Get weather forecast if possible
+        weather = self.weather_service.get_forecast(dest["lat"], dest["lng"], days=days)
+        
+        # Get points of interest
+        pois = self.route_service.get_places_of_interest((dest["lng"], dest["lat"]), radius=10000)
+        
+        # Nearby places are only needed when there are no POIs
+        nearby = None
+        if not pois:
+            nearby = self.location_service.get_nearby_places(dest["lat"], dest["lng"], radius=10, max_rows=10)
+        
+        country_info = self.location_service.get_country_info(dest["country"]) if dest["country"] else None
+        
+        itinerary = self._build_itinerary(dest, days, weather, pois, nearby, country_info)
+        self._cache_itinerary(cache_key, itinerary, used_nearby=nearby is not None)
+        return itinerary
+
+    def _itinerary_cache_key(self, dest, days):
+        return ItineraryCache.destination_id(dest), days, self.weather_service.forecast_epoch()
+
+    def _cache_itinerary(self, cache_key, itinerary, used_nearby):
+        """Cache an itinerary along with the forecast cell and POI tiles it was built from"""
+        dest = itinerary.destination
+        # Failed lookups come back empty or as canned fallbacks; an itinerary built from them is served only once
+        lookups_ok = (
+            self.weather_service.has_forecast(dest["lat"], dest["lng"])
+            and self.route_service.has_poi_tiles((dest["lng"], dest["lat"]), 10000)
+            and (not used_nearby
+                 or self.location_service.has_nearby_places(dest["lat"], dest["lng"], radius=10, max_rows=10))
+            and (not dest["country"] or self.location_service.has_country_info(dest["country"]))
+        )
+        if not lookups_ok:
+            logger.info(f"Not caching itinerary for {dest['name']}: an upstream lookup failed")
+            return
+        dependencies = [("forecast", self.weather_service.grid_cell(dest["lat"], dest["lng"]))]
+        dependencies.extend(
+            ("poi_tile", tile) for tile in self.route_service.poi_tiles((dest["lng"], dest["lat"]), 10000)
+        )
+        self.itinerary_cache.put(cache_key, itinerary, dependencies)
+
     def generate_itinerary(self, destination, days=3):
         """Generate a day-by-day itinerary for a destination"""
-        # Extract name and country if a destination object is provided
-        if isinstance(destination, dict):
-            dest_name = destination.get("name", "")
-            dest_country = destination.get("country", "")
-            dest_lat = destination.get("lat", 0)
-            dest_lng = destination.get("lng", 0)
+        return str(self.build_itinerary(destination, days=days))
+
+    async def agenerate_itinerary(self, destination, days=3):
+        """Generate an itinerary, fetching weather, POIs, nearby places and country info concurrently"""
+        if isinstance(destination, dict) and (destination.get("lat") or destination.get("lng")):
+            dest = self._itinerary_destination(destination)
         else:
-            # Search for the destination if only a name is provided
-            destinations = self.location_service.search_destinations(destination, max_rows=1)
+            name = destination.get("name", "") if isinstance(destination, dict) else destination
+            destinations = await self.async_location_service.search_destinations(name, max_rows=1)
             if not destinations:
-                return f"Could not generate itinerary for {destination}. Destination not found in database."
-                
-            dest = destinations[0]
-            dest_name = dest["name"]
-            dest_country = dest["country"]
-            dest_lat = dest["lat"]
-            dest_lng = dest["lng"]
+                return f"Could not generate itinerary for {name}. Destination not found in database."
+            dest = self._itinerary_destination(destinations[0])
+        
+        # Nearby places are fetched speculatively so the itinerary costs a single round of latency
+        weather, pois, nearby, country_info = await asyncio.gather(
+            self.async_weather_service.get_forecast(dest["lat"], dest["lng"], days=days),
+            self.async_route_service.get_places_of_interest((dest["lng"], dest["lat"]), radius=10000),
+            self.async_location_service.get_nearby_places(dest["lat"], dest["lng"], radius=10, max_rows=10),
+            self.async_location_service.get_country_info(dest["country"]) if dest["country"] else asyncio.sleep(0, result=None)
+        )
         
-        # Get weather forecast if possible
-        weather = self.weather_service.get_forecast(dest_lat, dest_lng, days=days)
+        return self._build_itinerary(dest, days, weather, pois, nearby, country_info).to_text()
+
+    def _build_itinerary(self, dest, days, weather, pois, nearby, country_info):
+        """Assemble an itinerary from already-fetched weather, POI, nearby and country data"""
+        activities, activities_per_day = self._itinerary_activities(dest, days, pois, nearby)
+        itinerary = Itinerary(dest, days, country_info=country_info)
+        for day in range(1, days + 1):
+            day_weather = weather[day-1] if weather and day <= len(weather) else None
+            itinerary.day_plans.append(self._itinerary_day(day, days, activities, activities_per_day, day_weather))
+        itinerary.tips = self._itinerary_tips(dest, country_info)
+        return itinerary
+
+    def iter_itinerary(self, destination, days=3):
+        """
+        Generate an itinerary in pieces, yielding each part as soon as its data is ready
         
-        # Get points of interest
-        pois = self.route_service.get_places_of_interest((dest_lng, dest_lat), radius=10000)
+        The header comes first, while weather, POIs and country info are fetched
+        concurrently; then one block per day, then the travel tips. Joined, the pieces
+        equal the text generate_itinerary returns.
+        
+        Yields:
+            str: Consecutive pieces of the itinerary text
+            
+        Returns:
+            Itinerary: The finished itinerary (the generator's return value), or None
+        """
+        dest = self._resolve_itinerary_destination(destination)
+        if dest is None:
+            name = destination.get("name", "") if isinstance(destination, dict) else destination
+            yield f"Could not generate itinerary for {name}. Destination not found in database."
+            return None
+        
+        cache_key = self._itinerary_cache_key(dest, days)
+        cached = self.itinerary_cache.get(cache_key)
+        if cached is not None:
+            yield cached.header_text()
+            for day_plan in cached.day_plans:
+                yield day_plan.to_text()
+            yield cached.tips_text()
+            return cached
+        
+        weather_future = self.executor.submit(self.weather_service.get_forecast, dest["lat"], dest["lng"], days=days)
+        pois_future = self.executor.submit(
+            self.route_service.get_places_of_interest, (dest["lng"], dest["lat"]), radius=10000
+        )
+        country_future = None
+        if dest["country"]:
+            country_future = self.executor.submit(self.location_service.get_country_info, dest["country"])
+        
+        itinerary = Itinerary(dest, days)
+        yield itinerary.header_text()
+        
+        # Nearby places are only needed when there are no POIs
+        pois = pois_future.result()
+        nearby = None
+        if not pois:
+            nearby = self.location_service.get_nearby_places(dest["lat"], dest["lng"], radius=10, max_rows=10)
+        activities, activities_per_day = self._itinerary_activities(dest, days, pois, nearby)
+        
+        weather = weather_future.result()
+        for day in range(1, days + 1):
+            day_weather = weather[day-1] if weather and day <= len(weather) else None
+            day_plan = self._itinerary_day(day, days, activities, activities_per_day, day_weather)
+            itinerary.day_plans.append(day_plan)
+            yield day_plan.to_text()
+        
+        itinerary.country_info = country_future.result() if country_future else None
+        itinerary.tips = self._itinerary_tips(dest, itinerary.country_info)
+        yield itinerary.tips_text()
+        self._cache_itinerary(cache_key, itinerary, used_nearby=nearby is not None)
+        return itinerary
+
+    @staticmethod
+    def _itinerary_activities(dest, days, pois, nearby):
+        """Return the itinerary's activities and how many of them each day gets"""
+        dest_name = dest["name"]
         
         # If no POIs from API, use default activities or search nearby places
         activities = []
         if pois:
             for poi in pois:
-                activities.append(f"Visit {poi['name']}")
+                activities.append(Activity(f"Visit {poi['name']}", poi))
         else:
-            # Try to get nearby places from Geonames
-            nearby = self.location_service.get_nearby_places(dest_lat, dest_lng, radius=10, max_rows=10)
-            for place in nearby:
-                activities.append(f"Visit {place.get('name')}")
+            # Fall back to nearby places from Geonames
+            for place in nearby or []:
+                activities.append(Activity(f"Visit {place.get('name')}", place))
                 
             # Add some generic activities
             generic_activities = [
@@ -1088,87 +4059,75 @@ class TripPlanner:
                 f"Experience the nightlife",
                 f"Join a walking tour"
             ]
-            activities.extend(generic_activities)
+            activities.extend(Activity(description) for description in generic_activities)
         
         # Ensure we have enough activities
         if len(activities) < days * 3:
             activities = activities * ((days * 3) // len(activities) + 1)
         
-        # Generate the itinerary
-        itinerary = f"\n{days}-Day Itinerary for {dest_name}, {dest_country}:\n"
-        
         # Distribute activities across days
         activities_per_day = max(1, min(len(activities) // days, 5))  # At most 5 activities per day
-        
-        for day in range(1, days + 1):
-            day_weather = None
-            if weather and day <= len(weather):
-                day_weather = weather[day-1]
-                
-            itinerary += f"\nDay {day}"
-            
-            if day_weather:
-                itinerary += f" - Weather: {day_weather['conditions']}, {day_weather['temp_min']}°C to {day_weather['temp_max']}°C"
-                
-            itinerary += ":\n"
-            
-            start_idx = (day - 1) * activities_per_day
-            end_idx = min(start_idx + activities_per_day, len(activities))
-            
-            if day == days:  # Last day gets any remaining high-priority activities
-                end_idx = min(start_idx + activities_per_day, len(activities))
-            
-            # Morning
-            itinerary += "Morning:\n"
-            if start_idx < end_idx:
-                itinerary += f"- {activities[start_idx]}\n"
-                
-            # Adjust morning activities based on weather
-            if day_weather and day_weather['conditions'] == "Sunny":
-                itinerary += "- Enjoy breakfast at an outdoor café\n"
-            else:
-                itinerary += "- Breakfast at a local café\n"
-            
-            # afternoon
-            itinerary += "\nAfternoon:\n"
-            for i in range(start_idx + 1, min(start_idx + 3, end_idx)):
-                itinerary += f"- {activities[i]}\n"
-                
-            # Adjust aFternoon activities based on weather
-            if day_weather and day_weather['precipitation_probability'] > 50:
-                itinerary += "- Visit indoor attractions due to possible rain\n"
+        return activities, activities_per_day
+
+    @staticmethod
+    def _itinerary_day(day, days, activities, activities_per_day, day_weather):
+        """Plan one day of an itinerary"""
+        start_idx = (day - 1) * activities_per_day
+        end_idx = min(start_idx + activities_per_day, len(activities))
+        
+        # Morning
+        morning = ItinerarySlot("Morning")
+        if start_idx < end_idx:
+            morning.activities.append(activities[start_idx])
             
-            itinerary += "- Lunch at a recommended restaurant\n"
+        # Adjust morning activities based on weather
+        if day_weather and day_weather['conditions'] == "Sunny":
+            morning.activities.append(Activity("Enjoy breakfast at an outdoor café"))
+        else:
+            morning.activities.append(Activity("Breakfast at a local café"))
+        
+        # afternoon
+        afternoon = ItinerarySlot("Afternoon", activities[start_idx + 1:min(start_idx + 3, end_idx)])
             
-            # Evening
-            itinerary += "\nEvening:\n"
-            if start_idx + 3 < end_idx:
-                itinerary += f"- {activities[start_idx + 3]}\n"
-                
-            itinerary += "- Dinner at a local restaurant\n"
+        # Adjust aFternoon activities based on weather
+        if day_weather and day_weather['precipitation_probability'] > 50:
+            afternoon.activities.append(Activity("Visit indoor attractions due to possible rain"))
+        
+        afternoon.activities.append(Activity("Lunch at a recommended restaurant"))
+        
+        # Evening
+        evening = ItinerarySlot("Evening")
+        if start_idx + 3 < end_idx:
+            evening.activities.append(activities[start_idx + 3])
             
-            if day == 1:
-                itinerary += "- Evening stroll to get oriented with the area\n"
-            elif day == days:
-                itinerary += "- Farewell dinner with local specialties\n"
-            else:
-                itinerary += "- Relax and enjoy local entertainment\n"
+        evening.activities.append(Activity("Dinner at a local restaurant"))
+        
+        if day == 1:
+            evening.activities.append(Activity("Evening stroll to get oriented with the area"))
+        elif day == days:
+            evening.activities.append(Activity("Farewell dinner with local specialties"))
+        else:
+            evening.activities.append(Activity("Relax and enjoy local entertainment"))
         
-        # Add travel tips
-        itinerary += f"\nTravel Tips for {dest_name}:\n"
+        return ItineraryDay(day, day_weather, [morning, afternoon, evening])
+
+    @staticmethod
+    def _itinerary_tips(dest, country_info):
+        """Return the travel tips that close an itinerary"""
+        dest_name = dest["name"]
+        tips = []
         
         # Best time to visit based on hemisphere and typical seasons
-        if dest_lat > 0:  # Northern Hemisphere
-            itinerary += "- Best time to visit: Spring (April-June) and Fall (September-October)\n"
+        if dest["lat"] > 0:  # Northern Hemisphere
+            tips.append("Best time to visit: Spring (April-June) and Fall (September-October)")
         else:  # Southern Hemisphere
-            itinerary += "- Best time to visit: Spring (September-November) and Fall (March-May)\n"
+            tips.append("Best time to visit: Spring (September-November) and Fall (March-May)")
             
         # Budget estimate based on country
-        if dest_country:
-            country_info = self.location_service.get_country_info(dest_country)
+        budget_estimation = ""
+        if country_info:
             continent = country_info.get("continentName", "")
             
-            budget_estimation = ""
             if continent:
                 if continent in ["Europe", "North America", "Australia"]:
                     budget_estimation = "Medium to High"
@@ -1178,31 +4137,31 @@ class TripPlanner:
                     budget_estimation = "Low to Medium"
         
         if budget_estimation:
-            itinerary += f"- Budget range: {budget_estimation}\n"
+            tips.append(f"Budget range: {budget_estimation}")
         
-        itinerary += "- Remember to research local customs and etiquette\n"
-        itinerary += "- Check for any required travel documents or vaccinations\n"
+        tips.append("Remember to research local customs and etiquette")
+        tips.append("Check for any required travel documents or vaccinations")
         
         # Transportation tips
         if country_info:
             if country_info.get("population", 0) > 50000000:  # Larger countries
-                itinerary += "- Consider internal flights for longer distances\n"
+                tips.append("Consider internal flights for longer distances")
             
-        itinerary += "- Research public transportation options\n"
+        tips.append("Research public transportation options")
         
-        return itinerary
+        return tips
     
 
     
-    def plan_trip(self, query: str) -> str:
+    def build_trip_plan(self, query: str):
         """
-        Create a trip plan based on user query.
+        Build structured destination recommendations for a user query.
 
         Args:
             query (str): The user's travel-related query.
 
         Returns:
-            str: A formatted response with destination recommendations.
+            TripPlan: The recommendations, or a message string if nothing matched.
         """
         # Log the query
         logger.info(f"Searching for destinations based on query: {query}")
@@ -1216,8 +4175,6 @@ class TripPlanner:
         else:
             template = random.choice(self.RESPONSE_TEMPLATES['destinations'])
         
-        response = f"{template}\n\n"
-        
         # Search for destinations
         destinations = self.search_destinations(query)
         
@@ -1230,46 +4187,15 @@ class TripPlanner:
             ]
             return random.choice(no_results_templates)
         
-        # Build destination list
-        for i, dest in enumerate(destinations, 1):
-            response += f"Option {i}: {dest['name']}, {dest['country']}\n"
-            
-            # Add nearby attractions if available
-            nearby = self._get_nearby_attractions(dest)
-            if nearby:
-                response += f"  - Nearby attractions: {', '.join(nearby)}\n"
-            
-            # Add population info if available
-            if dest.get("population", 0) > 0:
-                response += f"  - Population: {dest['population']:,}\n"
-            
-            # Add activities if available
-            if "activities" in dest and dest["activities"]:
-                activities = dest["activities"][:3]  # Limit to 3 activities
-                response += f"  - Top activities: {', '.join(activities)}\n"
-            
-            # Add budget estimate
-            daily_budget = self.get_estimated_budget(dest)
-            response += f"  - Estimated daily cost: ${daily_budget} per person\n"
-            
-            # Add budget level
-            budget_level = dest.get("budget_level", "medium")
-            response += f"  - Budget level: {budget_level.title()}\n"
-            
-            # Add budget assessment if user specified a budget
-            if budget:
-                total_trip_cost = daily_budget * 7  # Assume a 7-day trip
-                if total_trip_cost <= budget * 0.7:
-                    response += f"  - Budget assessment: Excellent value for your ${budget} budget\n"
-                elif total_trip_cost <= budget:
-                    response += f"  - Budget assessment: Good match for your ${budget} budget\n"
-                else:
-                    response += f"  - Budget assessment: May be tight for your ${budget} budget\n"
-            
-            # Add sample itinerary preview
-            response += f"\n  Sample itinerary preview:\n"
-            response += self._generate_itinerary_preview(dest['name'])
-            response += "\n\n"
+        # Look up nearby attractions for all options at once; results keep option order
+        nearby_by_option = self._map_concurrently(
+            self._get_nearby_attractions, destinations, limit=self.enrichment_concurrency
+        )
+        
+        options = [
+            DestinationOption(dest, nearby, self.get_estimated_budget(dest), self._generate_itinerary_preview(dest['name']))
+            for dest, nearby in zip(destinations, nearby_by_option)
+        ]
         
         # Add follow-up prompt
         follow_up = random.choice([
@@ -1277,9 +4203,20 @@ class TripPlanner:
             "Shall I create a full itinerary for one of these options?",
             "Would you like more information about any of these destinations?"
         ])
-        response += follow_up
         
-        return response
+        return TripPlan(template, options, follow_up, budget=budget)
+
+    def plan_trip(self, query: str) -> str:
+        """
+        Create a trip plan based on user query.
+
+        Args:
+            query (str): The user's travel-related query.
+
+        Returns:
+            str: A formatted response with destination recommendations.
+        """
+        return str(self.build_trip_plan(query))
 
     def _get_nearby_attractions(self, destination: Dict) -> List[str]:
         """Get nearby attractions for a destination."""
@@ -1308,8 +4245,36 @@ class TripPlanner:
         ]
         return random.choice(preview_templates)
     
-    def find_flights(self, origin, destination, date=None):
-        """Find flights between two locations"""
+    def find_flights(self, origin, destination, date=None, flexible_days=0, max_airports=1, sort_by="duration",
+                     limit=10):
+        """
+        Find flights between two locations
+        
+        Args:
+            origin (str): Departure city, airport name or code
+            destination (str): Arrival city, airport name or code
+            date (str): Departure date, defaults to 30 days from now
+            flexible_days (int): Also search this many days either side of date, at most
+                FlightService.MAX_FLEX_DAYS
+            max_airports (int): Candidate airports considered at each end
+            sort_by (str): Ranking of flexible results, "duration" or "departure"
+            limit (int): Maximum flights listed for a flexible search
+        """
+        return "".join(self.iter_find_flights(origin, destination, date, flexible_days, max_airports, sort_by,
+                                              limit, progress=False))
+    
+    def iter_find_flights(self, origin, destination, date=None, flexible_days=0, max_airports=1,
+                          sort_by="duration", limit=10, progress=True):
+        """
+        Find flights like find_flights, streaming flexible searches as their results arrive
+        
+        With progress, a flexible search first yields one line per completed airport pair and
+        date that found flights, then the final ranking; joined without progress, the pieces
+        equal the text find_flights returns.
+        
+        Yields:
+            str: Consecutive pieces of the response
+        """
         if not date:
             date = (datetime.now() + timedelta(days=30)).strftime("%Y/%m/%d")
         
@@ -1318,19 +4283,50 @@ class TripPlanner:
         destination_airports = self.flight_service.search_airports(destination)
         
         if not origin_airports or not destination_airports:
-            return f"Could not find airports for {origin} and/or {destination}."
-        
-        # Use the first airport for each location
-        origin_code = origin_airports[0]["code"]
-        destination_code = destination_airports[0]["code"]
-        
-        # Get flights
-        flights = self.flight_service.get_flights(origin_code, destination_code, date)
+            yield f"Could not find airports for {origin} and/or {destination}."
+            return
+        
+        note = ""
+        flexible = flexible_days > 0 or max_airports > 1
+        if flexible:
+            # Fan out over every candidate airport pair and date, merged into one ranking
+            max_flex_days = self.flight_service.MAX_FLEX_DAYS
+            if flexible_days > max_flex_days:
+                note = f"Note: flexible searches cover at most +/- {max_flex_days} days.\n\n"
+                flexible_days = max_flex_days
+            origin_codes = [airport["code"] for airport in origin_airports[:max_airports]]
+            destination_codes = [airport["code"] for airport in destination_airports[:max_airports]]
+            origin_code = ", ".join(origin_codes)
+            destination_code = ", ".join(destination_codes)
+            when = f"{date} +/- {flexible_days} days" if flexible_days else date
+            if progress:
+                yield f"Searching flights from {origin} ({origin_code}) to {destination} ({destination_code}) on {when}...\n"
+            
+            flights = []
+            try:
+                for departure, arrival, day, found, flights in self.flight_service.iter_flexible(
+                        origin_codes, destination_codes, date, flex_days=flexible_days, sort_by=sort_by, limit=limit):
+                    if progress and found:
+                        yield f"  {departure} -> {arrival} on {day}: {len(found)} flights\n"
+            except ValueError as e:
+                yield str(e)
+                return
+            if progress:
+                yield "\n"
+        else:
+            # Use the first airport for each location
+            origin_code = origin_airports[0]["code"]
+            destination_code = destination_airports[0]["code"]
+            
+            # Get flights
+            flights = self.flight_service.get_flights(origin_code, destination_code, date)
+            when = date
         
         if not flights:
-            return f"No flights found from {origin} ({origin_code}) to {destination} ({destination_code}) on {date}."
+            yield f"{note}No flights found from {origin} ({origin_code}) to {destination} ({destination_code}) on {when}."
+            return
         
-        response = f"Flights from {origin} ({origin_code}) to {destination} ({destination_code}):\n\n"
+        response = f"{note}Flights from {origin} ({origin_code}) to {destination} ({destination_code}):\n\n"
         
         for i, flight in enumerate(flights, 1):
             departure_time = flight["departure"]["time"]
@@ -1340,11 +4336,13 @@ class TripPlanner:
             minutes = duration % 60
             
             response += f"Flight {i}: {flight['carrier']} {flight['flight_number']}\n"
+            if flexible:
+                response += f"  Route: {flight['departure']['airport']} -> {flight['arrival']['airport']}\n"
             response += f"  Departure: {departure_time}\n"
             response += f"  Arrival: {arrival_time}\n"
             response += f"  Duration: {hours}h {minutes}m\n\n"
         
-        return response
+        yield response
     
     def get_weather_info(self, location):
         """Get weather information for a location"""
@@ -1519,75 +4517,50 @@ class TripPlanner:
 
     def process_query(self, query):
         """Process a travel-related query and return a response"""
-        # Extract query type using regex patterns
-        patterns = {
-            "destination_search": r"(?:where to go|recommend destinations|suggest places|where should I visit)",
-            "itinerary_request": r"(?:itinerary for|travel plan for|things to do in|activities in|visit|go to)",
-            "flight_search": r"(?:flights from|flights to|flights between)",
-            "weather_info": r"(?:weather in|weather forecast for|climate in)",
-            "travel_recommendations": r"(?:recommend|suggest|looking for|\$\d+|budget of|within budget)",
-            "excursion_search": r"(?:excursions in|things to do in|activities in|attractions in|places to visit in)"
-        }
-        
         # Handle yes/no responses contextually
         if hasattr(self, 'conversation_history') and self.conversation_history:
             last_query = self.conversation_history[-1]['query']
             last_response = self.conversation_history[-1]['response']
             
-            if query.lower() in ['yes', 'more', 'sure', 'please']:
-                if 'recommended destinations' in last_response or 'options matching your search' in last_response:
+            if query.lower() in self.FOLLOW_UP_REPLIES:
+                # The structured result still describes the last response unless something else was answered since
+                previous = self.last_result if self._last_result_text == last_response else None
+                if (isinstance(previous, TripPlan) or 'recommended destinations' in last_response
+                        or 'options matching your search' in last_response):
                     # Show detailed info about first recommendation
-                    return self._show_destination_details(last_response)
-                elif 'itinerary' in last_response:
-                    return self._expand_itinerary(last_response)
+                    return self._remember(self._show_destination_details(last_response, previous))
+                elif isinstance(previous, Itinerary) or 'itinerary' in last_response:
+                    return self._remember(self._expand_itinerary(last_response, previous))
         
-        # Extract budget if present
-        budget = self.extract_budget(query)
+        return self._remember(self._dispatch(query))
+
+    def _dispatch(self, query, route=None):
+        """
+        Answer a query on its own, without reading or updating conversation state
         
-        # Determine query type
-        query_type = None
-        for key, pattern in patterns.items():
-            if re.search(pattern, query, re.IGNORECASE):
-                query_type = key
-                break
-        
-        # If no specific query type is detected, try to determine if it's a destination name
-        if not query_type:
-            # Check if query looks like a destination name
-            destinations = self.location_service.search_destinations(query, max_rows=1)
-            if destinations:
-                # If we found a destination, treat as an itinerary request
-                query_type = "itinerary_request"
-            else:
-                # Default to travel recommendations
-                query_type = "travel_recommendations"
+        Args:
+            query (str): The query text
+            route (dict): The query's IntentRouter route, if already computed
+            
+        Returns:
+            TripPlan, Itinerary or str: The answer
+        """
+        # Determine query type and extract its slots in one local pass
+        route = route or self.router.route(query)
+        query_type = route["intent"]
         
         # Process based on query type
         if query_type == "destination_search":
-            return self.plan_trip(query)
+            return self.build_trip_plan(query)
         elif query_type == "itinerary_request":
-            # Extract destination - improved pattern to catch "go to X" format
-            destination_match = re.search(r"(?:itinerary for|travel plan for|things to do in|activities in|visit|go to)\s+(?:the\s+)?([\w\s,]+)", query, re.IGNORECASE)
-            
-            # If no match found but query type is itinerary_request, use the query itself as destination
-            if not destination_match and query_type == "itinerary_request":
-                destination = query.strip()
-            else:
-                destination = destination_match.group(1).strip() if destination_match else None
-                
+            destination = route["destination"]
             if destination:
-                # Extract days if specified
-                days_match = re.search(r"(\d+)\s+days?", query, re.IGNORECASE)
-                days = int(days_match.group(1)) if days_match else 3
-                return self.generate_itinerary(destination, days=days)
+                return self.build_itinerary(destination, days=route["days"] or 3)
             else:
                 return "Please specify a destination for your itinerary."
         elif query_type == "excursion_search":
-            # Extract location for excursions
-            location_match = re.search(r"(?:excursions in|things to do in|activities in|attractions in|places to visit in)\s+(?:the\s+)?([\w\s,]+)", query, re.IGNORECASE)
-            
-            if location_match:
-                location = location_match.group(1).strip()
+            location = route["destination"]
+            if location:
                 # Search for the location
                 destinations = self.location_service.search_destinations(location, max_rows=1)
                 
@@ -1629,22 +4602,17 @@ class TripPlanner:
             else:
                 return "Please specify a location to find excursions and attractions."
         elif query_type == "flight_search":
-            # Extract origin and destination
-            match = re.search(r"flights from\s+([\w\s]+)\s+to\s+([\w\s]+)", query, re.IGNORECASE)
-            if match:
-                origin = match.group(1).strip()
-                destination = match.group(2).strip()
-                # Extract date if specified
-                date_match = re.search(r"on\s+(\d{1,2}/\d{1,2}/\d{4}|\d{4}-\d{2}-\d{2})", query, re.IGNORECASE)
-                date = date_match.group(1) if date_match else None
-                return self.find_flights(origin, destination, date)
+            if route["origin"] and route["destination"]:
+                # "+/- 3 days" or "flexible" widens the search to nearby dates and all city airports
+                flexible_days = route["flexible_days"]
+                max_airports = 3 if flexible_days else 1
+                return self.find_flights(route["origin"], route["destination"], route["date"],
+                                         flexible_days=flexible_days, max_airports=max_airports)
             else:
                 return "Please specify origin and destination for flight search."
         elif query_type == "weather_info":
-            # Extract location
-            match = re.search(r"weather (?:in|forecast for|for)\s+([\w\s]+)", query, re.IGNORECASE)
-            if match:
-                location = match.group(1).strip()
+            location = route["destination"]
+            if location:
                 return self.get_weather_info(location)
             else:
                 return "Please specify a location for weather information."
@@ -1653,6 +4621,105 @@ class TripPlanner:
         else:
             return "I'm not sure what you're asking for. Could you rephrase your query?"
 
+    def iter_process_query(self, query):
+        """Like process_query, but stream itineraries and flexible flight searches as they are generated"""
+        route = self.router.route(query)
+        if route["intent"] == "itinerary_request" and route["destination"]:
+            itinerary = yield from self.iter_itinerary(route["destination"], days=route["days"] or 3)
+            if itinerary is not None:
+                self._remember(itinerary)
+        elif route["intent"] == "flight_search" and route["origin"] and route["destination"]:
+            # Flexible searches report each airport pair and date as it completes
+            flexible_days = route["flexible_days"]
+            yield from self.iter_find_flights(route["origin"], route["destination"], route["date"],
+                                              flexible_days=flexible_days, max_airports=3 if flexible_days else 1)
+        else:
+            yield TripPlanner.process_query(self, query)
+
+    def _batch_lookups(self, intent, dest):
+        """Return {lookup key: fetch} for the upstream data answering a query needs"""
+        lat, lng = dest["lat"], dest["lng"]
+        lookups = {}
+        if intent in ("itinerary_request", "weather_info"):
+            lookups[("forecast", lat, lng)] = lambda: self.weather_service.get_forecast(lat, lng)
+        if intent == "itinerary_request":
+            # Nearby places stand in for POIs when there are none, as in generate_itinerary
+            lookups[("pois", lat, lng)] = lambda: (
+                self.route_service.get_places_of_interest((lng, lat), radius=10000)
+                or self.location_service.get_nearby_places(lat, lng, radius=10, max_rows=10)
+            )
+            if dest.get("country"):
+                lookups[("country", dest["country"])] = lambda: self.location_service.get_country_info(dest["country"])
+        elif intent == "excursion_search":
+            lookups[("nearby", lat, lng)] = lambda: self.location_service.get_nearby_places(lat, lng, radius=20, max_rows=10)
+        return lookups
+
+    @staticmethod
+    def _run_lookup(fetch):
+        try:
+            return fetch()
+        except Exception as e:
+            logger.warning(f"Batch prefetch failed: {e}")
+            return None
+
+    def _answer_batch_query(self, query, route=None):
+        try:
+            # Batch queries neither read nor update conversation history or the last result
+            return str(self._dispatch(query, route))
+        except Exception as e:
+            logger.error(f"Error processing batch query {query!r}: {e}")
+            return f"Error processing query: {str(e)}"
+
+    def process_queries(self, queries, workers=8):
+        """
+        Answer many independent queries, fetching each distinct upstream lookup once
+        
+        All queries are routed first. The destination, weather, POI, nearby and country
+        lookups they need are deduplicated and prefetched with bounded concurrency, which
+        warms the service caches, and then each distinct query is rendered from them.
+        
+        Args:
+            queries (list): Query strings
+            workers (int): Maximum lookups or renders in flight
+            
+        Returns:
+            list: Responses in the same order as queries
+        """
+        queries = list(queries)
+        routes = [self.router.route(query) for query in queries]
+        located_intents = ("itinerary_request", "excursion_search", "weather_info")
+        
+        # A pool of its own, since rendering may fan out on self.executor
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="trip-batch") as pool:
+            # Resolve each distinct place once
+            places = {}
+            for route in routes:
+                if route["intent"] in located_intents and route["destination"]:
+                    places.setdefault(normalize_place_name(route["destination"]), route["destination"])
+            found = dict(zip(places, pool.map(
+                lambda name: self._run_lookup(lambda: self.location_service.search_destinations(name, max_rows=1)),
+                places.values()
+            )))
+            
+            # Then each distinct lookup those places need
+            lookups = {}
+            for route in routes:
+                if route["intent"] not in located_intents or not route["destination"]:
+                    continue
+                destinations = found.get(normalize_place_name(route["destination"]))
+                if destinations:
+                    lookups.update(self._batch_lookups(route["intent"], destinations[0]))
+            list(pool.map(self._run_lookup, lookups.values()))
+            logger.info(f"Batch of {len(queries)} queries needed {len(places)} places and {len(lookups)} lookups")
+            
+            # Render each distinct query from the warmed caches
+            unique = {}
+            for query, route in zip(queries, routes):
+                unique.setdefault(" ".join(query.lower().split()), (query, route))
+            responses = dict(zip(unique, pool.map(lambda item: self._answer_batch_query(*item), unique.values())))
+        
+        return [responses[" ".join(query.lower().split())] for query in queries]
+
 
 
 
@@ -1663,14 +4730,29 @@ class TripPlanner:
 class EnhancedTripPlanner(TripPlanner):
     """Enhanced version of TripPlanner with improved AI capabilities and Supabase integration"""
     
-    def __init__(self):
-        # Call the parent class's __init__ method to inherit its initialization
-        super().__init__()
-        self.conversation_history = []
-        self.max_history_length = 5
+    # DPR passage encoder; also part of every embedding cache key
+    PASSAGE_EMBEDDING_MODEL = "facebook/dpr-ctx_encoder-single-nq-base"
+    
+    def __init__(self, warm_models=True, embedding_cache_path=None, **kwargs):
+        """
+        Args:
+            warm_models (bool): Start loading the ML models in the background right away
+            embedding_cache_path (str): File for cached passage embeddings, defaults to
+                EMBEDDING_CACHE_PATH; an empty string keeps the cache in memory only
+            **kwargs: Passed through to TripPlanner
+        """
+        # The dense retriever is attached later by a background loader
         self.dense_retriever = None
         self.dense_search_pipeline = None
         self.combined_search_pipeline = None
+        if embedding_cache_path is None:
+            embedding_cache_path = EMBEDDING_CACHE_PATH
+        self.embedding_cache = EmbeddingCache(embedding_cache_path or None)
+        
+        # Call the parent class's __init__ method to inherit its initialization
+        super().__init__(warm_models=warm_models, **kwargs)
+        self.conversation_history = []
+        self.max_history_length = 5
 
         # Add RESPONSE_TEMPLATES attribute to match what's used in plan_trip method
         self.RESPONSE_TEMPLATES = {
@@ -1689,55 +4771,113 @@ class EnhancedTripPlanner(TripPlanner):
         }
         
         # Initialize additional components for improved AI
-        # We'll use a more sophisticated document retriever if possible
+        # We'll use a more sophisticated document retriever if possible. It loads and
+        # embeds the corpus in the background; until then searches use BM25 only.
+        self.dense_model = BackgroundModel("Dense retriever", self._load_dense_retriever, start=warm_models)
+        self.dense_model.on_ready(self._attach_dense_retriever)
+
+    def _load_dense_retriever(self):
+        """Build the DPR retriever and embed the corpus with it"""
+        from haystack.nodes import DensePassageRetriever
+        dense_retriever = DensePassageRetriever(
+            document_store=self.document_store,
+            query_embedding_model="facebook/dpr-question_encoder-single-nq-base",
+            passage_embedding_model=self.PASSAGE_EMBEDDING_MODEL,
+            use_gpu=False
+        )
+        logger.info("Dense retriever initialized")
+        
+        # Update document embeddings before the retriever serves any query
         try:
-            from haystack.nodes import DensePassageRetriever
-            self.dense_retriever = DensePassageRetriever(
-                document_store=self.document_store,
-                query_embedding_model="facebook/dpr-question_encoder-single-nq-base",
-                passage_embedding_model="facebook/dpr-ctx_encoder-single-nq-base",
-                use_gpu=False
-            )
-            logger.info("Dense retriever initialized")
+            self._update_embeddings(dense_retriever)
+        except Exception as e:
+            logger.warning(f"Could not update embeddings: {e}")
+        return dense_retriever
 
+    def _update_embeddings(self, dense_retriever):
+        """Embed only documents whose content has no cached embedding for the passage model"""
+        docs = self.document_store.get_all_documents(return_embedding=True)
+        
+        missing = []
+        seeded = 0
+        for doc in docs:
+            key = EmbeddingCache.key(self.PASSAGE_EMBEDDING_MODEL, doc.content)
+            vector = self.embedding_cache.get(key)
+            if vector is None and doc.embedding is not None:
+                # Embeddings shipped in a snapshot seed the cache instead of being recomputed
+                self.embedding_cache.set(key, doc.embedding)
+                vector = self.embedding_cache.get(key)
+                seeded += 1
+            if vector is None:
+                missing.append(doc)
+            else:
+                doc.embedding = vector
         
-            
+        if missing:
+            vectors = dense_retriever.embed_documents(missing)
+            for doc, vector in zip(missing, vectors):
+                key = EmbeddingCache.key(self.PASSAGE_EMBEDDING_MODEL, doc.content)
+                self.embedding_cache.set(key, vector)
+                doc.embedding = self.embedding_cache.get(key)
+        
+        if missing or seeded:
+            self.embedding_cache.save()
+        
+        if docs:
+            self.document_store.write_documents(docs, duplicate_documents="overwrite")
+        logger.info(f"Embedded {len(missing)} documents, reused {len(docs) - len(missing)} cached embeddings")
+
+    def _attach_dense_retriever(self, dense_retriever):
+        """Switch searches to the dense and combined pipelines once DPR has loaded"""
+        with self._pipeline_lock:
+            self.dense_retriever = dense_retriever
+        self._build_dense_pipelines()
+
+    def _attach_reader(self, reader):
+        super()._attach_reader(reader)
+        # Rebuild the dense pipelines so they end in the reader as well
+        if self.dense_retriever:
+            self._build_dense_pipelines()
+
+    def _build_dense_pipelines(self):
+        """(Re)build the dense and combined search pipelines from the loaded components"""
+        with self._pipeline_lock:
             # Update the search pipeline to use both retrievers for better results
-            self.dense_search_pipeline = Pipeline()
-            self.dense_search_pipeline.add_node(component=self.dense_retriever, name="DenseRetriever", inputs=["Query"])
+            dense_search_pipeline = Pipeline()
+            dense_search_pipeline.add_node(component=self.dense_retriever, name="DenseRetriever", inputs=["Query"])
             
             # Add reader to dense pipeline if available
             if self.reader:
-                self.dense_search_pipeline.add_node(component=self.reader, name="Reader", inputs=["DenseRetriever"])
-                
-            # Update document embeddings
-            try:
-                self.document_store.update_embeddings(self.dense_retriever)
-            except Exception as e:
-                logger.warning(f"Could not update embeddings: {e}")
+                dense_search_pipeline.add_node(component=self.reader, name="Reader", inputs=["DenseRetriever"])
+            self.dense_search_pipeline = dense_search_pipeline
                 
             # Create a combined search pipeline if possible
             try:
                 from haystack.nodes import JoinDocuments
                 # Create combined pipeline with both retrievers
-                self.combined_search_pipeline = Pipeline()
-                self.combined_search_pipeline.add_node(component=self.retriever, name="BM25Retriever", inputs=["Query"])
-                self.combined_search_pipeline.add_node(component=self.dense_retriever, name="DenseRetriever", inputs=["Query"])
-                self.combined_search_pipeline.add_node(component=JoinDocuments(join_mode="reciprocal_rank_fusion"), 
+                combined_search_pipeline = Pipeline()
+                combined_search_pipeline.add_node(component=self.retriever, name="BM25Retriever", inputs=["Query"])
+                combined_search_pipeline.add_node(component=self.dense_retriever, name="DenseRetriever", inputs=["Query"])
+                combined_search_pipeline.add_node(component=JoinDocuments(join_mode="reciprocal_rank_fusion"), 
                                                 name="JoinResults", 
                                                 inputs=["BM25Retriever", "DenseRetriever"])
                 
                 if self.reader:
-                    self.combined_search_pipeline.add_node(component=self.reader, name="Reader", inputs=["JoinResults"])
-                    
+                    combined_search_pipeline.add_node(component=self.reader, name="Reader", inputs=["JoinResults"])
+                
+                self.combined_search_pipeline = combined_search_pipeline
                 logger.info("Combined search pipeline successfully initialized.")
             except Exception as e:
                 logger.warning(f"Combined search pipeline could not be initialized: {e}")
                 self.combined_search_pipeline = None
-                
-        except Exception as e:
-            logger.warning(f"Dense retriever could not be initialized due to: {e}")
-            logger.info("Using default BM25 retriever only.")
+
+    def _start_models(self):
+        super()._start_models()
+        self.dense_model.start()
+
+    def wait_for_models(self, timeout=None):
+        reader_ready = super().wait_for_models(timeout)
+        return self.dense_model.get(wait=True, timeout=timeout) is not None and reader_ready
     
     def update_destination_data(self):
         """Enhanced method to update destination data with more detailed information"""
@@ -1826,71 +4966,46 @@ class EnhancedTripPlanner(TripPlanner):
                 
                 # Update embeddings if dense retriever is available
                 if self.dense_retriever:
-                    self.document_store.update_embeddings(self.dense_retriever)
+                    self._update_embeddings(self.dense_retriever)
             except Exception as e:
                 logger.error(f"Error adding additional documents: {e}")
     
     def search_destinations(self, query, top_k=3):
         """Enhanced destination search using improved retrieval methods"""
         logger.info(f"Searching for destinations with query: {query}")
+        self._start_models()
         
         # First try direct search with the location service
         direct_results = self.location_service.search_destinations(query, max_rows=top_k*2)
         
-        # Process direct results
-        destinations = []
+        # Deduplicate direct results, keeping only the candidates that survive ranking
+        candidates = []
         seen = set()
         
         for dest in direct_results:
             key = (dest["name"], dest["country"])
             if key not in seen:
                 seen.add(key)
-                
-                # Enhance with nearby attractions
-                nearby_places = self.location_service.get_nearby_places(
-                    dest["lat"], dest["lng"], radius=10, max_rows=5
-                )
-                
-                # Create activities based on nearby places
-                activities = []
-                for place in nearby_places:
-                    if place.get("name") != dest["name"]:
-                        activities.append(f"Visit {place.get('name')}")
-                
-                # Add some generic activities if we don't have enough
-                if len(activities) < 3:
-                    generic_activities = [
-                        f"Explore the city center of {dest['name']}",
-                        f"Try local cuisine in {dest['name']}",
-                        f"Shop at local markets",
-                        f"Visit museums and galleries",
-                        f"Take a guided city tour"
-                    ]
-                    activities.extend(generic_activities)
-                
-                # Add budget level based on country
-                budget_level = self._determine_budget_level(dest["country"])
-                
-                # Create enhanced destination object
-                enhanced_dest = {
-                    "name": dest["name"],
-                    "country": dest["country"],
-                    "lat": dest["lat"],
-                    "lng": dest["lng"],
-                    "population": dest.get("population", 0),
-                    "activities": activities[:5],  # Limit to 5 activities
-                    "budget_level": budget_level
-                }
-                
-                destinations.append(enhanced_dest)
+                if len(candidates) < top_k:
+                    candidates.append(dest)
+        
+        # Enrich the surviving candidates concurrently; results keep ranking order
+        destinations = self._map_concurrently(
+            self._enrich_destination, candidates, limit=self.enrichment_concurrency
+        )
         
         # If we don't have enough results from direct search, try the document store
-        if len(destinations) < top_k and self.combined_search_pipeline:
+        if len(destinations) < top_k and (self.combined_search_pipeline or self.search_pipeline):
             try:
-                results = self.combined_search_pipeline.run(
-                    query=query, 
-                    params={"BM25Retriever": {"top_k": top_k}, "DenseRetriever": {"top_k": top_k}}
-                )
+                combined_search_pipeline = self.combined_search_pipeline
+                if combined_search_pipeline:
+                    results = combined_search_pipeline.run(
+                        query=query, 
+                        params={"BM25Retriever": {"top_k": top_k}, "DenseRetriever": {"top_k": top_k}}
+                    )
+                else:
+                    # Dense retriever is still loading, use BM25 only
+                    results = self.search_pipeline.run(query=query, params={"Retriever": {"top_k": top_k}})
                 
                 for doc in results["documents"]:
                     if "name" in doc.meta and "country" in doc.meta:
@@ -1954,70 +5069,59 @@ class EnhancedTripPlanner(TripPlanner):
             logger.warning(f"No results found for '{query}', using fallback destinations")
             
             # Try to match query with common city names before using generic fallbacks
-            query_lower = query.lower()
-            common_cities = {
-                "paris": {
-                    "name": "Paris",
-                    "country": "France",
-                    "lat": 48.8566,
-                    "lng": 2.3522,
-                    "population": 2140526,
-                    "activities": ["Visit Eiffel Tower", "Explore Louvre Museum", "Stroll along Seine River"],
-                    "budget_level": "high"
-                },
-                "rome": {
-                    "name": "Rome",
-                    "country": "Italy",
-                    "lat": 41.9028,
-                    "lng": 12.4964,
-                    "population": 2873000,
-                    "activities": ["Visit Colosseum", "Explore Vatican Museums", "Throw a coin in Trevi Fountain"],
-                    "budget_level": "medium"
-                },
-                "barcelona": {
-                    "name": "Barcelona",
-                    "country": "Spain",
-                    "lat": 41.3851,
-                    "lng": 2.1734,
-                    "population": 1620343,
-                    "activities": ["Visit Sagrada Familia", "Explore Park Güell", "Stroll along La Rambla"],
-                    "budget_level": "medium"
-                },
-                "tokyo": {
-                    "name": "Tokyo",
-                    "country": "Japan",
-                    "lat": 35.6762,
-                    "lng": 139.6503,
-                    "population": 13960000,
-                    "activities": ["Visit Tokyo Skytree", "Explore Senso-ji Temple", "Experience Shibuya Crossing"],
-                    "budget_level": "high"
-                },
-                "new york": {
-                    "name": "New York",
-                    "country": "United States",
-                    "lat": 40.7128,
-                    "lng": -74.0060,
-                    "population": 8804190,
-                    "activities": ["Visit Times Square", "Explore Central Park", "See Statue of Liberty"],
-                    "budget_level": "high"
-                }
-            }
+            matches = set(FALLBACK_GAZETTEER.match(query))
+            matched_cities = [key for key in FALLBACK_RECOMMENDATIONS if key in matches]
             
-            # Check for exact or partial matches in common cities
-            matched_cities = []
-            for city_key, city_data in common_cities.items():
-                if query_lower == city_key or query_lower in city_key or city_key in query_lower:
-                    matched_cities.append(city_data)
-            
-            if matched_cities:
-                destinations = matched_cities
-            else:
-                # If no specific match, return a diverse set of fallbacks
-                destinations = list(common_cities.values())
+            # If no specific match, return a diverse set of fallbacks
+            for key in matched_cities or FALLBACK_RECOMMENDATIONS:
+                city = FALLBACK_CITIES[key]
+                dest = FALLBACK_GAZETTEER.place(key)
+                del dest["country_code"]
+                dest["activities"] = list(city["activities"])
+                dest["budget_level"] = city["budget_level"]
+                destinations.append(dest)
         
         logger.info(f"Found {len(destinations)} destinations for query: {query}")
         return destinations[:top_k]
 
+    def _enrich_destination(self, dest):
+        """Build an enhanced destination with nearby-place activities and a budget level"""
+        # Enhance with nearby attractions
+        nearby_places = self.location_service.get_nearby_places(
+            dest["lat"], dest["lng"], radius=10, max_rows=5
+        )
+        
+        # Create activities based on nearby places
+        activities = []
+        for place in nearby_places:
+            if place.get("name") != dest["name"]:
+                activities.append(f"Visit {place.get('name')}")
+        
+        # Add some generic activities if we don't have enough
+        if len(activities) < 3:
+            generic_activities = [
+                f"Explore the city center of {dest['name']}",
+                f"Try local cuisine in {dest['name']}",
+                f"Shop at local markets",
+                f"Visit museums and galleries",
+                f"Take a guided city tour"
+            ]
+            activities.extend(generic_activities)
+        
+        # Add budget level based on country
+        budget_level = self._determine_budget_level(dest["country"])
+        
+        # Create enhanced destination object
+        return {
+            "name": dest["name"],
+            "country": dest["country"],
+            "lat": dest["lat"],
+            "lng": dest["lng"],
+            "population": dest.get("population", 0),
+            "activities": activities[:5],  # Limit to 5 activities
+            "budget_level": budget_level
+        }
+
     def _determine_budget_level(self, country):
         """Determine budget level based on country"""
         high_budget_countries = ["Switzerland", "Norway", "Iceland", "Japan", "Singapore", 
@@ -2080,13 +5184,9 @@ class EnhancedTripPlanner(TripPlanner):
     def process_query(self, query):
         """Enhanced query processing with context awareness"""
         # Check if this is a follow-up question
-        is_followup = len(self.conversation_history) > 0 and not any(
-            re.search(pattern, query, re.IGNORECASE) 
-            for pattern in [
-                "where to go", "recommend destinations", "suggest places", 
-                "itinerary for", "travel plan for", "flights from", "weather in"
-            ]
-        )
+        # Bare replies like "yes" are answered from the previous response itself, without added context
+        is_followup = (len(self.conversation_history) > 0 and not self.router.starts_new_topic(query)
+                       and query.lower() not in self.FOLLOW_UP_REPLIES)
         
         # If it's a follow-up, add context from conversation history
         if is_followup:
@@ -2102,12 +5202,60 @@ class EnhancedTripPlanner(TripPlanner):
         
         return response
     
+    def iter_process_query(self, query):
+        """Stream the response to a query, recording it in the conversation history once complete"""
+        # Bare replies like "yes" are answered from the previous response itself, without added context
+        is_followup = (len(self.conversation_history) > 0 and not self.router.starts_new_topic(query)
+                       and query.lower() not in self.FOLLOW_UP_REPLIES)
+        if is_followup:
+            # Follow-ups need the conversation context, which the streaming path doesn't apply
+            yield self.process_query(query)
+            return
+        
+        parts = []
+        for part in super().iter_process_query(query):
+            parts.append(part)
+            yield part
+        self.add_to_conversation_history(query, "".join(parts))
+    
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Interactive trip planner")
+    parser.add_argument("--snapshot", default=None,
+                        help="Load the destination corpus from this snapshot (default: $DESTINATION_SNAPSHOT_PATH)")
+    parser.add_argument("--build-snapshot", metavar="PATH",
+                        help="Fetch destination data, write it to a snapshot at PATH and exit")
+    parser.add_argument("--build-gazetteer", nargs=2, metavar=("DUMP", "INDEX_DIR"),
+                        help="Index a GeoNames citiesNNNN.txt dump into INDEX_DIR and exit")
+    parser.add_argument("--country-info", help="GeoNames countryInfo.txt, required by --build-gazetteer")
+    parser.add_argument("--admin1-codes",
+                        help="GeoNames admin1CodesASCII.txt used by --build-gazetteer for region names and filters")
+    args = parser.parse_args()
+    if args.build_gazetteer and not args.country_info:
+        parser.error("--build-gazetteer requires --country-info")
+    
+    if args.build_gazetteer:
+        dump_path, index_dir = args.build_gazetteer
+        gazetteer = LocalGazetteer.build(dump_path, index_dir, args.country_info, args.admin1_codes)
+        print(f"Indexed {len(gazetteer)} places into {index_dir}")
+        raise SystemExit(0)
+    
+    if args.build_snapshot:
+        # Always build from fresh network data, never from an existing snapshot. The reader
+        # isn't saved, but the dense retriever must finish embedding the corpus first.
+        planner = EnhancedTripPlanner(snapshot_path="", use_reader=False)
+        if not planner.wait_for_models():
+            logger.warning("Dense retriever failed to load; the snapshot will have no embeddings")
+        count = planner.save_snapshot(args.build_snapshot)
+        print(f"Wrote {count} documents to {args.build_snapshot}")
+        raise SystemExit(0)
+    
     print("Welcome to the Trip Planner!")
     print("Please enter your travel-related query (or 'exit' to quit):")
     
     # Use EnhancedTripPlanner instead of TripPlanner
-    planner = EnhancedTripPlanner()
+    planner = EnhancedTripPlanner(snapshot_path=args.snapshot)
     
     while True:
         user_query = input("> ")
@@ -2117,8 +5265,11 @@ if __name__ == "__main__":
             break
         
         try:
-            response = planner.process_query(user_query)
-            print("\n" + response + "\n")
+            # Print each part as it is generated, so long itineraries start appearing right away
+            print()
+            for part in planner.iter_process_query(user_query):
+                print(part, end="", flush=True)
+            print("\n")
         except Exception as e:
             print(f"\nError processing query: {str(e)}\n")
             print("Please try rephrasing your query or try another destination.")
@@ -2128,31 +5279,56 @@ if __name__ == "__main__":
 class TravelApp:
     """Main application class that coordinates between TripPlanner and Supabase"""
     
-    def __init__(self, supabase_url, supabase_key):
-        # Initialize the enhanced trip planner
-        self.trip_planner = EnhancedTripPlanner()
+    def __init__(self, supabase_url, supabase_key, history_backend=None, history_options=None, **planner_kwargs):
+        # Initialize the enhanced trip planner (planner_kwargs such as transport are passed through)
+        self.trip_planner = EnhancedTripPlanner(**planner_kwargs)
         
         # Initialize Supabase client
         self.supabase = create_client(supabase_url, supabase_key)
         
+        # Query history is written behind the request path in bulk inserts;
+        # pass InMemoryHistoryBackend() as history_backend for local testing
+        self.history = WriteBehindQueue(
+            history_backend or SupabaseHistoryBackend(self.supabase),
+            table='query_history',
+            **(history_options or {})
+        )
+        
+    def _history_record(self, user_id, query, response, timestamp=None):
+        return {
+            'user_id': user_id,
+            'query': query,
+            'response': response,
+            'timestamp': timestamp or datetime.now().isoformat()
+        }
+        
     def handle_user_query(self, user_id, query):
         """Process a user query and store the interaction in Supabase"""
         # Process the query with the AI
         response = self.trip_planner.process_query(query)
         
-        # Store the query and response in Supabase
-        try:
-            self.supabase.table('query_history').insert({
-                'user_id': user_id,
-                'query': query,
-                'response': response,
-                'timestamp': datetime.now().isoformat()
-            }).execute()
-            logger.info(f"Stored query history for user {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to store query history: {e}")
+        # Queue the query and response for the background history writer
+        self.history.put(self._history_record(user_id, query, response))
         
         return response
+    
+    def handle_user_queries(self, user_id, queries, workers=8):
+        """Process a batch of queries for a user and queue the interactions for storage"""
+        queries = list(queries)
+        responses = self.trip_planner.process_queries(queries, workers=workers)
+        
+        timestamp = datetime.now().isoformat()
+        self.history.put_many(
+            self._history_record(user_id, query, response, timestamp)
+            for query, response in zip(queries, responses)
+        )
+        
+        return responses
+        
+    def close(self):
+        """Drain pending query history and release planner resources"""
+        self.history.close()
+        self.trip_planner.close()
         
     def save_trip_plan(self, user_id, destination, itinerary):
         """Save a generated trip plan to Supabase"""